@@ -5,15 +5,24 @@ A股选股策略Web展示应用
 
 import os
 import json
+import time
 import datetime
-import akshare as ak
-from flask import Flask, render_template, jsonify, request
+from flask import Flask, Response, render_template, jsonify, request, g, stream_with_context
 import pandas as pd
 
+from background_jobs import SingleFlightRunner
+from data_provider import get_provider
+from result_cache import JsonFileCache
+from cache_utils import LRUCache, SingleFlight
+from async_fetch import AsyncFetcher
+from metrics import METRICS
+from profiling import PROFILE_CONFIG, install_request_profiler
+
 # 导入选股功能
 try:
     from run_daily import main as run_daily_selection
-    from run_daily import STRATEGY_PARAMS
+    from run_daily import (STRATEGY_PARAMS, get_stock_universe, scan, selection_row,
+                           build_selection, build_result)
     HAS_SELECTION = True
 except ImportError as e:
     print(f"导入选股模块失败: {e}")
@@ -22,9 +31,33 @@ except ImportError as e:
 
 app = Flask(__name__)
 
+# 按请求剖析（设置 STOCK_PROFILE_REQUESTS 或 --profile-requests 时生效）
+install_request_profiler(app)
+
 # 数据文件路径
 DATA_FILE = 'selected_stocks.json'
 CACHE_FILE = 'cache/selected_stocks_cache.json'
+INDICATOR_FILE = 'cache/selected_stocks_indicators.json'
+
+# 后台选股任务（同一时间只运行一次扫描）
+SELECTION_JOBS = SingleFlightRunner('选股扫描')
+
+# 选股结果的进程内缓存（文件变化时自动重新加载）
+RESULT_CACHE = JsonFileCache(CACHE_FILE)
+# 选中股票的指标快照（扫描时计算，详情页直接使用）
+INDICATOR_CACHE = JsonFileCache(INDICATOR_FILE)
+
+# 缓存过期时自动后台刷新的最小间隔（秒），避免选股失败时每个请求都重新触发
+AUTO_REFRESH_INTERVAL = 600
+
+# 扫描过程中增量写入结果文件的最小间隔（秒）
+STREAM_WRITE_INTERVAL = 2.0
+# 刷新事件流（SSE）没有新事件时推送进度的间隔（秒）
+SSE_POLL_SECONDS = 1.0
+
+# 详情页K线缓存：(股票代码, 日期) -> 最近60根K线，并发未命中时只下载一次
+KLINE_CACHE = LRUCache(maxsize=512)
+KLINE_LOADS = SingleFlight()
 
 def ensure_cache_dir():
     """确保缓存目录存在"""
@@ -35,28 +68,94 @@ def get_today_date():
     """获取今日日期字符串"""
     return datetime.datetime.now().strftime('%Y-%m-%d')
 
-def run_selection_and_save():
-    """运行选股并保存结果"""
+def save_result(result, partial=False):
+    """
+    保存选股结果（原子替换文件，并更新进程内缓存）；先写指标快照，
+    保证结果文件更新时对应的快照已经就绪
+
+    Parameters:
+    -----------
+    result : dict
+        run_daily.build_result 的结果（含 indicator_snapshot）
+    partial : bool
+        扫描尚未结束的部分结果，读取方据此继续显示扫描中
+
+    Returns:
+    --------
+    dict : 写入结果文件的内容（不含指标快照）
+    """
+    result = dict(result)
+    snapshots = result.pop('indicator_snapshot', {})
+    if partial:
+        result['partial'] = True
+    with METRICS.timer('write_json'):
+        INDICATOR_CACHE.put({'date': result['date'], 'stocks': snapshots})
+        RESULT_CACHE.put(result)
+    return result
+
+
+def stream_selection(progress):
+    """
+    流式选股：每只股票筛选完成后立即处理，入选股票通过任务事件推送给浏览器（SSE），
+    并按 STREAM_WRITE_INTERVAL 增量写入结果文件（标记 partial）
+
+    Returns:
+    --------
+    dict : 与 run_daily.main(return_data=True) 相同格式的结果（按原股票池顺序），没有股票池时返回None
+    """
+    progress(stage='获取股票池')
+    stock_list, codes = get_stock_universe()
+    if not stock_list:
+        return None
+    entries = {}
+    for stock in stock_list:
+        entries.setdefault(stock['code'], []).append(stock)
+
+    scanned = {}
+    rows, snapshots = [], {}
+    last_write = time.monotonic()
+    for symbol, is_selected, reason, price, indicators in scan(codes, progress):
+        scanned[symbol] = (is_selected, reason, price, indicators)
+        if not is_selected:
+            continue
+        snapshots[symbol] = indicators
+        for stock in entries[symbol]:
+            row = selection_row(stock, stock['sector'], reason, price)
+            rows.append(row)
+            progress(event=('stock', row))
+        if time.monotonic() - last_write >= STREAM_WRITE_INTERVAL:
+            save_result(build_result(list(rows), dict(snapshots)), partial=True)
+            last_write = time.monotonic()
+
+    selected_stocks, snapshots = build_selection(stock_list, scanned)
+    return build_result(selected_stocks, snapshots)
+
+
+def run_selection_and_save(progress=None):
+    """运行选股并保存结果，progress 为可选的进度回调（入选股票同时以 event=('stock', 记录) 推送）"""
     if not HAS_SELECTION:
         print("警告：选股模块不可用")
         return None
 
     print("正在运行选股策略...")
+    if progress is None:
+        progress = lambda **kwargs: None
 
     try:
-        # 调用选股函数获取真实数据
-        result = run_daily_selection(return_data=True)
+        # 边扫描边保存，页面在扫描结束前就能看到已入选的股票
+        result = stream_selection(progress)
 
         if result is None:
             print("选股返回空结果")
             return None
 
         print(f"选股完成，共选中 {len(result['stocks'])} 只股票")
+        snapshots = result['indicator_snapshot']
+        result = save_result(result)
 
-        # 保存到缓存
-        ensure_cache_dir()
-        with open(CACHE_FILE, 'w', encoding='utf-8') as f:
-            json.dump(result, f, ensure_ascii=False, indent=2)
+        # 没有指标快照的股票预热K线缓存，用户打开详情页时不再等待下载
+        prewarm_kline_cache([stock['代码'] for stock in result['stocks'] if stock['代码'] not in snapshots],
+                            progress=progress)
 
         return result
 
@@ -65,36 +164,56 @@ def run_selection_and_save():
         return None
 
 
+def start_background_refresh():
+    """缓存过期时在后台启动选股任务（已在运行或刚运行过时不重复启动）"""
+    job = SELECTION_JOBS.get()
+    if job is not None and (SELECTION_JOBS.is_running() or time.time() - job.created_at < AUTO_REFRESH_INTERVAL):
+        return job
+    print(f"缓存数据不是今天({get_today_date()})的，后台运行选股...")
+    job, _ = SELECTION_JOBS.submit(refresh_job)
+    return job
+
+
 def load_cached_data():
-    """加载缓存的数据"""
-    ensure_cache_dir()
-    if os.path.exists(CACHE_FILE):
-        try:
-            with open(CACHE_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                # 检查是否是今天的数据
-                if data.get('date') == get_today_date():
-                    return data
-                else:
-                    print(f"缓存数据日期不匹配: {data.get('date')} != {get_today_date()}")
-        except Exception as e:
-            print(f"加载缓存数据失败: {e}")
+    """
+    加载缓存的数据
 
-    # 如果没有缓存或不是今天的数据，运行选股
-    result = run_selection_and_save()
-    if result is None:
-        # 如果选股失败，返回空结果而不是模拟数据
-        return {
-            'date': get_today_date(),
-            'stocks': [],
-            'stats': {
-                'total': 0,
-                'by_sector': {},
-                'by_trend': {'强': 0, '弱': 0}
-            },
-            'strategy_params': STRATEGY_PARAMS if HAS_SELECTION else {}
-        }
-    return result
+    文件未变化时直接返回进程内缓存的字典；没有缓存、不是今天的数据或是扫描中途的部分结果时，
+    在后台启动选股并先返回已有数据（标记 stale），读取接口不会阻塞等待选股
+    """
+    data = RESULT_CACHE.get()
+    if data is not None and data.get('date') == get_today_date() and not data.get('partial'):
+        return data
+
+    start_background_refresh()
+    if data is not None:
+        return dict(data, stale=True)
+
+    # 还没有任何结果时返回空结果而不是模拟数据
+    return {
+        'date': get_today_date(),
+        'stocks': [],
+        'stats': {
+            'total': 0,
+            'by_sector': {},
+            'by_trend': {'强': 0, '弱': 0}
+        },
+        'strategy_params': STRATEGY_PARAMS if HAS_SELECTION else {},
+        'stale': True
+    }
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_time(response):
+    """按接口记录请求耗时和状态码"""
+    start = g.pop('request_start', None)
+    if start is not None and request.endpoint not in (None, 'static'):
+        METRICS.observe(f'http.{request.endpoint}', time.perf_counter() - start)
+        METRICS.inc(f'http.status.{response.status_code}')
+    return response
 
 @app.route('/')
 def index():
@@ -107,15 +226,71 @@ def get_stocks():
     data = load_cached_data()
     return jsonify(data)
 
+def refresh_job(progress):
+    """后台刷新任务：选股失败时抛出异常，使任务状态为 failed"""
+    result = run_selection_and_save(progress=progress)
+    if result is None:
+        raise RuntimeError('选股失败，请查看服务端日志')
+    return result
+
 @app.route('/api/refresh', methods=['POST'])
 def refresh_data():
-    """刷新数据API"""
-    data = run_selection_and_save()
+    """刷新数据API：在后台启动选股任务并立即返回任务ID，已有任务在运行时返回该任务"""
+    job, created = SELECTION_JOBS.submit(refresh_job)
     return jsonify({
         'success': True,
-        'message': '数据刷新成功',
-        'data': data
-    })
+        'message': '刷新任务已开始' if created else '刷新任务正在进行中',
+        'job': job.to_dict()
+    }), 202
+
+@app.route('/api/refresh/status')
+@app.route('/api/refresh/status/<job_id>')
+def refresh_status(job_id=None):
+    """刷新任务进度API，不带任务ID时返回最近一次任务"""
+    job = SELECTION_JOBS.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': '任务不存在'}), 404
+    return jsonify({'success': True, 'job': job.to_dict()})
+
+def format_sse(kind, data):
+    """一条服务器推送事件（text/event-stream 格式）"""
+    return f"event: {kind}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.route('/api/refresh/stream')
+@app.route('/api/refresh/stream/<job_id>')
+def refresh_stream(job_id=None):
+    """
+    刷新任务的服务器推送事件流（SSE），不带任务ID时为最近一次任务：
+    - stock：一只入选股票的记录，扫描过程中逐只推送
+    - progress：任务进度（与 /api/refresh/status 相同）
+    - done：任务结束时的状态，随后关闭连接
+    """
+    job = SELECTION_JOBS.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': '任务不存在'}), 404
+
+    def events():
+        cursor = 0
+        last_progress = None
+        while True:
+            # 先判断是否结束再取事件，结束前发布的事件都会在 done 之前发出
+            finished = job.is_finished()
+            new_events = job.wait_events(cursor, timeout=SSE_POLL_SECONDS)
+            cursor += len(new_events)
+            for kind, data in new_events:
+                yield format_sse(kind, data)
+
+            state = job.to_dict()
+            if finished:
+                yield format_sse('done', state)
+                return
+            progress = (state['status'], state['stage'], state['done'], state['total'])
+            if progress != last_progress:
+                last_progress = progress
+                yield format_sse('progress', state)
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @app.route('/api/stats')
 def get_stats():
@@ -163,6 +338,11 @@ def filter_stocks():
         }
     })
 
+@app.route('/api/metrics')
+def get_metrics():
+    """运行指标API：选股各阶段耗时、下载计数和接口延迟"""
+    return jsonify(METRICS.snapshot())
+
 @app.route('/api/strategy')
 def get_strategy():
     """获取策略参数API"""
@@ -184,11 +364,11 @@ def get_stock_detail(stock_code):
         data = load_cached_data()
         stocks = data['stocks']
 
-        # 查找匹配的股票
+        # 查找匹配的股票（复制一份，下面会修改最新价，不能改动共享的缓存数据）
         stock_info = None
         for stock in stocks:
             if stock['代码'] == stock_code:
-                stock_info = stock
+                stock_info = dict(stock)
                 break
 
         if not stock_info:
@@ -197,11 +377,17 @@ def get_stock_detail(stock_code):
                 'message': f'未找到股票代码: {stock_code}'
             }), 404
 
-        # 获取股票历史数据（从akshare获取真实数据）
-        kline_data = get_stock_kline_data(stock_code)
+        # 优先使用扫描时保存的指标快照，不访问网络也不重新计算
+        snapshot = get_indicator_snapshot(stock_code, data.get('date'))
+        if snapshot is not None:
+            kline_data = snapshot['kline']
+            indicators = snapshot['indicators']
+        else:
+            # 获取股票历史数据（从数据源获取真实数据）
+            kline_data = get_stock_kline_data(stock_code)
 
-        # 计算技术指标
-        indicators = calculate_technical_indicators(kline_data)
+            # 计算技术指标
+            indicators = calculate_technical_indicators(kline_data)
 
         # 使用K线数据中的最新收盘价更新股票的最新价，确保数据一致性
         if kline_data and len(kline_data) > 0:
@@ -233,6 +419,13 @@ def get_stock_detail(stock_code):
             'message': f'获取股票数据失败: {str(e)}'
         }), 500
 
+def get_indicator_snapshot(stock_code, date):
+    """返回与选股结果同一天的指标快照，没有时返回None"""
+    snapshots = INDICATOR_CACHE.get()
+    if not snapshots or snapshots.get('date') != date:
+        return None
+    return snapshots['stocks'].get(stock_code)
+
 def add_market_prefix(stock_code):
     """为股票代码添加市场前缀"""
     if stock_code.startswith(('6', '5', '9')):
@@ -245,19 +438,50 @@ def add_market_prefix(stock_code):
         return stock_code
 
 def get_stock_kline_data(stock_code):
-    """获取股票K线数据（从akshare获取真实数据）"""
+    """获取股票K线数据（按日期缓存，同一只股票的并发请求只下载一次）"""
+    key = (stock_code, get_today_date())
+    data = KLINE_CACHE.get(key)
+    if data is not None:
+        return data
+
+    def load():
+        data = fetch_stock_kline_data(stock_code)
+        # 下载失败（空列表）不缓存，下次请求重试
+        if data:
+            KLINE_CACHE.put(key, data)
+        return data
+
+    return KLINE_LOADS.do(key, load)
+
+
+def prewarm_kline_cache(stock_codes, progress=None):
+    """并发预热一批股票的K线缓存"""
+    if not stock_codes:
+        return
+    if progress is not None:
+        progress(stage='预热K线', done=0, total=len(stock_codes))
+
+    with AsyncFetcher(get_stock_kline_data, concurrency=4, requests_per_second=5, max_retries=1) as fetcher:
+        for done, _ in enumerate(fetcher.run(stock_codes), 1):
+            if progress is not None:
+                progress(done=done)
+    print(f"K线缓存预热完成: {len(stock_codes)} 只股票")
+
+
+def fetch_stock_kline_data(stock_code):
+    """获取股票K线数据（从数据源获取，默认为akshare）"""
     try:
         # 为股票代码添加市场前缀
         market_code = add_market_prefix(stock_code)
 
         print(f"正在获取股票 {stock_code} ({market_code}) 的K线数据...")
 
-        # 使用akshare获取股票历史数据
+        # 通过数据源获取股票历史数据
         # 获取最近60个交易日的数据
-        df = ak.stock_zh_a_daily(
-            symbol=market_code,
-            start_date="20240101",  # 从2024年1月1日开始
-            end_date=datetime.datetime.now().strftime("%Y%m%d"),
+        df = get_provider().stock_daily(
+            market_code,
+            "20240101",  # 从2024年1月1日开始
+            datetime.datetime.now().strftime("%Y%m%d"),
             adjust="qfq"  # 前复权
         )
 
@@ -374,7 +598,11 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='A股选股策略Web应用')
     parser.add_argument('--port', type=int, default=5000, help='端口号 (默认: 5000)')
     parser.add_argument('--host', type=str, default='0.0.0.0', help='主机地址 (默认: 0.0.0.0)')
+    parser.add_argument('--profile-requests', type=str, default=None,
+                        help='剖析路径以该前缀开头的请求，all 为全部请求 (例如: /api/stock)')
     args = parser.parse_args()
+    if args.profile_requests:
+        PROFILE_CONFIG['requests'] = args.profile_requests
 
     # 确保缓存目录存在
     ensure_cache_dir()
@@ -0,0 +1,258 @@
+"""
+基于 asyncio 的并发数据获取
+AsyncFetcher 在事件循环中并发执行获取任务：
+- 信号量限制同时进行的请求数，可选令牌桶限制每秒请求数
+- 失败时按 fetch_pool.is_retryable_error 判断是否重试（网络类错误），指数退避
+- 所有请求共用一个带连接池的 requests.Session，保持长连接；获取任务中 akshare 内部的
+  requests.get/post 也通过这个会话发出（见 shared_session，只作用于执行任务的工作线程），
+  不再每次请求新建连接
+
+数据源接口（akshare）是同步的，事件循环把它们放到与并发数相同大小的线程池中执行。
+同步调用方使用 run()/map()，不需要关心事件循环：
+    fetcher = AsyncFetcher(SECTOR_CACHE.get_constituents)
+    for sector_name, df in fetcher.map(sector_names):
+        ...
+"""
+
+import queue
+import asyncio
+import threading
+import functools
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import requests.api
+from requests.adapters import HTTPAdapter
+
+from fetch_pool import TokenBucket, is_retryable_error
+
+# 并发获取参数
+ASYNC_FETCH_CONFIG = {
+    'concurrency': 8,              # 同时进行的请求数（也是连接池大小）
+    'requests_per_second': None,   # 每秒最多请求数（包括重试），None 为不限速
+    'max_retries': 2,              # 每个任务最多尝试次数
+    'backoff': 0.3,                # 重试退避基数（秒）
+    'timeout': 15,                 # 直接发出的HTTP请求超时（秒）
+}
+
+# shared_session 的嵌套计数与被替换的 requests.api.request
+_patch_lock = threading.Lock()
+_patch_state = {'depth': 0, 'original': requests.api.request}
+# 每个线程绑定的会话（shared_session 期间）
+_local = threading.local()
+
+# run() 中结束的标记
+_DONE = object()
+
+
+def create_session(pool_size):
+    """创建带连接池的会话（连接保持，最多 pool_size 个空闲连接）"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def _thread_request(method, url, **kwargs):
+    """替换后的 requests.api.request：当前线程绑定了会话时通过会话发出，否则使用原函数"""
+    session = getattr(_local, 'session', None)
+    if session is None:
+        return _patch_state['original'](method, url, **kwargs)
+    return session.request(method=method, url=url, **kwargs)
+
+
+@contextlib.contextmanager
+def shared_session(session):
+    """
+    期间当前线程中模块级的 requests.get/post 等函数（akshare 的调用方式）通过 session 发出，复用其连接池
+
+    只作用于进入的线程（requests.Session 不是线程安全的），其他线程（如 Flask 的请求线程）
+    仍使用原函数。可以嵌套，内层的会话优先；所有线程都退出后恢复原函数
+    """
+    with _patch_lock:
+        if _patch_state['depth'] == 0 and requests.api.request is not _thread_request:
+            _patch_state['original'] = requests.api.request
+            requests.api.request = _thread_request
+        _patch_state['depth'] += 1
+    previous = getattr(_local, 'session', None)
+    _local.session = session
+    try:
+        yield session
+    finally:
+        _local.session = previous
+        with _patch_lock:
+            _patch_state['depth'] -= 1
+            if _patch_state['depth'] == 0:
+                requests.api.request = _patch_state['original']
+
+
+class AsyncFetcher:
+    """在事件循环中并发获取数据，带重试和共享连接池"""
+
+    def __init__(self, fetch_func=None, concurrency=None, requests_per_second=None, max_retries=None,
+                 backoff=None, retry_on_none=True, is_retryable=is_retryable_error, timeout=None):
+        """
+        Parameters:
+        -----------
+        fetch_func : callable
+            fetch_func(item) -> 结果（同步函数），返回None或抛出异常视为失败；
+            默认把 item 当作URL，通过共享会话 GET 并返回响应文本
+        concurrency : int
+            同时进行的请求数，默认 ASYNC_FETCH_CONFIG['concurrency']
+        requests_per_second : float
+            每秒最多请求数，默认 ASYNC_FETCH_CONFIG['requests_per_second']
+        max_retries : int
+            每个任务最多尝试的次数
+        backoff : float
+            退避基数（秒），第n次重试前等待 backoff * 2**(n-1)
+        retry_on_none : bool
+            返回None时是否重试
+        is_retryable : callable
+            is_retryable(exception) -> bool，判断异常是否重试
+        timeout : float
+            默认 fetch_func 的HTTP超时（秒）
+        """
+        config = ASYNC_FETCH_CONFIG
+        self.fetch_func = fetch_func or self.get_text
+        self.concurrency = concurrency or config['concurrency']
+        requests_per_second = requests_per_second or config['requests_per_second']
+        self.bucket = TokenBucket(requests_per_second) if requests_per_second else None
+        self.max_retries = max(1, max_retries if max_retries is not None else config['max_retries'])
+        self.backoff = config['backoff'] if backoff is None else backoff
+        self.retry_on_none = retry_on_none
+        self.is_retryable = is_retryable
+        self.timeout = timeout or config['timeout']
+        self.session = create_session(self.concurrency)
+
+        self.stats = {'requests': 0, 'retries': 0, 'failures': 0}
+        self.errors = {}       # {item: 最后一次的异常}，只记录失败的任务
+        self._semaphore = None
+        self._executor = None
+
+    def get_text(self, url, params=None):
+        """通过共享会话发出GET请求，返回响应文本（HTTP错误状态抛出 HTTPError）"""
+        response = self.session.get(url, params=params, timeout=self.timeout)
+        response.raise_for_status()
+        return response.text
+
+    async def _throttle(self):
+        if self.bucket is None:
+            return
+        while True:
+            wait = self.bucket.try_acquire()
+            if wait == 0:
+                return
+            await asyncio.sleep(wait)
+
+    async def call(self, func, *args):
+        """
+        在线程池中执行 func(*args)，失败时按退避策略重试
+
+        Returns:
+        --------
+        tuple : (结果, 异常)，成功时异常为None，失败时结果为None
+        """
+        loop = asyncio.get_running_loop()
+        error = None
+        for attempt in range(self.max_retries):
+            if attempt > 0:
+                self.stats['retries'] += 1
+                await asyncio.sleep(self.backoff * 2 ** (attempt - 1))
+
+            await self._throttle()
+            self.stats['requests'] += 1
+            try:
+                async with self._semaphore:
+                    result = await loop.run_in_executor(self._executor,
+                                                        functools.partial(self._in_session, func, *args))
+            except Exception as e:
+                error = e
+                if self.is_retryable(e):
+                    continue
+                break
+
+            if result is not None or not self.retry_on_none:
+                return result, None
+            error = None
+
+        self.stats['failures'] += 1
+        return None, error
+
+    def _in_session(self, func, *args):
+        """在工作线程中执行 func，期间该线程模块级的 requests 调用通过本获取器的会话发出"""
+        with shared_session(self.session):
+            return func(*args)
+
+    async def fetch(self, item):
+        """获取单个任务，返回 (item, 结果)，失败时结果为None"""
+        result, error = await self.call(self.fetch_func, item)
+        if error is not None:
+            self.errors[item] = error
+        return item, result
+
+    async def _run_all(self, items, emit):
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        tasks = [asyncio.ensure_future(self.fetch(item)) for item in items]
+        for task in asyncio.as_completed(tasks):
+            emit(await task)
+
+    def _run_in_thread(self, items, results):
+        """在独立线程的事件循环中执行全部任务（调用方线程中是否已有事件循环都可以使用）"""
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                self._executor = executor
+                asyncio.run(self._run_all(items, results.put))
+        except BaseException as e:
+            results.put(e)
+        finally:
+            self._executor = None
+            results.put(_DONE)
+
+    def run(self, items):
+        """
+        并发获取所有任务（同步接口）
+
+        Parameters:
+        -----------
+        items : iterable
+            任务参数列表，每个元素传给 fetch_func
+
+        Yields:
+        -------
+        tuple : (item, result)，按完成顺序产出，失败时result为None（异常见 self.errors）
+        """
+        items = list(items)
+        results = queue.Queue()
+        thread = threading.Thread(target=self._run_in_thread, args=(items, results), daemon=True)
+        thread.start()
+        while True:
+            value = results.get()
+            if value is _DONE:
+                break
+            if isinstance(value, BaseException):
+                raise value
+            yield value
+        thread.join()
+
+    def map(self, items):
+        """
+        并发获取所有任务，按 items 的顺序返回
+
+        Returns:
+        --------
+        list : [(item, result)]，失败时result为None
+        """
+        items = list(items)
+        done = dict(self.run(items))
+        return [(item, done.get(item)) for item in items]
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
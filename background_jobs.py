@@ -0,0 +1,175 @@
+"""
+后台任务
+在后台线程中运行耗时任务（如全量选股扫描），同一时间最多运行一个：
+任务运行期间重复提交直接返回正在运行的任务，调用方通过任务ID查询进度。
+任务还可以发布事件（如扫描中逐只入选的股票），订阅方用 wait_events 按序读取。
+"""
+
+import time
+import uuid
+import threading
+
+
+class Job:
+    """一次后台任务的状态和进度"""
+
+    def __init__(self, name):
+        self.id = uuid.uuid4().hex[:12]
+        self.name = name
+        self.status = 'pending'        # pending / running / done / failed
+        self.stage = ''
+        self.done = 0
+        self.total = 0
+        self.error = None
+        self.result = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._stage_started_at = None
+        self.events = []
+        self._events_changed = threading.Condition()
+
+    def update(self, stage=None, done=None, total=None, event=None):
+        """
+        进度回调，由任务函数调用
+
+        Parameters:
+        -----------
+        stage : str
+            当前阶段说明，切换阶段时重新计算预计剩余时间
+        done, total : int
+            当前阶段已完成/总数量
+        event : tuple
+            可选的 (事件类型, 数据)，发布给订阅方
+        """
+        if stage is not None and stage != self.stage:
+            self.stage = stage
+            self._stage_started_at = time.time()
+            self.done, self.total = 0, 0
+        if done is not None:
+            self.done = done
+        if total is not None:
+            self.total = total
+        if event is not None:
+            self.publish(*event)
+
+    def publish(self, kind, data):
+        """发布一个事件"""
+        with self._events_changed:
+            self.events.append((kind, data))
+            self._events_changed.notify_all()
+
+    def is_finished(self):
+        return self.status in ('done', 'failed')
+
+    def wait_events(self, cursor, timeout=None):
+        """
+        返回第 cursor 个之后的事件；没有新事件且任务未结束时最多等待 timeout 秒
+
+        Returns:
+        --------
+        list : [(事件类型, 数据)]，可能为空
+        """
+        with self._events_changed:
+            if len(self.events) <= cursor and not self.is_finished():
+                self._events_changed.wait(timeout)
+            return self.events[cursor:]
+
+    def _wake(self):
+        """任务结束时唤醒等待事件的订阅方"""
+        with self._events_changed:
+            self._events_changed.notify_all()
+
+    def eta_seconds(self):
+        """按当前阶段的平均速度估算剩余秒数，无法估算时返回None"""
+        if self.status != 'running' or not self.total or not self.done or self._stage_started_at is None:
+            return None
+        elapsed = time.time() - self._stage_started_at
+        return round(elapsed / self.done * (self.total - self.done), 1)
+
+    def to_dict(self):
+        """转换为可JSON序列化的状态字典（不含任务结果）"""
+        end = self.finished_at or time.time()
+        return {
+            'job_id': self.id,
+            'name': self.name,
+            'status': self.status,
+            'stage': self.stage,
+            'done': self.done,
+            'total': self.total,
+            'eta_seconds': self.eta_seconds(),
+            'elapsed_seconds': round(end - self.started_at, 1) if self.started_at else 0,
+            'error': self.error
+        }
+
+
+class SingleFlightRunner:
+    """单飞任务执行器：同一时间只运行一个任务，保留最近的若干个任务记录"""
+
+    def __init__(self, name, history_size=20):
+        """
+        Parameters:
+        -----------
+        name : str
+            任务名称（用于日志和状态显示）
+        history_size : int
+            保留的已结束任务数量
+        """
+        self.name = name
+        self.history_size = history_size
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._current = None
+
+    def submit(self, func):
+        """
+        提交任务：有任务在运行时不再启动新任务
+
+        Parameters:
+        -----------
+        func : callable
+            func(progress) -> result，progress 为 Job.update
+
+        Returns:
+        --------
+        tuple : (job, created)，created 为 False 表示返回的是正在运行的任务
+        """
+        with self._lock:
+            if self._current is not None and self._current.status in ('pending', 'running'):
+                return self._current, False
+
+            job = Job(self.name)
+            self._jobs[job.id] = job
+            self._current = job
+            # 只保留最近的任务记录
+            for old_id in list(self._jobs)[:-self.history_size]:
+                del self._jobs[old_id]
+
+        thread = threading.Thread(target=self._run, args=(job, func), name=f"{self.name}-{job.id}", daemon=True)
+        thread.start()
+        return job, True
+
+    def _run(self, job, func):
+        job.status = 'running'
+        job.started_at = time.time()
+        try:
+            job.result = func(job.update)
+            job.status = 'done'
+        except Exception as e:
+            print(f"后台任务 {self.name} 失败: {e}")
+            job.error = str(e)
+            job.status = 'failed'
+        finally:
+            job.finished_at = time.time()
+            job._wake()
+
+    def get(self, job_id=None):
+        """按ID返回任务，job_id 为空时返回最近一次任务，不存在时返回None"""
+        with self._lock:
+            if job_id is None:
+                return self._current
+            return self._jobs.get(job_id)
+
+    def is_running(self):
+        job = self._current
+        return job is not None and job.status in ('pending', 'running')
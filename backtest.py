@@ -5,16 +5,18 @@
 
 import pandas as pd
 import numpy as np
-from datetime import datetime, timedelta
 import warnings
 warnings.filterwarnings('ignore')
 
+from backtest_history import PortfolioHistory, TradeLog, open_trade_writer, read_recent_trades, write_portfolio
+from trading_calendar import TradingCalendar
+
 
 class BacktestEngine:
     """回测引擎"""
 
     def __init__(self, initial_capital=1000000, stop_loss_pct=0.04, commission_rate=0.0003,
-                 rebalance_weekly=False, rebalance_day=0):
+                 rebalance_weekly=False, rebalance_day=0, max_position_pct=0.2, history_dir=None):
         """
         初始化回测引擎
 
@@ -30,17 +32,31 @@ class BacktestEngine:
             是否启用每周调仓
         rebalance_day : int
             调仓日（0=周一，1=周二，...，6=周日）
+        max_position_pct : float
+            单只股票最多占用当前资金的比例（默认20%）
+        history_dir : str
+            回测明细的写出目录（需要 pyarrow）；设置后交易记录分批写成 trades.parquet，
+            每日组合状态写成 portfolio.parquet，长回测的内存占用不随交易笔数增长。
+            此时结果中的 trade_history 为None，交易记录文件路径见 trades_path
         """
         self.initial_capital = initial_capital
         self.stop_loss_pct = stop_loss_pct
         self.commission_rate = commission_rate
         self.rebalance_weekly = rebalance_weekly
         self.rebalance_day = rebalance_day  # 0=Monday, 1=Tuesday, ..., 6=Sunday
+        self.max_position_pct = max_position_pct
+        self.history_dir = history_dir
 
         # 回测结果
         self.results = {}
-        self.portfolio_history = []
-        self.trade_history = []
+        self.portfolio_history = PortfolioHistory(0)
+        self.trade_history = TradeLog()
+
+    def _start_history(self, n_days):
+        """按交易日数预分配每日组合状态，创建交易记录缓冲区"""
+        self.portfolio_history = PortfolioHistory(n_days)
+        writer = open_trade_writer(self.history_dir) if self.history_dir else None
+        self.trade_history = TradeLog(writer=writer)
 
     def run_backtest(self, signals, price_data, start_date=None, end_date=None):
         """
@@ -73,13 +89,16 @@ class BacktestEngine:
         portfolio_value = capital
 
         # 获取所有交易日
-        all_dates = self._get_all_trading_dates(signals, price_data, start_date, end_date)
+        calendar = TradingCalendar.from_price_data(price_data, signals).between(start_date, end_date)
+        all_dates = calendar.dates
 
         print(f"回测期间: {all_dates[0]} 到 {all_dates[-1]}, 共{len(all_dates)}个交易日")
+        self._start_history(len(all_dates))
+        rebalance_days = self._rebalance_days(calendar)
 
         # 按日期循环
         for i, current_date in enumerate(all_dates):
-            date_str = current_date.strftime('%Y-%m-%d')
+            date_str = calendar.date_strs[i]
 
             # 1. 检查并更新持仓的最高价
             positions = self._update_positions_high(positions, price_data, current_date)
@@ -98,7 +117,7 @@ class BacktestEngine:
                 trades_today.extend(new_trades)
 
             # 4. 如果是调仓日，执行每周调仓
-            if self.rebalance_weekly and self._is_rebalance_day(current_date):
+            if rebalance_days[i]:
                 positions, capital, rebalance_trades = self._execute_weekly_rebalance(
                     positions, price_data, capital, current_date, date_str, signals.get(date_str, [])
                 )
@@ -120,38 +139,6 @@ class BacktestEngine:
         print("回测完成!")
         return self.results
 
-    def _get_all_trading_dates(self, signals, price_data, start_date, end_date):
-        """获取所有交易日"""
-        all_dates = set()
-
-        # 从信号中获取日期
-        for date_str in signals.keys():
-            try:
-                date = datetime.strptime(date_str, '%Y-%m-%d')
-                all_dates.add(date)
-            except:
-                pass
-
-        # 从价格数据中获取日期
-        for code, df in price_data.items():
-            if df is not None and not df.empty:
-                dates = df.index.tolist()
-                all_dates.update(dates)
-
-        # 转换为列表并排序
-        all_dates = sorted(list(all_dates))
-
-        # 应用日期范围过滤
-        if start_date:
-            start_dt = datetime.strptime(start_date, '%Y-%m-%d')
-            all_dates = [d for d in all_dates if d >= start_dt]
-
-        if end_date:
-            end_dt = datetime.strptime(end_date, '%Y-%m-%d')
-            all_dates = [d for d in all_dates if d <= end_dt]
-
-        return all_dates
-
     def _update_positions_high(self, positions, price_data, current_date):
         """更新持仓的最高价"""
         for code, pos in positions.items():
@@ -247,7 +234,7 @@ class BacktestEngine:
             allocation = capital / n_signals if n_signals > 0 else 0
 
             # 计算买入股数（取整百股）
-            buy_value = min(allocation, capital * 0.2)  # 单只股票最多占用20%资金
+            buy_value = min(allocation, capital * self.max_position_pct)  # 单只股票最多占用的资金
             shares = int(buy_value // (buy_price * 100)) * 100  # 整百股
 
             if shares <= 0:
@@ -293,10 +280,10 @@ class BacktestEngine:
 
         return positions, capital, trades_today
 
-    def _is_rebalance_day(self, date):
-        """检查是否是调仓日"""
+    def _rebalance_days(self, calendar):
+        """每个交易日是否为调仓日（布尔数组，未启用每周调仓时全为False）"""
         # 0=Monday, 1=Tuesday, ..., 6=Sunday
-        return date.weekday() == self.rebalance_day
+        return (calendar.weekday == self.rebalance_day) & bool(self.rebalance_weekly)
 
     def _execute_weekly_rebalance(self, positions, price_data, capital, current_date, date_str, today_signals):
         """执行每周调仓"""
@@ -375,29 +362,27 @@ class BacktestEngine:
     def _record_daily_status(self, date_str, positions, capital, portfolio_value, trades_today):
         """记录当日状态"""
         # 记录投资组合历史
-        daily_record = {
-            'date': date_str,
-            'cash': capital,
-            'positions_count': len(positions),
-            'portfolio_value': portfolio_value,
-            'return': (portfolio_value / self.initial_capital - 1) * 100
-        }
-        self.portfolio_history.append(daily_record)
+        self.portfolio_history.append(date_str, capital, len(positions), portfolio_value,
+                                      (portfolio_value / self.initial_capital - 1) * 100)
 
         # 记录交易历史
         self.trade_history.extend(trades_today)
 
     def _calculate_results(self, all_dates):
         """计算回测结果"""
-        if not self.portfolio_history:
+        if not len(self.portfolio_history):
             return
 
-        # 转换为DataFrame
-        portfolio_df = pd.DataFrame(self.portfolio_history)
-        portfolio_df['date'] = pd.to_datetime(portfolio_df['date'])
-        portfolio_df.set_index('date', inplace=True)
-
-        trades_df = pd.DataFrame(self.trade_history) if self.trade_history else pd.DataFrame()
+        # 转换为DataFrame（列式缓冲区直接构建，不经过字典列表）
+        # 交易记录写出到 Parquet 时不读回内存，只记录文件路径
+        portfolio_df = self.portfolio_history.to_frame()
+        if self.history_dir:
+            trades_df = None
+            trades_path = self.trade_history.finish()
+        else:
+            trades_df = self.trade_history.to_frame()
+        # 交易统计只用到少数几列，写出到 Parquet 时也始终保留在内存中
+        stats_df = self.trade_history.stats_frame()
 
         # 计算基本指标
         final_value = portfolio_df['portfolio_value'].iloc[-1]
@@ -420,9 +405,9 @@ class BacktestEngine:
         sharpe_ratio = (avg_daily_return - 3/252) / std_daily_return * np.sqrt(252) if std_daily_return > 0 else 0
 
         # 交易统计
-        if not trades_df.empty:
-            buy_trades = trades_df[trades_df['action'] == 'BUY']
-            sell_trades = trades_df[trades_df['action'] == 'SELL']
+        if not stats_df.empty:
+            buy_trades = stats_df[stats_df['action'] == 'BUY']
+            sell_trades = stats_df[stats_df['action'] == 'SELL']
 
             total_trades = len(buy_trades) + len(sell_trades)
             win_trades = sell_trades[sell_trades['pnl'] > 0]
@@ -455,6 +440,10 @@ class BacktestEngine:
             'portfolio_history': portfolio_df,
             'trade_history': trades_df
         }
+        if self.history_dir:
+            write_portfolio(self.history_dir, portfolio_df)
+            self.results['history_dir'] = self.history_dir
+            self.results['trades_path'] = trades_path
 
     def print_results(self):
         """打印回测结果"""
@@ -479,10 +468,15 @@ class BacktestEngine:
         print(f"平均亏损: {r['avg_loss_pct']:.2f}%")
         print(f"平均持仓天数: {r['avg_holding_days']:.1f}天")
 
-        # 打印最近10笔交易
-        if not r['trade_history'].empty:
-            print(f"\n最近10笔交易:")
+        # 打印最近10笔交易（写出到 Parquet 时只读取文件末尾）
+        if r['trade_history'] is not None:
             recent_trades = r['trade_history'].tail(10)
+        elif r.get('trades_path'):
+            recent_trades = read_recent_trades(r['trades_path'], 10)
+        else:
+            recent_trades = pd.DataFrame()
+        if not recent_trades.empty:
+            print(f"\n最近10笔交易:")
             for _, trade in recent_trades.iterrows():
                 action = "买入" if trade['action'] == 'BUY' else "卖出"
                 pnl_str = f"+{trade['pnl']:.2f}" if trade['pnl'] > 0 else f"{trade['pnl']:.2f}"
@@ -492,6 +486,296 @@ class BacktestEngine:
         print("="*60)
 
 
+class PriceMatrix:
+    """
+    按交易日对齐的收盘价矩阵
+
+    把 {code: DataFrame} 一次性对齐成 (交易日 × 股票) 的连续数组，
+    回测循环中用整数下标取价，代替逐日的 df.index 查找和 df.loc 取值。
+    """
+
+    def __init__(self, dates, codes, close, available):
+        """
+        Parameters:
+        -----------
+        dates : pd.DatetimeIndex
+            排好序的交易日（所有股票交易日的并集）
+        codes : list
+            股票代码，对应矩阵的列
+        close : np.ndarray
+            (交易日 × 股票) 的收盘价
+        available : np.ndarray
+            (交易日 × 股票) 的布尔矩阵，该股票当天是否有数据
+        """
+        self.dates = dates
+        self.codes = list(codes)
+        self.close = close
+        self.available = available
+        self.code_index = {code: j for j, code in enumerate(self.codes)}
+        self._calendar = None
+
+    @property
+    def calendar(self):
+        """矩阵行对应的交易日历，首次访问时构建，同一矩阵上的多次回测共用"""
+        if self._calendar is None:
+            self._calendar = TradingCalendar(self.dates.values)
+        return self._calendar
+
+    @classmethod
+    def from_price_data(cls, price_data):
+        """由价格数据字典 {code: pd.DataFrame} 构建价格矩阵"""
+        frames = [(code, df) for code, df in price_data.items() if df is not None and not df.empty]
+        if frames:
+            dates = pd.DatetimeIndex(np.unique(np.concatenate([df.index.values for _, df in frames])))
+        else:
+            dates = pd.DatetimeIndex([])
+
+        close = np.full((len(dates), len(frames)), np.nan)
+        available = np.zeros((len(dates), len(frames)), dtype=bool)
+        for j, (_, df) in enumerate(frames):
+            rows = dates.get_indexer(df.index)
+            close[rows, j] = df['close'].to_numpy(dtype=np.float64)
+            available[rows, j] = True
+
+        return cls(dates, [code for code, _ in frames], close, available)
+
+
+class ArrayBacktestEngine(BacktestEngine):
+    """
+    数组版回测引擎
+
+    交易规则与 BacktestEngine 完全相同，结果逐位一致；
+    价格预先对齐成 PriceMatrix，持仓保存在按买入顺序排列的并行数组中
+    （列号、股数、成本价、最高价、买入日序号），每日的最高价更新、止损判断
+    和市值计算都是数组运算。
+    """
+
+    def run_backtest(self, signals, price_data, start_date=None, end_date=None):
+        """
+        运行回测
+
+        Parameters:
+        -----------
+        signals : dict
+            信号字典，格式：{date: [{'code': '000001', 'name': '股票名'}, ...]}
+        price_data : dict 或 PriceMatrix
+            价格数据字典 {code: pd.DataFrame}，或预先构建好的价格矩阵
+        start_date : str
+            回测开始日期，格式：'YYYY-MM-DD'
+        end_date : str
+            回测结束日期，格式：'YYYY-MM-DD'
+
+        Returns:
+        --------
+        dict : 回测结果
+        """
+        print("开始回测...")
+        print(f"回测参数: 初始资金={self.initial_capital:,}元, 止损比例={self.stop_loss_pct*100}%")
+        if self.rebalance_weekly:
+            day_names = ['周一', '周二', '周三', '周四', '周五', '周六', '周日']
+            print(f"每周调仓: 启用 (调仓日: {day_names[self.rebalance_day]})")
+
+        matrix = price_data if isinstance(price_data, PriceMatrix) else PriceMatrix.from_price_data(price_data)
+
+        # 信号日期都是矩阵中的交易日时直接使用矩阵的日历，只按起止日期截取
+        calendar = matrix.calendar.union(signals).between(start_date, end_date)
+        all_dates = calendar.dates
+        print(f"回测期间: {all_dates[0]} 到 {all_dates[-1]}, 共{len(all_dates)}个交易日")
+        self._start_history(len(all_dates))
+
+        rows = matrix.calendar.ordinals(calendar.days)
+        days = calendar.days
+        date_strs = calendar.date_strs
+        rebalance_days = self._rebalance_days(calendar)
+        close = matrix.close
+        available = matrix.available
+        codes = matrix.codes
+
+        # 持仓：按买入顺序排列的并行数组，前 held 个有效
+        capacity = len(codes)
+        pos_col = np.zeros(capacity, dtype=np.int64)
+        shares = np.zeros(capacity, dtype=np.int64)
+        avg_price = np.zeros(capacity)
+        max_price = np.zeros(capacity)
+        buy_idx = np.zeros(capacity, dtype=np.int64)
+        held = 0
+        capital = self.initial_capital
+        portfolio_value = capital
+
+        for i in range(len(calendar)):
+            date_str = date_strs[i]
+            row = rows[i]
+            trades_today = []
+
+            if held and row >= 0:
+                cols = pos_col[:held]
+                prices = close[row, cols]
+                has_price = available[row, cols]
+
+                # 1. 更新持仓最高价
+                higher = has_price & (prices > max_price[:held])
+                max_price[:held][higher] = prices[higher]
+
+                # 2. 检查止损条件
+                drawdown = (max_price[:held] - prices) / max_price[:held]
+                stop = has_price & (drawdown >= self.stop_loss_pct)
+                if stop.any():
+                    for k in np.flatnonzero(stop):
+                        capital, trade = self._close_position(
+                            capital, date_str, codes[pos_col[k]], prices[k], shares[k], avg_price[k],
+                            f'止损（回撤{drawdown[k]*100:.1f}%≥{self.stop_loss_pct*100}%）',
+                            int(days[i] - days[buy_idx[k]])
+                        )
+                        trades_today.append(trade)
+
+                    keep = np.flatnonzero(~stop)
+                    for arr in (pos_col, shares, avg_price, max_price, buy_idx):
+                        arr[:len(keep)] = arr[keep]
+                    held = len(keep)
+
+            # 3. 执行买入信号（如果有）
+            if date_str in signals:
+                held, capital, new_trades = self._buy_into_arrays(
+                    signals[date_str], matrix, row, i, date_str, capital,
+                    held, pos_col, shares, avg_price, max_price, buy_idx
+                )
+                trades_today.extend(new_trades)
+
+            # 4. 如果是调仓日，执行每周调仓
+            if rebalance_days[i] and held:
+                print(f"  {date_str}: 执行每周调仓 (当前持仓{held}只股票)")
+                if row >= 0:
+                    cols = pos_col[:held]
+                    has_price = available[row, cols]
+                    for k in np.flatnonzero(has_price):
+                        capital, trade = self._close_position(
+                            capital, date_str, codes[pos_col[k]], close[row, pos_col[k]], shares[k], avg_price[k],
+                            '每周调仓', int(days[i] - days[buy_idx[k]])
+                        )
+                        trades_today.append(trade)
+                held = 0
+
+                today_signals = signals.get(date_str, [])
+                if today_signals:
+                    held, capital, new_trades = self._buy_into_arrays(
+                        today_signals, matrix, row, i, date_str, capital,
+                        held, pos_col, shares, avg_price, max_price, buy_idx
+                    )
+                    trades_today.extend(new_trades)
+                    print(f"    重新买入{len(new_trades)}只股票")
+
+            # 5. 计算当日持仓市值（按买入顺序依次累加，与逐只累加的结果一致）
+            portfolio_value = capital
+            if held and row >= 0:
+                cols = pos_col[:held]
+                market_values = (close[row, cols] * shares[:held])[available[row, cols]]
+                if len(market_values):
+                    portfolio_value = np.cumsum(np.concatenate(([capital], market_values)))[-1]
+
+            # 6. 记录当日状态（只用到持仓数量）
+            self._record_daily_status(date_str, range(held), capital, portfolio_value, trades_today)
+
+            # 显示进度
+            if (i + 1) % 50 == 0 or i == len(all_dates) - 1:
+                print(f"进度: {i+1}/{len(all_dates)} ({date_str}), 组合价值: {portfolio_value:,.2f}元")
+
+        # 计算回测结果
+        self._calculate_results(all_dates)
+
+        print("回测完成!")
+        return self.results
+
+    def _close_position(self, capital, date_str, code, price, n_shares, avg_price, reason, holding_days):
+        """卖出一只持仓，返回更新后的资金和交易记录"""
+        n_shares = int(n_shares)
+        sell_value = price * n_shares
+        commission = sell_value * self.commission_rate
+        net_proceeds = sell_value - commission
+        capital += net_proceeds
+
+        cost = avg_price * n_shares
+        buy_commission = cost * self.commission_rate
+        total_cost = cost + buy_commission
+        pnl = net_proceeds - total_cost
+        pnl_pct = pnl / total_cost if total_cost > 0 else 0
+
+        trade = {
+            'date': date_str,
+            'code': code,
+            'action': 'SELL',
+            'reason': reason,
+            'price': price,
+            'shares': n_shares,
+            'amount': sell_value,
+            'commission': commission,
+            'pnl': pnl,
+            'pnl_pct': pnl_pct,
+            'holding_days': holding_days
+        }
+        return capital, trade
+
+    def _buy_into_arrays(self, buy_signals, matrix, row, date_idx, date_str, capital,
+                         held, pos_col, shares, avg_price, max_price, buy_idx):
+        """执行买入信号，新持仓追加到持仓数组末尾"""
+        trades_today = []
+        if row < 0:
+            return held, capital, trades_today
+
+        held_cols = set(pos_col[:held].tolist())
+        n_signals = len(buy_signals)
+
+        for signal in buy_signals:
+            code = signal['code']
+            name = signal.get('name', '未知')
+
+            col = matrix.code_index.get(code)
+            if col is None or col in held_cols:
+                continue
+            if not matrix.available[row, col]:
+                continue
+
+            buy_price = matrix.close[row, col]
+
+            allocation = capital / n_signals if n_signals > 0 else 0
+            buy_value = min(allocation, capital * self.max_position_pct)  # 单只股票最多占用的资金
+            n_shares = int(buy_value // (buy_price * 100)) * 100  # 整百股
+            if n_shares <= 0:
+                continue
+
+            cost = buy_price * n_shares
+            commission = cost * self.commission_rate
+            total_cost = cost + commission
+            if total_cost > capital:
+                continue
+
+            capital -= total_cost
+
+            pos_col[held] = col
+            shares[held] = n_shares
+            avg_price[held] = buy_price
+            max_price[held] = buy_price
+            buy_idx[held] = date_idx
+            held += 1
+            held_cols.add(col)
+
+            trades_today.append({
+                'date': date_str,
+                'code': code,
+                'name': name,
+                'action': 'BUY',
+                'reason': '选股信号',
+                'price': buy_price,
+                'shares': n_shares,
+                'amount': cost,
+                'commission': commission,
+                'pnl': 0,
+                'pnl_pct': 0,
+                'holding_days': 0
+            })
+
+        return held, capital, trades_today
+
+
 def prepare_backtest_data(selected_stocks_history, start_date='2023-01-01', end_date=None):
     """
     准备回测数据
@@ -0,0 +1,290 @@
+"""
+回测明细的列式缓冲区
+BacktestEngine 的每日组合状态和交易记录不再逐条保存为字典列表，而是写入预分配的列数组：
+- PortfolioHistory：交易日数已知，按天数一次分配
+- TradeLog：按需倍增扩容；指定 Parquet 写出器时每满一批就写出并清空，内存占用与回测长度无关，
+  回测结果中只记录文件路径（results['trades_path']），不再把全部交易读回内存
+
+Parquet 写出需要安装 pyarrow（可选依赖），未安装时只能使用内存中的缓冲区。
+"""
+
+import os
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    HAS_PYARROW = True
+except ImportError:
+    pa = None
+    pq = None
+    HAS_PYARROW = False
+
+# 交易记录的列与类型（与原先由字典列表构建的 DataFrame 列顺序相同）
+TRADE_COLUMNS = [
+    ('date', object),
+    ('code', object),
+    ('name', object),
+    ('action', object),
+    ('reason', object),
+    ('price', np.float64),
+    ('shares', np.int64),
+    ('amount', np.float64),
+    ('commission', np.float64),
+    ('pnl', np.float64),
+    ('pnl_pct', np.float64),
+    ('holding_days', np.int64),
+]
+
+# 计算回测统计所需的列（始终保留在内存中，每笔交易只占几十字节）
+TRADE_STAT_COLUMNS = ['action', 'pnl', 'pnl_pct', 'holding_days']
+
+# 流式写出时每批交易记录的行数
+TRADE_CHUNK_ROWS = 10000
+
+# 写出的文件名
+PORTFOLIO_FILE = 'portfolio.parquet'
+TRADES_FILE = 'trades.parquet'
+
+
+def _require_pyarrow():
+    if not HAS_PYARROW:
+        raise ImportError("写出 Parquet 需要安装 pyarrow: pip install pyarrow")
+
+
+class PortfolioHistory:
+    """每日组合状态（现金、持仓数量、组合价值、累计收益率），按交易日数预分配"""
+
+    def __init__(self, capacity):
+        """
+        Parameters:
+        -----------
+        capacity : int
+            交易日数
+        """
+        self.n = 0
+        self.date = np.empty(capacity, dtype=object)
+        self.cash = np.empty(capacity, dtype=np.float64)
+        self.positions_count = np.empty(capacity, dtype=np.int64)
+        self.portfolio_value = np.empty(capacity, dtype=np.float64)
+        self.returns = np.empty(capacity, dtype=np.float64)
+
+    def __len__(self):
+        return self.n
+
+    def append(self, date_str, cash, positions_count, portfolio_value, return_pct):
+        i = self.n
+        if i == len(self.date):
+            self._grow()
+        self.date[i] = date_str
+        self.cash[i] = cash
+        self.positions_count[i] = positions_count
+        self.portfolio_value[i] = portfolio_value
+        self.returns[i] = return_pct
+        self.n = i + 1
+
+    def _grow(self):
+        capacity = max(2 * len(self.date), 16)
+        for name in ('date', 'cash', 'positions_count', 'portfolio_value', 'returns'):
+            old = getattr(self, name)
+            new = np.empty(capacity, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def to_frame(self):
+        """以日期为索引的 DataFrame（cash/positions_count/portfolio_value/return 列）"""
+        n = self.n
+        return pd.DataFrame({
+            'cash': self.cash[:n].copy(),
+            'positions_count': self.positions_count[:n].copy(),
+            'portfolio_value': self.portfolio_value[:n].copy(),
+            'return': self.returns[:n].copy(),
+        }, index=pd.DatetimeIndex(pd.to_datetime(self.date[:n]), name='date'))
+
+
+class TradeLog:
+    """交易记录的列式缓冲区，可选地分批写出到 Parquet"""
+
+    def __init__(self, capacity=256, writer=None, chunk_rows=None):
+        """
+        Parameters:
+        -----------
+        capacity : int
+            初始容量（不足时倍增）
+        writer : ParquetTableWriter
+            写出器；为None时全部保留在内存中
+        chunk_rows : int
+            有写出器时每批写出的行数，默认 TRADE_CHUNK_ROWS
+        """
+        self.writer = writer
+        self.chunk_rows = chunk_rows or TRADE_CHUNK_ROWS
+        self.n = 0          # 缓冲区中的行数
+        self.total = 0      # 累计交易笔数（含已写出的）
+        self.columns = {name: self._empty(dtype, max(capacity, 1)) for name, dtype in TRADE_COLUMNS}
+        self.stats = {name: self._empty(dict(TRADE_COLUMNS)[name], max(capacity, 1)) for name in TRADE_STAT_COLUMNS}
+        self.n_stats = 0
+
+    @staticmethod
+    def _empty(dtype, capacity):
+        if np.dtype(dtype) == object:
+            return np.full(capacity, np.nan, dtype=object)
+        return np.zeros(capacity, dtype=dtype)
+
+    @staticmethod
+    def _grow(arrays):
+        """所有列的容量翻倍"""
+        for name, old in arrays.items():
+            new = TradeLog._empty(old.dtype, 2 * len(old))
+            new[:len(old)] = old
+            arrays[name] = new
+
+    def __len__(self):
+        return self.total
+
+    def append(self, trade):
+        """追加一笔交易（字典，缺少的列为 NaN）"""
+        if self.n == len(self.columns['date']):
+            self._grow(self.columns)
+        if self.n_stats == len(self.stats['action']):
+            self._grow(self.stats)
+
+        i = self.n
+        for name, _ in TRADE_COLUMNS:
+            if name in trade:
+                self.columns[name][i] = trade[name]
+        j = self.n_stats
+        for name in TRADE_STAT_COLUMNS:
+            self.stats[name][j] = trade[name]
+        self.n = i + 1
+        self.n_stats = j + 1
+        self.total += 1
+
+        if self.writer is not None and self.n >= self.chunk_rows:
+            self.flush()
+
+    def extend(self, trades):
+        for trade in trades:
+            self.append(trade)
+
+    def _buffer_frame(self):
+        n = self.n
+        return pd.DataFrame({name: self.columns[name][:n].copy() for name, _ in TRADE_COLUMNS})
+
+    def flush(self):
+        """把缓冲区中的交易写出并清空（没有写出器时不做任何事）"""
+        if self.writer is None or self.n == 0:
+            return
+        self.writer.write(self._buffer_frame())
+        for name, dtype in TRADE_COLUMNS:
+            self.columns[name][:self.n] = np.nan if np.dtype(dtype) == object else 0
+        self.n = 0
+
+    def stats_frame(self):
+        """计算统计用的 action/pnl/pnl_pct/holding_days 列"""
+        n = self.n_stats
+        return pd.DataFrame({name: self.stats[name][:n].copy() for name in TRADE_STAT_COLUMNS})
+
+    def finish(self):
+        """
+        写出剩余的缓冲区并关闭写出器
+
+        Returns:
+        --------
+        str : 交易记录文件路径，没有写出器或没有交易时为None
+        """
+        if self.writer is None:
+            return None
+        self.flush()
+        self.writer.close()
+        return self.writer.path if self.total else None
+
+    def to_frame(self):
+        """
+        全部交易记录；没有交易时返回空 DataFrame
+
+        有写出器时先写出剩余的缓冲区，再从 Parquet 文件读回（整个文件载入内存）
+        """
+        if self.total == 0:
+            return pd.DataFrame()
+        if self.writer is None:
+            return self._buffer_frame()
+        return read_trades(self.finish())
+
+
+def _trade_schema():
+    types = {object: pa.string(), np.float64: pa.float64(), np.int64: pa.int64()}
+    return pa.schema([(name, types[dtype]) for name, dtype in TRADE_COLUMNS])
+
+
+class ParquetTableWriter:
+    """把多个 DataFrame 依次追加为同一个 Parquet 文件的行组"""
+
+    def __init__(self, path, schema=None):
+        _require_pyarrow()
+        self.path = path
+        self.schema = schema
+        self._writer = None
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    def write(self, df):
+        table = pa.Table.from_pandas(df, schema=self.schema, preserve_index=False)
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self.path, table.schema)
+        self._writer.write_table(table)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+def open_trade_writer(history_dir):
+    """在回测明细目录下创建交易记录的 Parquet 写出器"""
+    _require_pyarrow()
+    return ParquetTableWriter(os.path.join(history_dir, TRADES_FILE), schema=_trade_schema())
+
+
+def write_portfolio(history_dir, portfolio_df):
+    """把每日组合状态写成 Parquet"""
+    _require_pyarrow()
+    writer = ParquetTableWriter(os.path.join(history_dir, PORTFOLIO_FILE))
+    writer.write(portfolio_df.reset_index())
+    writer.close()
+
+
+def read_trades(path):
+    """读取写出的交易记录"""
+    _require_pyarrow()
+    return pq.read_table(path).to_pandas()
+
+
+def read_recent_trades(path, n):
+    """只读取文件末尾的行组，返回最后 n 笔交易"""
+    _require_pyarrow()
+    parquet = pq.ParquetFile(path)
+    groups = []
+    rows = 0
+    for i in range(parquet.num_row_groups - 1, -1, -1):
+        if rows >= n:
+            break
+        groups.insert(0, i)
+        rows += parquet.metadata.row_group(i).num_rows
+    if not groups:
+        return pd.DataFrame()
+    return parquet.read_row_groups(groups).to_pandas().tail(n).reset_index(drop=True)
+
+
+def load_history(history_dir):
+    """
+    读回回测写出的明细
+
+    Returns:
+    --------
+    tuple : (组合历史 DataFrame（日期索引）, 交易记录 DataFrame)
+    """
+    _require_pyarrow()
+    portfolio_df = pq.read_table(os.path.join(history_dir, PORTFOLIO_FILE)).to_pandas().set_index('date')
+    trades_file = os.path.join(history_dir, TRADES_FILE)
+    trades_df = read_trades(trades_file) if os.path.exists(trades_file) else pd.DataFrame()
+    return portfolio_df, trades_df
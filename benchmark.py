@@ -0,0 +1,470 @@
+#!/usr/bin/env python3
+"""
+端到端性能基准
+用合成的日线数据（规模 = 股票数 × 年数）测量各环节耗时，结果写成 JSON，
+可以与另一次提交的结果对比，耗时增加超过阈值时判定为性能回退。
+
+测量的环节：
+- fetch_cold / fetch_warm：run_daily.fetch_price_data 从回放数据源下载 / 直接读本地仓库
+- calculate_indicators / check_strategy：逐只计算指标与判断（原始路径）
+- screen_price_data：整个价格矩阵一次筛选（run_daily 实际使用的路径）
+- signal_history：generate_signal_history 生成历史每日信号
+- backtest / backtest_array：BacktestEngine 与 ArrayBacktestEngine 回测
+- api_*：通过 Flask test_client 请求各接口的单次延迟
+
+用法：
+    python benchmark.py --symbols 500 --years 3 --output benchmarks/after.json --compare benchmarks/before.json
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import datetime
+import platform
+import tempfile
+import subprocess
+import contextlib
+import numpy as np
+import pandas as pd
+
+import run_daily
+from backtest import BacktestEngine, ArrayBacktestEngine
+from data_provider import ReplayProvider, set_provider
+from data_store import OHLCVStore
+from result_cache import JsonFileCache, write_json_atomic
+from screener import screen_price_data, generate_signal_history
+
+# 默认基准参数
+BENCHMARK_PARAMS = {
+    'symbols': 300,            # 合成股票数量
+    'years': 3,                # 每只股票最长的历史年数
+    'repeat': 3,               # 每个环节重复次数（取中位数）
+    'api_requests': 50,        # 每个接口的请求次数
+    'seed': 0,                 # 随机种子，相同参数生成完全相同的数据
+    'end_date': '2025-12-31',  # 合成数据的最后一个交易日
+    'threshold': 0.2,          # 对比时耗时增加超过20%视为回退
+}
+
+# 每年的交易日数（A股约244天）
+TRADING_DAYS_PER_YEAR = 244
+
+# 所有基准环节（按执行顺序）
+BENCHMARKS = ['fetch', 'indicators', 'screen', 'backtest', 'api']
+
+
+def generate_price_data(n_symbols, years, seed=0, end_date=BENCHMARK_PARAMS['end_date']):
+    """
+    生成合成的日线数据
+
+    每只股票的收益率漂移和波动率不同，上市时间不同（长度为最长历史的30%~100%），
+    约十分之一的股票末尾带有平盘区间，保证各个筛选分支都会被走到。
+
+    Parameters:
+    -----------
+    n_symbols : int
+        股票数量
+    years : float
+        最长历史年数
+    seed : int
+        随机种子
+    end_date : str
+        最后一个交易日，格式：'YYYY-MM-DD'
+
+    Returns:
+    --------
+    dict : {code: DataFrame}，包含 open/high/low/close/volume 列，索引为日期
+    """
+    rng = np.random.default_rng(seed)
+    max_bars = max(int(years * TRADING_DAYS_PER_YEAR), 2)
+    all_dates = pd.bdate_range(end=end_date, periods=max_bars, name='date')
+    price_data = {}
+
+    for i in range(n_symbols):
+        n = int(rng.integers(max(int(max_bars * 0.3), 2), max_bars + 1))
+        drift = rng.normal(0.0005, 0.001)
+        volatility = rng.uniform(0.01, 0.03)
+        close = np.round(rng.uniform(5, 50) * np.exp(np.cumsum(rng.normal(drift, volatility, n))), 2)
+        if i % 10 == 0 and n > 10:
+            close[-8:-3] = close[-8]
+        open_ = np.round(close * (1 + rng.normal(0, 0.01, n)), 2)
+        high = np.round(np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.01, n))), 2)
+        low = np.round(np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.01, n))), 2)
+
+        price_data[f'{600000 + i}'] = pd.DataFrame({
+            'open': open_,
+            'high': high,
+            'low': low,
+            'close': close,
+            'volume': np.round(rng.uniform(1e5, 1e7, n))
+        }, index=all_dates[-n:])
+
+    return price_data
+
+
+def write_replay_data(price_data, root):
+    """把合成数据写成 ReplayProvider 可读取的回放目录"""
+    daily_dir = os.path.join(root, 'daily')
+    os.makedirs(daily_dir, exist_ok=True)
+    for code, df in price_data.items():
+        out = df.reset_index()
+        out['date'] = out['date'].dt.strftime('%Y-%m-%d')
+        out.to_csv(os.path.join(daily_dir, f"{run_daily.add_market_prefix(code)}.csv"),
+                   index=False, encoding='utf-8')
+
+
+def time_runs(func, repeat):
+    """
+    重复调用 func，返回耗时统计（秒）
+
+    Returns:
+    --------
+    dict : median/min/max/mean/p95 耗时与重复次数
+    """
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        runs.append(time.perf_counter() - start)
+    return summarize(runs)
+
+
+def summarize(runs):
+    """把一组耗时整理成统计字典"""
+    runs = np.asarray(runs, dtype=float)
+    return {
+        'median': float(np.median(runs)),
+        'min': float(runs.min()),
+        'max': float(runs.max()),
+        'mean': float(runs.mean()),
+        'p95': float(np.percentile(runs, 95)),
+        'repeat': int(len(runs)),
+    }
+
+
+@contextlib.contextmanager
+def patched(obj, **attrs):
+    """临时替换对象（模块）属性或字典项，退出时恢复"""
+    is_dict = isinstance(obj, dict)
+    saved = {name: (obj[name] if is_dict else getattr(obj, name)) for name in attrs}
+    try:
+        for name, value in attrs.items():
+            if is_dict:
+                obj[name] = value
+            else:
+                setattr(obj, name, value)
+        yield
+    finally:
+        for name, value in saved.items():
+            if is_dict:
+                obj[name] = value
+            else:
+                setattr(obj, name, value)
+
+
+def bench_fetch(price_data, repeat, workdir):
+    """
+    数据获取：从回放目录经限速并发池下载到空的本地仓库（冷），以及全部命中本地仓库（热）
+
+    限速放开到不限制，测量的是调度、解析和写入仓库的开销，不含网络延迟
+    """
+    replay_dir = os.path.join(workdir, 'replay')
+    write_replay_data(price_data, replay_dir)
+    codes = list(price_data)
+    start_date = min(df.index[0] for df in price_data.values()).strftime('%Y%m%d')
+    last_bar = max(df.index[-1] for df in price_data.values())
+
+    old_provider = set_provider(ReplayProvider(replay_dir))
+    try:
+        with patched(run_daily.FETCH_PARAMS, requests_per_second=1e9), \
+                patched(run_daily.STRATEGY_PARAMS, start_date=start_date), \
+                patched(run_daily, latest_bar_date=lambda now=None: last_bar):
+            runs = []
+            for k in range(repeat):
+                store = OHLCVStore(os.path.join(workdir, f'ohlcv_{k}'))
+                with patched(run_daily, STOCK_STORE=store):
+                    start = time.perf_counter()
+                    run_daily.fetch_price_data(codes)
+                    runs.append(time.perf_counter() - start)
+            cold = summarize(runs)
+
+            with patched(run_daily, STOCK_STORE=store):
+                warm = time_runs(lambda: run_daily.fetch_price_data(codes), repeat)
+    finally:
+        set_provider(old_provider)
+
+    return {'fetch_cold': cold, 'fetch_warm': warm}
+
+
+def bench_indicators(price_data, repeat):
+    """逐只股票计算指标并判断（原始的逐只路径）"""
+    with_indicators = {code: run_daily.calculate_indicators(df.copy()) for code, df in price_data.items()}
+    return {
+        'calculate_indicators': time_runs(
+            lambda: [run_daily.calculate_indicators(df.copy()) for df in price_data.values()], repeat),
+        'check_strategy': time_runs(
+            lambda: [run_daily.check_strategy(df) for df in with_indicators.values()], repeat),
+    }
+
+
+def bench_screen(price_data, repeat):
+    """整个价格矩阵一次筛选"""
+    return {
+        'screen_price_data': time_runs(
+            lambda: screen_price_data(price_data, run_daily.STRATEGY_PARAMS, style='daily'), repeat),
+    }
+
+
+def bench_backtest(price_data, repeat):
+    """生成历史信号，并分别用逐日查表和矩阵两种回测引擎回测"""
+    signals = generate_signal_history(price_data)
+    return {
+        'signal_history': time_runs(lambda: generate_signal_history(price_data), repeat),
+        'backtest': time_runs(
+            lambda: BacktestEngine(rebalance_weekly=True).run_backtest(signals, price_data), repeat),
+        'backtest_array': time_runs(
+            lambda: ArrayBacktestEngine(rebalance_weekly=True).run_backtest(signals, price_data), repeat),
+    }
+
+
+def bench_api(price_data, n_requests, workdir):
+    """
+    Web接口延迟：用合成数据的选股结果和指标快照作为当天的缓存，
+    逐次请求各接口（详情接口命中快照，不访问网络）
+    """
+    import app as web_app
+
+    _, results = screen_price_data(price_data, run_daily.STRATEGY_PARAMS, style='daily')
+    today = web_app.get_today_date()
+    stocks = []
+    snapshots = {}
+    for k, (code, (is_selected, reason)) in enumerate(results.items()):
+        if not is_selected:
+            continue
+        df = price_data[code]
+        stocks.append({'板块': f"板块{k % 5}", '代码': code, '名称': f"股票{code}",
+                       '最新价': float(df['close'].iloc[-1]), '理由': reason, '趋势强度': '强'})
+        snapshots[code] = run_daily.build_indicator_snapshot(run_daily.calculate_indicators(df.copy()))
+    if not stocks:
+        # 没有入选股票时用第一只股票，保证详情接口有数据可测
+        code = next(iter(price_data))
+        stocks.append({'板块': '板块0', '代码': code, '名称': f"股票{code}",
+                       '最新价': float(price_data[code]['close'].iloc[-1]), '理由': '', '趋势强度': '强'})
+        snapshots[code] = run_daily.build_indicator_snapshot(run_daily.calculate_indicators(price_data[code].copy()))
+
+    result_cache = JsonFileCache(os.path.join(workdir, 'selected_stocks_cache.json'))
+    indicator_cache = JsonFileCache(os.path.join(workdir, 'selected_stocks_indicators.json'))
+    indicator_cache.put({'date': today, 'stocks': snapshots})
+    result_cache.put({'date': today, 'stocks': stocks, 'stats': {'total': len(stocks)},
+                      'strategy_params': run_daily.STRATEGY_PARAMS})
+
+    def no_network(stock_code):
+        raise RuntimeError(f"基准测试不应访问网络: {stock_code}")
+
+    endpoints = {
+        'api_stocks': '/api/stocks',
+        'api_stats': '/api/stats',
+        'api_filter': '/api/filter?sector=板块1&search=60',
+        'api_stock_detail': f"/api/stock/{stocks[0]['代码']}",
+    }
+    timings = {}
+    with patched(web_app, RESULT_CACHE=result_cache, INDICATOR_CACHE=indicator_cache,
+                 fetch_stock_kline_data=no_network):
+        client = web_app.app.test_client()
+        for name, url in endpoints.items():
+            client.get(url)  # 预热
+            runs = []
+            for _ in range(n_requests):
+                start = time.perf_counter()
+                response = client.get(url)
+                runs.append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    raise RuntimeError(f"{url} 返回 {response.status_code}")
+            timings[name] = summarize(runs)
+    return timings
+
+
+def run_stage(name, price_data, config, workdir):
+    """运行一个基准环节，返回 {测量项: 耗时统计}"""
+    if name == 'fetch':
+        return bench_fetch(price_data, config['repeat'], workdir)
+    if name == 'indicators':
+        return bench_indicators(price_data, config['repeat'])
+    if name == 'screen':
+        return bench_screen(price_data, config['repeat'])
+    if name == 'backtest':
+        return bench_backtest(price_data, config['repeat'])
+    return bench_api(price_data, config['api_requests'], workdir)
+
+
+def git_commit():
+    """当前提交的短哈希，不在git仓库中时返回None"""
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10)
+        commit = out.stdout.strip()
+        return commit or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_benchmarks(symbols=None, years=None, repeat=None, api_requests=None, seed=None, only=None):
+    """
+    运行基准测试
+
+    Parameters:
+    -----------
+    symbols, years, repeat, api_requests, seed :
+        覆盖 BENCHMARK_PARAMS 中的同名参数
+    only : list
+        只运行其中的环节（BENCHMARKS 中的名称），默认全部
+
+    Returns:
+    --------
+    dict : {'meta': 运行环境, 'config': 规模参数, 'results': {环节: 耗时统计}}
+    """
+    config = {
+        'symbols': symbols or BENCHMARK_PARAMS['symbols'],
+        'years': years or BENCHMARK_PARAMS['years'],
+        'repeat': repeat or BENCHMARK_PARAMS['repeat'],
+        'api_requests': api_requests or BENCHMARK_PARAMS['api_requests'],
+        'seed': BENCHMARK_PARAMS['seed'] if seed is None else seed,
+        'end_date': BENCHMARK_PARAMS['end_date'],
+    }
+    only = list(only or BENCHMARKS)
+    unknown = set(only) - set(BENCHMARKS)
+    if unknown:
+        raise ValueError(f"未知的基准环节: {sorted(unknown)}")
+
+    price_data = generate_price_data(config['symbols'], config['years'], config['seed'], config['end_date'])
+    config['bars'] = int(sum(len(df) for df in price_data.values()))
+    print(f"合成数据: {config['symbols']} 只股票 × 最长 {config['years']} 年，共 {config['bars']} 根K线")
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for name in only:
+            start = time.perf_counter()
+            # 被测函数的逐只/逐日输出不打印到终端
+            with contextlib.redirect_stdout(io.StringIO()):
+                results.update(run_stage(name, price_data, config, workdir))
+            print(f"  {name} 完成，用时 {time.perf_counter() - start:.1f}s")
+
+    return {
+        'meta': {
+            'commit': git_commit(),
+            'created_at': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'platform': platform.platform(),
+        },
+        'config': config,
+        'results': results,
+    }
+
+
+def compare_results(current, baseline, threshold=BENCHMARK_PARAMS['threshold']):
+    """
+    对比两次基准结果（按中位数耗时）
+
+    Parameters:
+    -----------
+    current, baseline : dict
+        run_benchmarks 的返回值（或读取的 JSON）
+    threshold : float
+        耗时增加比例超过该值视为回退
+
+    Returns:
+    --------
+    list : 每个共同环节的 {'name', 'baseline', 'current', 'change', 'regression'}，
+           change 为耗时变化比例（正数表示变慢）
+    """
+    rows = []
+    for name, stats in current['results'].items():
+        if name not in baseline['results']:
+            continue
+        old = baseline['results'][name]['median']
+        new = stats['median']
+        change = (new - old) / old if old > 0 else 0.0
+        rows.append({
+            'name': name,
+            'baseline': old,
+            'current': new,
+            'change': change,
+            'regression': change > threshold,
+        })
+    return rows
+
+
+def print_results(result):
+    """打印各环节耗时"""
+    print("\n" + "=" * 60)
+    print(f"基准结果 (commit {result['meta']['commit']})")
+    print("=" * 60)
+    for name, stats in result['results'].items():
+        print(f"{name:<22} 中位数 {stats['median'] * 1000:10.2f} ms   "
+              f"最小 {stats['min'] * 1000:10.2f} ms   p95 {stats['p95'] * 1000:10.2f} ms")
+
+
+def print_comparison(rows, threshold):
+    """打印对比结果"""
+    print("\n" + "=" * 60)
+    print(f"与基线对比（阈值 +{threshold:.0%}）")
+    print("=" * 60)
+    for row in rows:
+        mark = "  <-- 回退" if row['regression'] else ""
+        print(f"{row['name']:<22} {row['baseline'] * 1000:10.2f} ms -> {row['current'] * 1000:10.2f} ms "
+              f"({row['change']:+.1%}){mark}")
+
+
+def parse_args(argv=None):
+    """解析命令行参数"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='选股/回测/Web接口端到端性能基准')
+    parser.add_argument('--symbols', type=int, default=BENCHMARK_PARAMS['symbols'], help='合成股票数量')
+    parser.add_argument('--years', type=float, default=BENCHMARK_PARAMS['years'], help='每只股票最长的历史年数')
+    parser.add_argument('--repeat', type=int, default=BENCHMARK_PARAMS['repeat'], help='每个环节重复次数')
+    parser.add_argument('--api-requests', type=int, default=BENCHMARK_PARAMS['api_requests'],
+                        help='每个接口的请求次数')
+    parser.add_argument('--seed', type=int, default=BENCHMARK_PARAMS['seed'], help='随机种子')
+    parser.add_argument('--only', default=None,
+                        help=f"只运行部分环节，逗号分隔（{','.join(BENCHMARKS)}）")
+    parser.add_argument('--output', default=None, help='结果JSON路径，默认 benchmarks/<commit>.json')
+    parser.add_argument('--compare', default=None, help='作为基线的结果JSON')
+    parser.add_argument('--threshold', type=float, default=BENCHMARK_PARAMS['threshold'],
+                        help='耗时增加超过该比例视为回退')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """运行基准测试，写出结果；与基线对比出现回退时返回1"""
+    args = parse_args(argv)
+    result = run_benchmarks(symbols=args.symbols, years=args.years, repeat=args.repeat,
+                            api_requests=args.api_requests, seed=args.seed,
+                            only=args.only.split(',') if args.only else None)
+    print_results(result)
+
+    output = args.output or os.path.join('benchmarks', f"{result['meta']['commit'] or 'local'}.json")
+    write_json_atomic(output, result)
+    print(f"\n结果已保存到 {output}")
+
+    if not args.compare:
+        return 0
+
+    with open(args.compare, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    if baseline['config'] != result['config']:
+        print(f"警告: 基线的规模参数不同 {baseline['config']}，对比结果仅供参考")
+    rows = compare_results(result, baseline, args.threshold)
+    print_comparison(rows, args.threshold)
+    regressions = [row['name'] for row in rows if row['regression']]
+    if regressions:
+        print(f"\n性能回退: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
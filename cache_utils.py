@@ -0,0 +1,109 @@
+"""
+通用缓存工具
+LRUCache：线程安全的定长LRU缓存
+SingleFlight：同一个键的并发加载合并为一次，其余调用方等待并共享结果
+"""
+
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """线程安全的定长LRU缓存"""
+
+    def __init__(self, maxsize=256):
+        """
+        Parameters:
+        -----------
+        maxsize : int
+            最多保留的条目数，超出时淘汰最久未使用的条目
+        """
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+
+class _Call:
+    """一次进行中的加载"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """合并同一个键的并发加载"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func):
+        """
+        执行 func() 并返回结果；同一个键已有加载在进行时，等待并返回那次的结果
+
+        Parameters:
+        -----------
+        key : hashable
+            加载的键
+        func : callable
+            无参数的加载函数，抛出的异常会传给所有等待的调用方
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result
@@ -0,0 +1,241 @@
+"""
+紧凑的全市场日线数据
+ak.stock_zh_a_daily 返回的 DataFrame 每列都是 float64，还带有 amount/outstanding_share/turnover
+等选股用不到的列，calculate_indicators 之后每只股票再多出5列 float64 指标。全市场多年的数据
+按这种方式常驻内存需要数GB。CompactUniverse 只保留需要的列：
+- 价格和成交量存为 float32，所有股票首尾相接放在一个数组中（offsets 记录每只股票的起止位置）
+- 日期存为 int32 的交易日序号（所有股票交易日并集 calendar 中的下标）
+- 不保存指标：需要时由 frame / bar_panel 升为 float64 后现算
+
+精度（见 test_compact_universe.py）：
+- 不复权数据的价格都是0.01元的整数倍。压缩时检查每列是否都在这个最小报价单位的网格上（且取整后
+  能从 float32 还原），
+  是则升为 float64 时重新取整到网格，得到的数值与原始 float64 数据逐位相同，
+  收盘价恰好等于MA5这类平局的判断也不会改变
+- 复权价格不在网格上，float32 的相对误差不超过 2**-24（约6e-8）；均线等指标在升为 float64 后计算，
+  与 float64 路径的相对误差同样在1e-7量级。选股条件都是价格之间的大小比较和 3%/20%/99% 这类阈值，
+  只有与阈值的差距小于上述误差时结论才可能不同
+
+用法：
+    universe = CompactUniverse.from_store(start_date='20200101')
+    panel = universe.bar_panel()                 # 向量化选股 / 历史信号
+    matrix = universe.price_matrix()             # 回测
+    df = calculate_indicators(universe.frame('600519'))
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from backtest import PriceMatrix
+from screener import BarPanel
+
+# 紧凑模式保留的列及其类型
+COMPACT_FIELDS = ('open', 'high', 'low', 'close', 'volume')
+COMPACT_CONFIG = {
+    'price_dtype': np.float32,     # 价格/成交量的存储类型
+    'day_dtype': np.int32,         # 交易日序号的存储类型
+    'price_decimals': 2,           # 最小报价单位的小数位数（0.01元），列中全部数值都在网格上时升为float64后重新取整
+}
+
+
+class CompactUniverse:
+    """按股票首尾相接存放的 float32 日线数据，日期为交易日序号"""
+
+    def __init__(self, calendar, codes, offsets, day, fields, decimals=None):
+        """
+        Parameters:
+        -----------
+        calendar : np.ndarray
+            排好序的交易日（datetime64[D]），所有股票交易日的并集
+        codes : list
+            股票代码
+        offsets : np.ndarray
+            长度为 股票数+1 的 int64 数组，第j只股票的数据位于 [offsets[j], offsets[j+1])
+        day : np.ndarray
+            每根K线的交易日序号（calendar 中的下标），int32
+        fields : dict
+            {字段名: float32 数组}，与 day 等长
+        decimals : dict
+            {字段名: 小数位数}，在网格上的列升为 float64 时取整到该位数，不在其中的列直接升为 float64
+        """
+        self.calendar = calendar
+        self.codes = list(codes)
+        self.offsets = offsets
+        self.day = day
+        self.fields = fields
+        self.decimals = dict(decimals or {})
+        self.code_index = {code: j for j, code in enumerate(self.codes)}
+
+    @classmethod
+    def from_frames(cls, frames, fields=COMPACT_FIELDS):
+        """
+        由 (code, DataFrame) 序列逐只压缩：每个 DataFrame 转换后即可释放，峰值内存约为一只股票的原始数据
+
+        Parameters:
+        -----------
+        frames : iterable
+            (code, pd.DataFrame)，DataFrame 以date为索引并按日期排序；空数据跳过
+        fields : tuple
+            保留的列，DataFrame中缺少的列填NaN
+
+        Returns:
+        --------
+        CompactUniverse
+        """
+        price_dtype = COMPACT_CONFIG['price_dtype']
+        digits = COMPACT_CONFIG['price_decimals']
+        codes, dates, n_bars = [], [], []
+        columns = {field: [] for field in fields}
+        on_grid = {field: digits is not None for field in fields}
+        for code, df in frames:
+            if df is None or df.empty:
+                continue
+            codes.append(code)
+            dates.append(df.index.values.astype('datetime64[D]'))
+            n_bars.append(len(df))
+            for field in fields:
+                if field not in df.columns:
+                    columns[field].append(np.full(len(df), np.nan, dtype=price_dtype))
+                    continue
+                values = df[field].to_numpy(dtype=np.float64)
+                compact = values.astype(price_dtype)
+                if on_grid[field]:
+                    # 在网格上，且 float32 的舍入误差小于半个报价单位（取整后能还原）
+                    restored = np.round(compact.astype(np.float64), digits)
+                    on_grid[field] = (np.array_equal(np.round(values, digits), values, equal_nan=True)
+                                      and np.array_equal(restored, values, equal_nan=True))
+                columns[field].append(compact)
+
+        offsets = np.zeros(len(codes) + 1, dtype=np.int64)
+        np.cumsum(n_bars, out=offsets[1:])
+        if codes:
+            all_dates = np.concatenate(dates)
+            calendar = np.unique(all_dates)
+            day = np.searchsorted(calendar, all_dates).astype(COMPACT_CONFIG['day_dtype'])
+            values = {field: np.concatenate(columns[field]) for field in fields}
+        else:
+            calendar = np.array([], dtype='datetime64[D]')
+            day = np.array([], dtype=COMPACT_CONFIG['day_dtype'])
+            values = {field: np.array([], dtype=price_dtype) for field in fields}
+        decimals = {field: digits for field in fields if on_grid[field]}
+        return cls(calendar, codes, offsets, day, values, decimals)
+
+    @classmethod
+    def from_price_data(cls, price_data, fields=COMPACT_FIELDS):
+        """由价格数据字典 {code: pd.DataFrame} 创建"""
+        return cls.from_frames(price_data.items(), fields)
+
+    @classmethod
+    def from_store(cls, store=None, start_date=None, end_date=None, fields=COMPACT_FIELDS):
+        """
+        读取本地数据仓库中的全部股票（代码去掉市场前缀），只读取 fields 中的列
+
+        Parameters:
+        -----------
+        store : OHLCVStore
+            数据仓库，默认 data_store.STOCK_STORE
+        start_date, end_date : str
+            可选的日期范围，格式：'YYYYMMDD'
+        """
+        from data_store import STOCK_STORE
+        store = store or STOCK_STORE
+        symbols = []
+        if os.path.isdir(store.root):
+            symbols = [s for s in sorted(os.listdir(store.root)) if not s.startswith('.')]
+
+        def frames():
+            for symbol in symbols:
+                df = store.load(symbol, start_date, end_date, columns=fields)
+                if df is not None and {'open', 'high', 'close'} <= set(df.columns):
+                    yield symbol[2:], df
+
+        return cls.from_frames(frames(), fields)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __contains__(self, code):
+        return code in self.code_index
+
+    @property
+    def n_bars(self):
+        """每只股票的K线数量"""
+        return np.diff(self.offsets)
+
+    @property
+    def dates(self):
+        """交易日（pd.DatetimeIndex）"""
+        return pd.DatetimeIndex(self.calendar.astype('datetime64[ns]'))
+
+    @property
+    def nbytes(self):
+        """数据占用的字节数"""
+        return (self.calendar.nbytes + self.offsets.nbytes + self.day.nbytes
+                + sum(values.nbytes for values in self.fields.values()))
+
+    def values(self, field, lo=None, hi=None):
+        """
+        某个字段（可选地截取 [lo, hi) 段）升为 float64 的值；在报价网格上的列重新取整，与原始数据逐位相同
+        """
+        values = self.fields[field][lo:hi].astype(np.float64)
+        digits = self.decimals.get(field)
+        if digits is not None:
+            np.round(values, digits, out=values)
+        return values
+
+    def _positions(self):
+        """每根K线所属股票的列号"""
+        return np.repeat(np.arange(len(self.codes)), self.n_bars)
+
+    def frame(self, code, fields=None):
+        """
+        返回单只股票的 float64 日线 DataFrame（不含指标），可直接传给 calculate_indicators
+
+        Parameters:
+        -----------
+        code : str
+            股票代码
+        fields : tuple
+            返回的列，默认全部列
+        """
+        j = self.code_index[code]
+        lo, hi = self.offsets[j], self.offsets[j + 1]
+        fields = fields or tuple(self.fields)
+        data = {field: self.values(field, lo, hi) for field in fields}
+        index = pd.DatetimeIndex(self.calendar[self.day[lo:hi]].astype('datetime64[ns]'), name='date')
+        return pd.DataFrame(data, index=index)
+
+    def price_data(self, fields=None):
+        """按需逐只生成 (code, DataFrame)，供需要 DataFrame 的旧接口使用"""
+        for code in self.codes:
+            yield code, self.frame(code, fields)
+
+    def bar_panel(self, fields=('open', 'high', 'close')):
+        """
+        返回选股用的右对齐 float64 价格矩阵，与 build_bar_panel(price_data) 的布局相同
+        """
+        n_bars = self.n_bars
+        n_rows = int(n_bars.max()) if len(n_bars) else 0
+        cols = self._positions()
+        # 第j只股票的第i根K线放在第 n_rows - n_bars[j] + i 行
+        rows = np.arange(len(self.day)) - self.offsets[:-1][cols] + (n_rows - n_bars)[cols]
+
+        dates = np.full((n_rows, len(self.codes)), np.datetime64('NaT'), dtype='datetime64[ns]')
+        dates[rows, cols] = self.calendar[self.day]
+        matrices = {}
+        for field in fields:
+            matrix = np.full((n_rows, len(self.codes)), np.nan)
+            matrix[rows, cols] = self.values(field)
+            matrices[field] = matrix
+        return BarPanel(self.codes, dates, matrices, n_bars)
+
+    def price_matrix(self):
+        """返回回测引擎使用的 (交易日 × 股票) float64 收盘价矩阵"""
+        cols = self._positions()
+        close = np.full((len(self.calendar), len(self.codes)), np.nan)
+        available = np.zeros((len(self.calendar), len(self.codes)), dtype=bool)
+        close[self.day, cols] = self.values('close')
+        available[self.day, cols] = True
+        return PriceMatrix(self.dates, self.codes, close, available)
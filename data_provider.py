@@ -0,0 +1,187 @@
+"""
+数据源接口
+选股、回测和Web应用通过 get_provider() 获取行情数据，不直接调用 akshare：
+- AkshareProvider：在线接口（默认）
+- ReplayProvider：从本地录制的文件回放，结果确定、不访问网络
+- RecordingProvider：包装在线接口，把返回的数据同时录制为回放文件
+
+通过环境变量选择数据源：
+    STOCK_DATA_PROVIDER=akshare|replay|record   （默认 akshare）
+    STOCK_REPLAY_DIR=data/replay                 （回放/录制目录）
+"""
+
+import os
+import threading
+import pandas as pd
+
+# 数据源配置（可被环境变量覆盖）
+PROVIDER_CONFIG = {
+    'provider': os.environ.get('STOCK_DATA_PROVIDER', 'akshare'),
+    'replay_dir': os.environ.get('STOCK_REPLAY_DIR', 'data/replay'),
+}
+
+
+class ReplayDataMissing(LookupError):
+    """回放目录中没有请求的数据"""
+
+
+class AkshareProvider:
+    """akshare 在线数据源"""
+
+    name = 'akshare'
+
+    def __init__(self):
+        import akshare as ak
+        self.ak = ak
+
+    def stock_daily(self, symbol, start_date, end_date, adjust='qfq'):
+        """
+        单只股票的日线数据（与 ak.stock_zh_a_daily 的返回格式相同）
+
+        Parameters:
+        -----------
+        symbol : str
+            带市场前缀的股票代码，如 "sh600519"
+        start_date, end_date : str
+            日期范围，格式：'YYYYMMDD'
+        adjust : str
+            复权方式，默认前复权
+        """
+        return self.ak.stock_zh_a_daily(symbol=symbol, start_date=start_date, end_date=end_date, adjust=adjust)
+
+    def sector_fund_flow(self):
+        """当日行业资金流排名"""
+        return self.ak.stock_sector_fund_flow_rank(indicator="今日", sector_type="行业资金流")
+
+    def board_constituents(self, sector_name):
+        """行业板块成分股（'代码'、'名称' 列）"""
+        return self.ak.stock_board_industry_cons_em(symbol=sector_name)
+
+    def market_list(self):
+        """全市场A股列表（code、name 列）"""
+        return self.ak.stock_info_a_code_name()
+
+
+class ReplayProvider:
+    """
+    从录制目录回放数据
+
+    目录结构：
+        daily/<symbol>.csv           日线数据（date 列为 YYYY-MM-DD）
+        fund_flow.csv                行业资金流排名
+        constituents/<板块名>.csv    板块成分股
+        market_list.csv              全市场股票列表
+    """
+
+    name = 'replay'
+
+    def __init__(self, root=None):
+        self.root = root or PROVIDER_CONFIG['replay_dir']
+
+    def _read_csv(self, *parts, **kwargs):
+        path = os.path.join(self.root, *parts)
+        if not os.path.exists(path):
+            raise ReplayDataMissing(f"回放数据不存在: {path}")
+        # round_trip 保证浮点数与录制时逐位相同
+        return pd.read_csv(path, encoding='utf-8', float_precision='round_trip', **kwargs)
+
+    def stock_daily(self, symbol, start_date, end_date, adjust='qfq'):
+        df = self._read_csv('daily', f"{symbol}.csv")
+        dates = pd.to_datetime(df['date'])
+        mask = (dates >= pd.Timestamp(start_date)) & (dates <= pd.Timestamp(end_date))
+        return df[mask.to_numpy()].reset_index(drop=True)
+
+    def sector_fund_flow(self):
+        return self._read_csv('fund_flow.csv')
+
+    def board_constituents(self, sector_name):
+        return self._read_csv('constituents', f"{sector_name}.csv", dtype={'代码': str})
+
+    def market_list(self):
+        return self._read_csv('market_list.csv', dtype={'code': str})
+
+
+class RecordingProvider:
+    """包装另一个数据源，把每次返回的数据写成 ReplayProvider 可读取的文件"""
+
+    name = 'record'
+
+    def __init__(self, inner=None, root=None):
+        self.inner = inner or AkshareProvider()
+        self.root = root or PROVIDER_CONFIG['replay_dir']
+        self._lock = threading.Lock()
+
+    def _write_csv(self, df, *parts):
+        if df is None or df.empty:
+            return
+        path = os.path.join(self.root, *parts)
+        tmp_file = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        with self._lock:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        df.to_csv(tmp_file, index=False, encoding='utf-8')
+        os.replace(tmp_file, path)
+
+    def stock_daily(self, symbol, start_date, end_date, adjust='qfq'):
+        df = self.inner.stock_daily(symbol, start_date, end_date, adjust)
+        if df is not None and not df.empty:
+            # 与已录制的数据合并，增量请求不会覆盖更早的历史
+            path = os.path.join(self.root, 'daily', f"{symbol}.csv")
+            recorded = df.copy()
+            recorded['date'] = pd.to_datetime(recorded['date']).dt.strftime('%Y-%m-%d')
+            if os.path.exists(path):
+                old = pd.read_csv(path, encoding='utf-8', float_precision='round_trip')
+                recorded = pd.concat([old[~old['date'].isin(recorded['date'])], recorded])
+                recorded = recorded.sort_values('date')
+            self._write_csv(recorded, 'daily', f"{symbol}.csv")
+        return df
+
+    def sector_fund_flow(self):
+        df = self.inner.sector_fund_flow()
+        self._write_csv(df, 'fund_flow.csv')
+        return df
+
+    def board_constituents(self, sector_name):
+        df = self.inner.board_constituents(sector_name)
+        self._write_csv(df, 'constituents', f"{sector_name}.csv")
+        return df
+
+    def market_list(self):
+        df = self.inner.market_list()
+        self._write_csv(df, 'market_list.csv')
+        return df
+
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def create_provider(name=None, replay_dir=None):
+    """按名称创建数据源：'akshare'、'replay' 或 'record'"""
+    name = name or PROVIDER_CONFIG['provider']
+    if name == 'akshare':
+        return AkshareProvider()
+    if name == 'replay':
+        return ReplayProvider(replay_dir)
+    if name == 'record':
+        return RecordingProvider(root=replay_dir)
+    raise ValueError(f"未知的数据源: {name}")
+
+
+def get_provider():
+    """返回当前使用的数据源（首次调用时按 PROVIDER_CONFIG 创建）"""
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                _provider = create_provider()
+                if _provider.name != 'akshare':
+                    print(f"数据源: {_provider.name} ({_provider.root})")
+    return _provider
+
+
+def set_provider(provider):
+    """替换当前数据源，返回原来的数据源"""
+    global _provider
+    with _provider_lock:
+        old, _provider = _provider, provider
+    return old
@@ -0,0 +1,194 @@
+"""
+本地日线数据仓库
+按 add_market_prefix 之后的代码（如 sh600519）每只股票一个目录，每列一个 .npy 文件，
+读取时以内存映射方式打开；更新时只向接口请求最后一个已存交易日之后的数据。
+"""
+
+import os
+import json
+import shutil
+import threading
+import datetime
+import numpy as np
+import pandas as pd
+
+# 默认存储目录
+STORE_DIR = 'cache/ohlcv'
+
+
+class OHLCVStore:
+    """按股票分目录的列式日线数据仓库"""
+
+    def __init__(self, root=STORE_DIR):
+        """
+        Parameters:
+        -----------
+        root : str
+            存储根目录，每只股票一个子目录
+        """
+        self.root = root
+
+    def _symbol_dir(self, symbol):
+        return os.path.join(self.root, symbol)
+
+    def _read_meta(self, symbol):
+        meta_file = os.path.join(self._symbol_dir(symbol), 'meta.json')
+        if not os.path.exists(meta_file):
+            return None
+        try:
+            with open(meta_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def last_date(self, symbol):
+        """返回已存数据的最后一个交易日，没有数据时返回None"""
+        try:
+            dates = np.load(os.path.join(self._symbol_dir(symbol), 'date.npy'), mmap_mode='r')
+        except (OSError, ValueError):
+            return None
+        if len(dates) == 0:
+            return None
+        return pd.Timestamp(dates[-1])
+
+    def load(self, symbol, start_date=None, end_date=None, columns=None):
+        """
+        读取已存的日线数据
+
+        Parameters:
+        -----------
+        symbol : str
+            带市场前缀的股票代码
+        start_date, end_date : str
+            可选的日期范围，格式：'YYYYMMDD'
+        columns : list
+            只读取这些列（不存在的列忽略），为None时读取全部列
+
+        Returns:
+        --------
+        pd.DataFrame : 以date为索引的日线数据，没有数据时返回None
+        """
+        meta = self._read_meta(symbol)
+        if meta is None:
+            return None
+
+        symbol_dir = self._symbol_dir(symbol)
+        try:
+            dates = np.load(os.path.join(symbol_dir, 'date.npy'), mmap_mode='r')
+            lo, hi = 0, len(dates)
+            if start_date:
+                lo = np.searchsorted(dates, np.datetime64(pd.Timestamp(start_date).date()), side='left')
+            if end_date:
+                hi = np.searchsorted(dates, np.datetime64(pd.Timestamp(end_date).date()), side='right')
+
+            data = {}
+            for col in meta['columns']:
+                if columns is not None and col not in columns:
+                    continue
+                values = np.load(os.path.join(symbol_dir, f'{col}.npy'), mmap_mode='r')
+                data[col] = np.array(values[lo:hi])
+            index = pd.DatetimeIndex(np.array(dates[lo:hi]).astype('datetime64[ns]'), name='date')
+        except (OSError, ValueError, KeyError):
+            return None
+
+        if len(index) == 0:
+            return None
+        return pd.DataFrame(data, index=index)
+
+    def save(self, symbol, df, start_date=None):
+        """
+        原子地写入一只股票的完整日线数据（先写临时目录，再整体替换）
+
+        Parameters:
+        -----------
+        symbol : str
+            带市场前缀的股票代码
+        df : pd.DataFrame
+            以date为索引的日线数据
+        start_date : str
+            该份数据请求的开始日期，用于判断已存历史是否足够
+        """
+        os.makedirs(self.root, exist_ok=True)
+        tag = f"{os.getpid()}-{threading.get_ident()}"
+        tmp_dir = os.path.join(self.root, f'.tmp-{symbol}-{tag}')
+        old_dir = os.path.join(self.root, f'.old-{symbol}-{tag}')
+        target = self._symbol_dir(symbol)
+
+        columns = [c for c in df.columns if pd.api.types.is_numeric_dtype(df[c])]
+
+        os.makedirs(tmp_dir, exist_ok=True)
+        np.save(os.path.join(tmp_dir, 'date.npy'), df.index.values.astype('datetime64[D]'))
+        for col in columns:
+            np.save(os.path.join(tmp_dir, f'{col}.npy'), df[col].to_numpy())
+        with open(os.path.join(tmp_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump({
+                'columns': columns,
+                'start_date': start_date,
+                'updated_at': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            }, f, ensure_ascii=False)
+
+        if os.path.exists(target):
+            os.rename(target, old_dir)
+        os.rename(tmp_dir, target)
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+    def update(self, symbol, fetch_func, start_date, end_date):
+        """
+        先读本地数据，只请求最后一个已存交易日之后的增量，合并后写回
+
+        前复权数据在除权除息后会整体变化：增量请求包含最后一个已存交易日，
+        如果该日收盘价与本地不一致，说明复权因子已变，改为全量重新下载。
+
+        Parameters:
+        -----------
+        symbol : str
+            带市场前缀的股票代码
+        fetch_func : callable
+            fetch_func(start_date, end_date) -> pd.DataFrame 或 None，日期格式 'YYYYMMDD'
+        start_date, end_date : str
+            需要的日期范围，格式：'YYYYMMDD'
+
+        Returns:
+        --------
+        pd.DataFrame : 指定范围内的日线数据，获取失败时返回None
+        """
+        meta = self._read_meta(symbol)
+        stored = self.load(symbol) if meta is not None else None
+
+        # 本地没有数据，或已存历史比需要的更短，全量下载
+        if stored is None or (meta.get('start_date') or start_date) > start_date:
+            return self._refresh(symbol, fetch_func, start_date, end_date)
+
+        last = stored.index[-1]
+        if last >= pd.Timestamp(end_date):
+            return self.load(symbol, start_date, end_date)
+
+        delta = fetch_func(last.strftime('%Y%m%d'), end_date)
+        if delta is None or delta.empty:
+            # 网络失败或没有新数据，使用本地已有数据
+            return self.load(symbol, start_date, end_date)
+
+        if last in delta.index:
+            old_close = stored['close'].iloc[-1]
+            new_close = delta.loc[last, 'close']
+            if not np.isclose(old_close, new_close, rtol=1e-6, atol=0):
+                return self._refresh(symbol, fetch_func, start_date, end_date)
+
+        new_rows = delta[delta.index > last]
+        if not new_rows.empty:
+            merged = pd.concat([stored, new_rows[stored.columns.intersection(new_rows.columns)]])
+            self.save(symbol, merged, start_date=meta.get('start_date'))
+
+        return self.load(symbol, start_date, end_date)
+
+    def _refresh(self, symbol, fetch_func, start_date, end_date):
+        """全量下载并覆盖本地数据"""
+        df = fetch_func(start_date, end_date)
+        if df is None or df.empty:
+            return None
+        self.save(symbol, df, start_date=start_date)
+        return self.load(symbol, start_date, end_date)
+
+
+# 默认仓库实例
+STOCK_STORE = OHLCVStore()
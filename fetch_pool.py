@@ -0,0 +1,54 @@
+"""
+数据获取的限速与重试策略
+- is_retryable_error：判断异常是否值得重试（网络类错误）
+- TokenBucket：线程安全的令牌桶，限制每秒请求数
+
+并发获取本身由 async_fetch.AsyncFetcher 负责
+"""
+
+import time
+import threading
+
+
+def is_retryable_error(error):
+    """判断异常是否值得重试（网络类错误）"""
+    error_msg = str(error)
+    return 'date' in error_msg or 'Connection' in error_msg or 'Remote' in error_msg
+
+
+class TokenBucket:
+    """线程安全的令牌桶限速器"""
+
+    def __init__(self, rate, capacity=None):
+        """
+        Parameters:
+        -----------
+        rate : float
+            每秒补充的令牌数（即每秒允许的请求数）
+        capacity : float
+            桶容量（允许的突发请求数），默认等于rate
+        """
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(rate, 1))
+        self.tokens = self.capacity
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def try_acquire(self):
+        """不阻塞地取一个令牌：成功时返回0，令牌不足时返回需要等待的秒数"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+            self.last_refill = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        """取一个令牌，令牌不足时阻塞等待"""
+        while True:
+            wait = self.try_acquire()
+            if wait == 0:
+                return
+            time.sleep(wait)
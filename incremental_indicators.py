@@ -0,0 +1,388 @@
+"""
+增量滚动指标
+为每只股票保存一份指标状态（各均线的滑动和、滚动最高价的单调队列、最近若干根K线），
+新增一根K线时以O(1)更新 MA5/MA10/MA20/MA60 和 Rolling_Max，
+结果与 calculate_indicators 中 pandas rolling 的结果逐位一致。
+
+每日选股（run_daily.scan）从本地数据仓库取得日线后，用 INDICATOR_STATES 只把新K线加入
+持久化的状态，再由 screen_states 用状态中的最近K线和指标选股，不再对全部历史重新计算指标。
+"""
+
+import os
+import json
+import math
+import threading
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from metrics import METRICS
+from screener import STRATEGY_PARAMS, build_bar_panel, screen_panel
+
+# 默认状态目录，每只股票一个JSON文件
+STATE_DIR = 'cache/indicator_state'
+
+# 状态中保留的K线字段
+BAR_FIELDS = ('open', 'high', 'low', 'close', 'volume')
+
+# 状态中的指标列（与 calculate_indicators 相同）
+INDICATOR_FIELDS = ('MA5', 'MA10', 'MA20', 'MA60', 'Rolling_Max')
+
+
+class RollingMean:
+    """
+    滚动均值的增量状态
+
+    逐步复现 pandas roll_mean 的计算：加入和移出分别使用各自的 Kahan 补偿项，
+    并记录连续相同值的个数（窗口内数值全相同时直接取该值）。
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.values = deque(maxlen=window)
+        self.nobs = 0
+        self.neg_ct = 0
+        self.sum_x = 0.0
+        self.comp_add = 0.0
+        self.comp_remove = 0.0
+        self.num_same = 0
+        self.prev_value = math.nan
+        self.count = 0
+
+    def _add(self, value):
+        if math.isnan(value):
+            return
+        self.nobs += 1
+        y = value - self.comp_add
+        t = self.sum_x + y
+        self.comp_add = t - self.sum_x - y
+        self.sum_x = t
+        if math.copysign(1.0, value) < 0:
+            self.neg_ct += 1
+        if value == self.prev_value:
+            self.num_same += 1
+        else:
+            self.num_same = 1
+        self.prev_value = value
+
+    def _remove(self, value):
+        if math.isnan(value):
+            return
+        self.nobs -= 1
+        y = -value - self.comp_remove
+        t = self.sum_x + y
+        self.comp_remove = t - self.sum_x - y
+        self.sum_x = t
+        if math.copysign(1.0, value) < 0:
+            self.neg_ct -= 1
+
+    def append(self, value):
+        """加入一个新值，返回新的均值（不足一个窗口时为NaN）"""
+        value = float(value)
+        if self.count == 0 or self.window == 1:
+            # 与 pandas 相同：第一个窗口（或窗口与上一个不重叠）时重新初始化
+            self.nobs = self.neg_ct = 0
+            self.sum_x = self.comp_add = self.comp_remove = 0.0
+            self.num_same = 0
+            self.prev_value = value
+        elif len(self.values) == self.window:
+            self._remove(self.values[0])
+        self.values.append(value)
+        self._add(value)
+        self.count += 1
+        return self.value()
+
+    def value(self):
+        if self.nobs < self.window or self.nobs == 0:
+            return math.nan
+        result = self.sum_x / self.nobs
+        if self.num_same >= self.nobs:
+            result = self.prev_value
+        elif self.neg_ct == 0 and result < 0:
+            result = 0.0
+        elif self.neg_ct == self.nobs and result > 0:
+            result = 0.0
+        return result
+
+    def to_dict(self):
+        return {
+            'window': self.window, 'values': list(self.values), 'nobs': self.nobs, 'neg_ct': self.neg_ct,
+            'sum_x': self.sum_x, 'comp_add': self.comp_add, 'comp_remove': self.comp_remove,
+            'num_same': self.num_same, 'prev_value': self.prev_value, 'count': self.count
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        state = cls(data['window'])
+        state.values.extend(data['values'])
+        for key in ('nobs', 'neg_ct', 'sum_x', 'comp_add', 'comp_remove', 'num_same', 'prev_value', 'count'):
+            setattr(state, key, data[key])
+        return state
+
+
+class RollingMax:
+    """滚动最大值的增量状态（单调递减队列，保存 (序号, 值)）"""
+
+    def __init__(self, window):
+        self.window = window
+        self.queue = deque()
+        self.valid = deque(maxlen=window)
+        self.n_valid = 0
+        self.count = 0
+
+    def append(self, value):
+        """加入一个新值，返回新的窗口最大值（窗口内有效值不足时为NaN）"""
+        value = float(value)
+        i = self.count
+        self.count += 1
+        # 移出窗口外的值
+        while self.queue and self.queue[0][0] <= i - self.window:
+            self.queue.popleft()
+        is_valid = not math.isnan(value)
+        if len(self.valid) == self.window:
+            self.n_valid -= self.valid[0]
+        self.valid.append(is_valid)
+        self.n_valid += is_valid
+        if is_valid:
+            while self.queue and self.queue[-1][1] <= value:
+                self.queue.pop()
+            self.queue.append((i, value))
+        return self.value()
+
+    def value(self):
+        if self.n_valid < self.window or not self.queue:
+            return math.nan
+        return self.queue[0][1]
+
+    def to_dict(self):
+        return {'window': self.window, 'queue': [list(item) for item in self.queue],
+                'valid': list(self.valid), 'count': self.count}
+
+    @classmethod
+    def from_dict(cls, data):
+        state = cls(data['window'])
+        state.queue.extend(tuple(item) for item in data['queue'])
+        state.valid.extend(data['valid'])
+        state.n_valid = sum(state.valid)
+        state.count = data['count']
+        return state
+
+
+class IndicatorState:
+    """
+    单只股票的指标状态
+
+    保存各均线和 Rolling_Max 的增量状态，以及最近 keep_bars 根K线和指标，
+    frame() 返回的数据足够 check_strategy 判断最新一根K线。
+    """
+
+    def __init__(self, params=None, keep_bars=None):
+        """
+        Parameters:
+        -----------
+        params : dict
+            策略参数，决定各均线和创新高窗口的长度
+        keep_bars : int
+            保留的最近K线数量，默认 high_window + 5（check_strategy 的最少K线数）
+        """
+        params = params or STRATEGY_PARAMS
+        self.windows = {
+            'MA5': params['ma_short'],
+            'MA10': 10,
+            'MA20': params['ma_mid'],
+            'MA60': params['ma_trend'],
+        }
+        self.means = {name: RollingMean(window) for name, window in self.windows.items()}
+        self.high_max = RollingMax(params['high_window'])
+        self.keep_bars = keep_bars or params['high_window'] + 5
+        self.rows = deque(maxlen=self.keep_bars)
+        self.dates = deque(maxlen=self.keep_bars)
+        # 第一根K线的日期：滚动和的舍入误差与起点有关，起点不同的数据需要重建状态
+        self.first_date = None
+
+    @property
+    def last_date(self):
+        return self.dates[-1] if self.dates else None
+
+    @property
+    def n_bars(self):
+        return self.high_max.count
+
+    def append(self, date, bar):
+        """
+        加入一根新K线（O(1)）
+
+        Parameters:
+        -----------
+        date : str 或 pd.Timestamp
+            K线日期，必须晚于 last_date
+        bar : dict 或 pd.Series
+            至少包含 open/high/low/close/volume
+
+        Returns:
+        --------
+        dict : 该K线的指标 {'MA5', 'MA10', 'MA20', 'MA60', 'Rolling_Max'}
+        """
+        date = pd.Timestamp(date)
+        if self.dates and date <= self.dates[-1]:
+            raise ValueError(f"K线日期 {date.date()} 不晚于状态中的最后日期 {self.dates[-1].date()}")
+
+        close = float(bar['close'])
+        indicators = {name: state.append(close) for name, state in self.means.items()}
+        indicators['Rolling_Max'] = self.high_max.append(bar['high'])
+
+        row = {field: float(bar[field]) for field in BAR_FIELDS}
+        row.update(indicators)
+        self.rows.append(row)
+        self.dates.append(date)
+        if self.first_date is None:
+            self.first_date = date
+        return indicators
+
+    def update(self, df):
+        """
+        加入 df 中晚于 last_date 的K线
+
+        Returns:
+        --------
+        int : 新加入的K线数量
+        """
+        if self.dates:
+            df = df.iloc[df.index.searchsorted(self.dates[-1], side='right'):]
+        for date, row in zip(df.index, df[list(BAR_FIELDS)].to_dict('records')):
+            self.append(date, row)
+        return len(df)
+
+    def matches(self, df):
+        """
+        状态是否由 df 的前若干根K线得到：起点相同，且保留的K线与 df 中同日期的收盘价一致
+        （前复权数据被重新调整后需重建）。按日期二分查找，与 df 的长度无关
+        """
+        if not self.dates:
+            return True
+        if df.empty or df.index[0] != self.first_date:
+            return False
+        dates = pd.DatetimeIndex(list(self.dates))
+        pos = df.index.searchsorted(dates)
+        if pos[-1] >= len(df) or not (df.index[pos] == dates).all():
+            return False
+        closes = df['close'].to_numpy(dtype=float)[pos]
+        return all(row['close'] == close for row, close in zip(self.rows, closes))
+
+    def frame(self):
+        """返回最近 keep_bars 根K线及指标的 DataFrame（列与 calculate_indicators 的结果相同）"""
+        return pd.DataFrame(list(self.rows), index=pd.DatetimeIndex(list(self.dates), name='date'))
+
+    def to_dict(self):
+        return {
+            'windows': self.windows,
+            'high_window': self.high_max.window,
+            'keep_bars': self.keep_bars,
+            'means': {name: state.to_dict() for name, state in self.means.items()},
+            'high_max': self.high_max.to_dict(),
+            'dates': [date.strftime('%Y-%m-%d') for date in self.dates],
+            'first_date': self.first_date.strftime('%Y-%m-%d') if self.first_date is not None else None,
+            'rows': list(self.rows)
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        params = {
+            'ma_short': data['windows']['MA5'],
+            'ma_mid': data['windows']['MA20'],
+            'ma_trend': data['windows']['MA60'],
+            'high_window': data['high_window'],
+        }
+        state = cls(params, keep_bars=data['keep_bars'])
+        state.means = {name: RollingMean.from_dict(d) for name, d in data['means'].items()}
+        state.high_max = RollingMax.from_dict(data['high_max'])
+        state.dates.extend(pd.Timestamp(date) for date in data['dates'])
+        state.first_date = pd.Timestamp(data['first_date']) if data['first_date'] else None
+        state.rows.extend(data['rows'])
+        return state
+
+    @classmethod
+    def from_frame(cls, df, params=None, keep_bars=None):
+        """由完整的日线数据构建状态"""
+        state = cls(params, keep_bars)
+        state.update(df)
+        return state
+
+
+class IndicatorStateStore:
+    """按股票保存指标状态的JSON文件"""
+
+    def __init__(self, root=STATE_DIR):
+        self.root = root
+        self._lock = threading.Lock()
+
+    def _path(self, symbol):
+        return os.path.join(self.root, f"{symbol}.json")
+
+    def load(self, symbol):
+        """读取状态，没有或无法解析时返回None"""
+        try:
+            with open(self._path(symbol), 'r', encoding='utf-8') as f:
+                return IndicatorState.from_dict(json.load(f))
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def save(self, symbol, state):
+        """原子写入状态"""
+        path = self._path(symbol)
+        tmp_file = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        with self._lock:
+            os.makedirs(self.root, exist_ok=True)
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(state.to_dict(), f)
+        os.replace(tmp_file, path)
+
+    def update(self, symbol, df, params=None):
+        """
+        用最新的日线数据更新某只股票的状态：只加入新K线（每根O(1)），没有新K线时不改写文件；
+        状态不存在或与数据不一致（如前复权重新调整）时从头重建
+
+        Returns:
+        --------
+        IndicatorState : 更新后的状态
+        """
+        state = self.load(symbol)
+        expected = IndicatorState(params)
+        if (state is None or state.windows != expected.windows
+                or state.high_max.window != expected.high_max.window or not state.matches(df)):
+            state = IndicatorState.from_frame(df, params)
+        elif not state.update(df):
+            return state
+        self.save(symbol, state)
+        return state
+
+
+def screen_states(states, params=None, style='daily'):
+    """
+    用指标状态中保留的最近K线和指标对每只股票的最新一根K线选股，不重新计算指标
+
+    Parameters:
+    -----------
+    states : dict
+        {code: IndicatorState}
+    params : dict
+        策略参数，默认使用 STRATEGY_PARAMS
+    style : str
+        理由字符串格式，见 screener.screen_panel
+
+    Returns:
+    --------
+    dict : {code: (is_selected, reason)}，与 screen_panel 对全部历史选股的结果相同
+    """
+    frames = {code: state.frame() for code, state in states.items() if state.n_bars}
+    with METRICS.timer('screen.build_panel'):
+        panel = build_bar_panel(frames, fields=('open', 'high', 'close') + INDICATOR_FIELDS)
+    # 数据是否足够按全部K线数判断，而不是状态中保留的K线数
+    panel.n_bars = np.array([states[code].n_bars for code in panel.symbols], dtype=np.int64)
+    indicators = {name: panel[name] for name in INDICATOR_FIELDS}
+    return screen_panel(panel, params=params, indicators=indicators, style=style)
+
+
+# 全局状态存储实例
+INDICATOR_STATES = IndicatorStateStore()
@@ -0,0 +1,153 @@
+"""
+滚动指标缓存
+参数扫描 / 滚动窗口回测中，不同的策略参数组合往往共用相同窗口的均线和滚动最高价。
+IndicatorCache 以 (价格矩阵指纹, 指标名, 窗口) 为键保存整张矩阵的指标，每个不同的窗口只计算一次：
+- 按占用字节数限制内存，超出时淘汰最久未使用的矩阵
+- 指定 spill_dir 时，被淘汰的矩阵写到磁盘（.npy），再次用到时从磁盘读回而不是重新计算
+
+用法：
+    cache = IndicatorCache()
+    for params in param_sets:
+        status, _, _ = evaluate_panel_history(panel, params, cache=cache)
+"""
+
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# 缓存配置
+INDICATOR_CACHE_CONFIG = {
+    'max_mb': 512,       # 内存中指标矩阵的总大小上限（MB）
+    'spill_dir': None,   # 溢出目录，为None时被淘汰的矩阵直接丢弃
+}
+
+
+def panel_fingerprint(symbols, matrices):
+    """
+    价格矩阵内容的指纹：股票代码和各字段矩阵完全相同时指纹相同
+
+    Parameters:
+    -----------
+    symbols : list
+        股票代码
+    matrices : dict
+        {字段名: np.ndarray}
+
+    Returns:
+    --------
+    str : 16位十六进制字符串
+    """
+    h = hashlib.blake2b(digest_size=8)
+    h.update('\0'.join(symbols).encode('utf-8'))
+    for name in sorted(matrices):
+        matrix = np.ascontiguousarray(matrices[name])
+        h.update(name.encode('utf-8'))
+        h.update(str(matrix.shape).encode('utf-8'))
+        h.update(matrix.view(np.uint8).reshape(-1))
+    return h.hexdigest()
+
+
+class IndicatorCache:
+    """按字节数限制大小的指标矩阵LRU缓存，可选地把淘汰的矩阵溢出到磁盘（线程安全）"""
+
+    def __init__(self, max_mb=None, spill_dir=None):
+        """
+        Parameters:
+        -----------
+        max_mb : float
+            内存中矩阵的总大小上限（MB），默认 INDICATOR_CACHE_CONFIG['max_mb']
+        spill_dir : str
+            溢出目录，默认 INDICATOR_CACHE_CONFIG['spill_dir']
+        """
+        max_mb = INDICATOR_CACHE_CONFIG['max_mb'] if max_mb is None else max_mb
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.spill_dir = spill_dir if spill_dir is not None else INDICATOR_CACHE_CONFIG['spill_dir']
+        self._data = OrderedDict()
+        self._spilled = {}
+        self._lock = threading.Lock()
+        self.nbytes = 0
+        self.hits = 0          # 内存命中
+        self.disk_hits = 0     # 从溢出文件读回
+        self.misses = 0        # 需要重新计算
+        if self.spill_dir:
+            os.makedirs(self.spill_dir, exist_ok=True)
+
+    def _spill_path(self, key):
+        name = '_'.join(str(part) for part in key)
+        safe_name = ''.join(c if c.isalnum() or c in '-_.' else '_' for c in name)
+        return os.path.join(self.spill_dir, f'{safe_name}.npy')
+
+    def get(self, key, default=None):
+        """按键取矩阵：先查内存，再查溢出文件，都没有时返回 default"""
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            path = self._spilled.get(key)
+            if path is None:
+                self.misses += 1
+                return default
+            self.disk_hits += 1
+        value = np.load(path)
+        self.put(key, value)
+        return value
+
+    def put(self, key, value):
+        """放入矩阵；超出大小上限时淘汰最久未使用的矩阵（有溢出目录时写到磁盘）"""
+        evicted = []
+        with self._lock:
+            if key in self._data:
+                self.nbytes -= self._data.pop(key).nbytes
+            self._data[key] = value
+            self.nbytes += value.nbytes
+            while self.nbytes > self.max_bytes and len(self._data) > 1:
+                old_key, old_value = self._data.popitem(last=False)
+                self.nbytes -= old_value.nbytes
+                evicted.append((old_key, old_value))
+
+        if not self.spill_dir:
+            return
+        for old_key, old_value in evicted:
+            if old_key in self._spilled:
+                continue
+            path = self._spill_path(old_key)
+            np.save(path, old_value)
+            with self._lock:
+                self._spilled[old_key] = path
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data or key in self._spilled
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def clear(self):
+        """清空内存中的矩阵并删除溢出文件"""
+        with self._lock:
+            self._data.clear()
+            self.nbytes = 0
+            paths = list(self._spilled.values())
+            self._spilled.clear()
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def stats(self):
+        """命中统计"""
+        with self._lock:
+            return {
+                'entries': len(self._data),
+                'spilled': len(self._spilled),
+                'mb': self.nbytes / 1024 / 1024,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+            }
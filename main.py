@@ -1,8 +1,13 @@
-import akshare as ak
 import pandas as pd
 import datetime
 import time
 
+from data_store import STOCK_STORE
+from data_provider import get_provider
+from sector_cache import SECTOR_CACHE
+from async_fetch import AsyncFetcher
+from fetch_pool import is_retryable_error
+
 # ==========================================
 # 策略参数设置
 # ==========================================
@@ -16,15 +21,24 @@ STRATEGY_PARAMS = {
     'pullback_lookback': 5,        # 回调考察窗口 (看过去几天是否跌下来过)
 }
 
-def get_top_inflow_sectors(top_n=3):
+def get_top_inflow_sectors(top_n=3, date_str=None):
     """
     获取资金流入最多的前N个板块及其成分股
+
+    date_str 为 'YYYY-MM-DD' 时使用当天归档的资金流快照（还原历史选股池），
+    成分股仍为当前缓存的成分股
     """
     print(f"正在获取资金流入前 {top_n} 的板块...")
     try:
-        # 获取行业资金流排名 (东方财富接口)
-        # indicator="今日" 获取实时/当日数据
-        df_flow = ak.stock_sector_fund_flow_rank(indicator="今日", sector_type="行业资金流")
+        if date_str:
+            df_flow = SECTOR_CACHE.load_fund_flow(date_str)
+            if df_flow is None:
+                print(f"没有 {date_str} 的资金流快照")
+                return []
+        else:
+            # 获取行业资金流排名 (东方财富接口)，同时按日期归档
+            # indicator="今日" 获取实时/当日数据
+            df_flow = SECTOR_CACHE.fetch_fund_flow()
         
         if df_flow is None or df_flow.empty:
             print("未能获取到行业资金流数据")
@@ -50,28 +64,31 @@ def get_top_inflow_sectors(top_n=3):
         # 取前N个板块
         top_sectors = df_flow.head(top_n)
         
+        # 各板块的成分股并发获取（共用连接池），按资金流排名顺序输出
+        with AsyncFetcher(SECTOR_CACHE.get_constituents, concurrency=top_n) as fetcher:
+            constituents = dict(fetcher.map(top_sectors['名称']))
+
         sector_stocks = []
         for index, row in top_sectors.iterrows():
             sector_name = row['名称']
             flow_amount = row[target_col]
-            
+
             # 转换单位显示，方便阅读
             flow_str = f"{flow_amount/100000000:.2f}亿" if abs(flow_amount) > 100000000 else f"{flow_amount/10000:.2f}万"
             print(f"  -> 选中板块: 【{sector_name}】 (主力净流入: {flow_str})")
-            
-            # 获取板块成分股
-            try:
-                df_cons = ak.stock_board_industry_cons_em(symbol=sector_name)
-                # df_cons 通常包含 '代码', '名称' 等列
-                for _, stock in df_cons.iterrows():
-                    sector_stocks.append({
-                        'code': stock['代码'], 
-                        'name': stock['名称'], 
-                        'sector': sector_name # 记录来源板块
-                    })
-            except Exception as e:
-                print(f"    获取板块 {sector_name} 成分股失败: {e}")
-                
+
+            # 板块成分股，df_cons 通常包含 '代码', '名称' 等列
+            df_cons = constituents.get(sector_name)
+            if df_cons is None:
+                print(f"    获取板块 {sector_name} 成分股失败: {fetcher.errors.get(sector_name, '无数据')}")
+                continue
+            for _, stock in df_cons.iterrows():
+                sector_stocks.append({
+                    'code': stock['代码'],
+                    'name': stock['名称'],
+                    'sector': sector_name  # 记录来源板块
+                })
+
         return sector_stocks
 
     except Exception as e:
@@ -107,26 +124,45 @@ def add_market_prefix(code):
         # 无法识别，尝试添加sz前缀（大多数A股在深圳）
         return f"sz{code}"
 
-def get_stock_data(symbol, max_retries=2):
+def get_stock_data(symbol, max_retries=2, use_store=True):
     """
     获取单只股票的日线数据
     symbol: 股票代码，如 "600519" 或 "sh600519"
     max_retries: 最大重试次数
+    use_store: 是否优先读取本地数据仓库，只下载缺少的增量数据
     """
     # 确保有市场前缀
     symbol_with_prefix = add_market_prefix(symbol)
+    start_date = STRATEGY_PARAMS['start_date']
+    end_date = datetime.datetime.now().strftime('%Y%m%d')
+
+    if not use_store:
+        return download_stock_data(symbol_with_prefix, start_date, end_date, max_retries)
 
+    return STOCK_STORE.update(
+        symbol_with_prefix,
+        lambda start, end: download_stock_data(symbol_with_prefix, start, end, max_retries),
+        start_date,
+        end_date
+    )
+
+def download_stock_data(symbol_with_prefix, start_date, end_date, max_retries=2):
+    """
+    从接口下载单只股票指定日期范围的日线数据
+    symbol_with_prefix: 带市场前缀的股票代码，如 "sh600519"
+    start_date, end_date: 日期范围，格式：'YYYYMMDD'
+    """
     for attempt in range(max_retries):
         try:
             # 添加重试延迟
             if attempt > 0:
                 time.sleep(0.3 * attempt)  # 指数退避
 
-            # 使用 stock_zh_a_daily 接口获取数据
-            df = ak.stock_zh_a_daily(
-                symbol=symbol_with_prefix,
-                start_date=STRATEGY_PARAMS['start_date'],
-                end_date=datetime.datetime.now().strftime('%Y%m%d'),
+            # 通过数据源获取（默认为 ak.stock_zh_a_daily 接口）
+            df = get_provider().stock_daily(
+                symbol_with_prefix,
+                start_date,
+                end_date,
                 adjust="qfq"  # 前复权
             )
 
@@ -148,7 +184,7 @@ def get_stock_data(symbol, max_retries=2):
         except Exception as e:
             error_msg = str(e)
             # 如果是特定错误，重试
-            if 'date' in error_msg or 'Connection' in error_msg or 'Remote' in error_msg:
+            if is_retryable_error(e):
                 if attempt < max_retries - 1:
                     # print(f"  获取失败，第{attempt+1}次重试...")
                     continue
@@ -300,4 +336,5 @@ def main():
         print(result_df[cols])
 
 if __name__ == "__main__":
-    main()
+    from profiling import run_profiled
+    run_profiled('main', main)
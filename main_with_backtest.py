@@ -4,7 +4,6 @@
 回测：最高点回撤4%后清仓
 """
 
-import akshare as ak
 import pandas as pd
 import datetime
 import time
@@ -12,6 +11,12 @@ import warnings
 warnings.filterwarnings('ignore')
 
 from backtest import BacktestEngine
+from data_store import STOCK_STORE
+from data_provider import get_provider
+from sector_cache import SECTOR_CACHE
+from async_fetch import AsyncFetcher
+from fetch_pool import is_retryable_error
+from screener import generate_signal_history
 
 # ==========================================
 # 策略参数设置
@@ -33,6 +38,7 @@ BACKTEST_PARAMS = {
     'commission_rate': 0.0003,     # 佣金率万分之三
     'rebalance_weekly': False,     # 是否启用每周调仓
     'rebalance_day': 0,            # 调仓日（0=周一，1=周二，...，6=周日）
+    'max_position_pct': 0.2,       # 单只股票最多占用资金比例
     'backtest_start': '2023-01-01',
     'backtest_end': '2023-12-01'
 }
@@ -68,13 +74,14 @@ def add_market_prefix(code):
         return f"sz{code}"
 
 
-def get_stock_data(symbol, start_date=None, end_date=None, max_retries=2):
+def get_stock_data(symbol, start_date=None, end_date=None, max_retries=2, use_store=True):
     """
     获取单只股票的日线数据
     symbol: 股票代码，如 "600519" 或 "sh600519"
     start_date: 开始日期，格式：'YYYYMMDD'
     end_date: 结束日期，格式：'YYYYMMDD'
     max_retries: 最大重试次数
+    use_store: 是否优先读取本地数据仓库，只下载缺少的增量数据
     """
     # 确保有市场前缀
     symbol_with_prefix = add_market_prefix(symbol)
@@ -85,17 +92,34 @@ def get_stock_data(symbol, start_date=None, end_date=None, max_retries=2):
     if end_date is None:
         end_date = datetime.datetime.now().strftime('%Y%m%d')
 
+    if not use_store:
+        return download_stock_data(symbol_with_prefix, start_date, end_date, max_retries)
+
+    return STOCK_STORE.update(
+        symbol_with_prefix,
+        lambda start, end: download_stock_data(symbol_with_prefix, start, end, max_retries),
+        start_date,
+        end_date
+    )
+
+
+def download_stock_data(symbol_with_prefix, start_date, end_date, max_retries=2):
+    """
+    从接口下载单只股票指定日期范围的日线数据
+    symbol_with_prefix: 带市场前缀的股票代码，如 "sh600519"
+    start_date, end_date: 日期范围，格式：'YYYYMMDD'
+    """
     for attempt in range(max_retries):
         try:
             # 添加重试延迟
             if attempt > 0:
                 time.sleep(0.3 * attempt)  # 指数退避
 
-            # 使用 stock_zh_a_daily 接口获取数据
-            df = ak.stock_zh_a_daily(
-                symbol=symbol_with_prefix,
-                start_date=start_date,
-                end_date=end_date,
+            # 通过数据源获取（默认为 ak.stock_zh_a_daily 接口）
+            df = get_provider().stock_daily(
+                symbol_with_prefix,
+                start_date,
+                end_date,
                 adjust="qfq"  # 前复权
             )
 
@@ -115,9 +139,8 @@ def get_stock_data(symbol, start_date=None, end_date=None, max_retries=2):
             return df
 
         except Exception as e:
-            error_msg = str(e)
             # 如果是特定错误，重试
-            if 'date' in error_msg or 'Connection' in error_msg or 'Remote' in error_msg:
+            if is_retryable_error(e):
                 if attempt < max_retries - 1:
                     continue
                 else:
@@ -205,15 +228,24 @@ def check_strategy(df, symbol, stock_name="未知"):
         return False, "今日未站稳5日线或收阴"
 
 
-def get_top_inflow_sectors(top_n=3):
+def get_top_inflow_sectors(top_n=3, date_str=None):
     """
     获取资金流入最多的前N个板块及其成分股
+
+    date_str 为 'YYYY-MM-DD' 时使用当天归档的资金流快照（还原历史选股池），
+    成分股仍为当前缓存的成分股
     """
     print(f"正在获取资金流入前 {top_n} 的板块...")
     try:
-        # 获取行业资金流排名 (东方财富接口)
-        # indicator="今日" 获取实时/当日数据
-        df_flow = ak.stock_sector_fund_flow_rank(indicator="今日", sector_type="行业资金流")
+        if date_str:
+            df_flow = SECTOR_CACHE.load_fund_flow(date_str)
+            if df_flow is None:
+                print(f"没有 {date_str} 的资金流快照")
+                return []
+        else:
+            # 获取行业资金流排名 (东方财富接口)，同时按日期归档
+            # indicator="今日" 获取实时/当日数据
+            df_flow = SECTOR_CACHE.fetch_fund_flow()
 
         if df_flow is None or df_flow.empty:
             print("未能获取到行业资金流数据")
@@ -239,6 +271,10 @@ def get_top_inflow_sectors(top_n=3):
         # 取前N个板块
         top_sectors = df_flow.head(top_n)
 
+        # 各板块的成分股并发获取（共用连接池），按资金流排名顺序输出
+        with AsyncFetcher(SECTOR_CACHE.get_constituents, concurrency=top_n) as fetcher:
+            constituents = dict(fetcher.map(top_sectors['名称']))
+
         sector_stocks = []
         for index, row in top_sectors.iterrows():
             sector_name = row['名称']
@@ -248,18 +284,17 @@ def get_top_inflow_sectors(top_n=3):
             flow_str = f"{flow_amount / 100000000:.2f}亿" if abs(flow_amount) > 100000000 else f"{flow_amount / 10000:.2f}万"
             print(f"  -> 选中板块: 【{sector_name}】 (主力净流入: {flow_str})")
 
-            # 获取板块成分股
-            try:
-                df_cons = ak.stock_board_industry_cons_em(symbol=sector_name)
-                # df_cons 通常包含 '代码', '名称' 等列
-                for _, stock in df_cons.iterrows():
-                    sector_stocks.append({
-                        'code': stock['代码'],
-                        'name': stock['名称'],
-                        'sector': sector_name  # 记录来源板块
-                    })
-            except Exception as e:
-                print(f"    获取板块 {sector_name} 成分股失败: {e}")
+            # 板块成分股，df_cons 通常包含 '代码', '名称' 等列
+            df_cons = constituents.get(sector_name)
+            if df_cons is None:
+                print(f"    获取板块 {sector_name} 成分股失败: {fetcher.errors.get(sector_name, '无数据')}")
+                continue
+            for _, stock in df_cons.iterrows():
+                sector_stocks.append({
+                    'code': stock['代码'],
+                    'name': stock['名称'],
+                    'sector': sector_name  # 记录来源板块
+                })
 
         return sector_stocks
 
@@ -388,9 +423,14 @@ def run_backtest():
     # 配置回测参数
     configure_backtest()
 
-    # 这里需要模拟历史选股过程
-    # 由于akshare接口限制，我们无法直接获取历史某日的板块资金流
-    # 这里简化处理：使用固定的测试日期进行回测演示
+    # 股票池：当前资金流入前3的板块成分股
+    # 注意：无法获取历史某日的板块资金流，这里使用当前成分股，存在幸存者偏差
+    stock_list = get_top_inflow_sectors(top_n=3)
+    names = {}
+    for stock in stock_list:
+        if 'ST' in stock['name'] or '退' in stock['name']:
+            continue
+        names[stock['code']] = stock['name']
 
     # 创建回测引擎
     backtest = BacktestEngine(
@@ -398,45 +438,42 @@ def run_backtest():
         stop_loss_pct=BACKTEST_PARAMS['stop_loss_pct'],
         commission_rate=BACKTEST_PARAMS['commission_rate'],
         rebalance_weekly=BACKTEST_PARAMS['rebalance_weekly'],
-        rebalance_day=BACKTEST_PARAMS['rebalance_day']
+        rebalance_day=BACKTEST_PARAMS['rebalance_day'],
+        max_position_pct=BACKTEST_PARAMS['max_position_pct']
     )
 
-    # 模拟历史选股信号（这里需要实际的历史数据）
-    # 由于数据获取限制，这里创建一个示例信号
-    example_signals = {
-        '2023-03-01': [
-            {'code': '000001', 'name': '平安银行'},
-            {'code': '600519', 'name': '贵州茅台'}
-        ],
-        '2023-06-01': [
-            {'code': '300308', 'name': '中际旭创'},
-            {'code': '002415', 'name': '海康威视'}
-        ]
-    }
-
-    # 获取价格数据
+    # 获取价格数据（从 start_date 开始，保证回测首日已有足够数据计算均线）
     price_data = {}
-    all_codes = set()
-    for date_str, stocks in example_signals.items():
-        for stock in stocks:
-            all_codes.add(stock['code'])
-
-    print(f"获取{len(all_codes)}只股票的历史价格数据...")
-    for code in all_codes:
+    end_date = BACKTEST_PARAMS['backtest_end'].replace('-', '')
+    print(f"获取{len(names)}只股票的历史价格数据...")
+    for code in names:
         df = get_stock_data(
             code,
-            start_date='20230101',
-            end_date='20231201'
+            start_date=STRATEGY_PARAMS['start_date'],
+            end_date=end_date
         )
         if df is not None:
             price_data[code] = df
-            print(f"  {code}: {len(df)}个交易日数据")
         else:
             print(f"  {code}: 获取数据失败")
 
+    if not price_data:
+        print("未获取到任何价格数据，无法回测")
+        return {}
+
+    # 一次性计算回测区间内每个交易日的选股信号
+    signals = generate_signal_history(
+        price_data,
+        names=names,
+        start_date=BACKTEST_PARAMS['backtest_start'],
+        end_date=BACKTEST_PARAMS['backtest_end'],
+        params=STRATEGY_PARAMS
+    )
+    print(f"共生成{len(signals)}个交易日的选股信号，合计{sum(len(v) for v in signals.values())}次入选")
+
     # 运行回测
     results = backtest.run_backtest(
-        example_signals,
+        signals,
         price_data,
         start_date=BACKTEST_PARAMS['backtest_start'],
         end_date=BACKTEST_PARAMS['backtest_end']
@@ -490,4 +527,5 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    from profiling import run_profiled
+    run_profiled('main_with_backtest', main)
\ No newline at end of file
@@ -0,0 +1,135 @@
+"""
+运行指标：计数器和耗时直方图
+选股流程各环节（资金流、成分股、逐只下载、指标计算、筛选、写结果文件）把耗时和次数记到全局的 METRICS，
+运行结束时输出一行 JSON 汇总；Web应用通过 /api/metrics 返回同样的数据。
+"""
+
+import json
+import time
+import bisect
+import threading
+import contextlib
+
+# 耗时直方图的桶上界（秒）
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# 汇总行的前缀，便于从日志中 grep
+SUMMARY_PREFIX = 'METRICS'
+
+
+class Histogram:
+    """固定分桶的耗时直方图（非线程安全，由 MetricsRegistry 加锁）"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # 最后一个桶为超出上界
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def quantile(self, q):
+        """按分桶估算分位数（取所在桶的上界，不超过观测到的最大值）"""
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        seen = 0
+        for upper, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= rank:
+                return min(upper, self.max)
+        return self.max
+
+    def to_dict(self):
+        buckets = {f"le_{upper:g}": n for upper, n in zip(self.buckets, self.counts) if n}
+        if self.counts[-1]:
+            buckets['gt_max'] = self.counts[-1]
+        return {
+            'count': self.count,
+            'sum': round(self.total, 6),
+            'mean': round(self.total / self.count, 6) if self.count else None,
+            'min': None if self.min is None else round(self.min, 6),
+            'max': None if self.max is None else round(self.max, 6),
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'buckets': buckets,
+        }
+
+
+class Timer:
+    """METRICS.timer() 返回的计时对象，退出后 seconds 为本次耗时"""
+
+    def __init__(self):
+        self.seconds = 0.0
+
+
+class MetricsRegistry:
+    """线程安全的计数器 / 耗时直方图注册表"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self.counters = {}
+        self.histograms = {}
+
+    def inc(self, name, value=1):
+        """计数器加 value"""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, seconds):
+        """记录一次耗时（秒）"""
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        """
+        计时上下文：退出时把耗时记到名为 name 的直方图（抛出异常时也记录）
+
+        用法：
+            with METRICS.timer('stage.screen') as t:
+                ...
+            print(t.seconds)
+        """
+        timer = Timer()
+        start = time.perf_counter()
+        try:
+            yield timer
+        finally:
+            timer.seconds = time.perf_counter() - start
+            self.observe(name, timer.seconds)
+
+    def snapshot(self):
+        """返回当前所有指标（可直接序列化为JSON）"""
+        with self._lock:
+            return {
+                'uptime_seconds': round(time.time() - self.started_at, 3),
+                'counters': dict(sorted(self.counters.items())),
+                'timers': {name: histogram.to_dict() for name, histogram in sorted(self.histograms.items())},
+            }
+
+    def reset(self):
+        """清空所有指标"""
+        with self._lock:
+            self.started_at = time.time()
+            self.counters = {}
+            self.histograms = {}
+
+    def summary_line(self):
+        """一行JSON汇总：'METRICS {...}'"""
+        return f"{SUMMARY_PREFIX} {json.dumps(self.snapshot(), ensure_ascii=False, sort_keys=True)}"
+
+
+# 全局指标实例
+METRICS = MetricsRegistry()
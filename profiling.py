@@ -0,0 +1,186 @@
+"""
+可选的性能剖析
+任何入口都可以在不修改代码的情况下剖析一次运行：
+    STOCK_PROFILE=1 python run_daily.py          （或 python run_daily.py --profile）
+    STOCK_PROFILE=1 python main_with_backtest.py
+Web应用可以剖析单个请求：
+    STOCK_PROFILE_REQUESTS=/api/stock python app.py   （值为路径前缀，1 表示全部接口）
+
+剖析结果写到 logs/profile_<名称>_<时间>.prof（可用 snakeviz / pstats 查看），
+同时把最耗时的前N个函数打印到运行日志。安装了 pyinstrument 时可以设置
+STOCK_PROFILER=pyinstrument，结果写成 .html。
+"""
+
+import io
+import os
+import sys
+import time
+import pstats
+import cProfile
+import datetime
+import threading
+
+# 剖析配置（可被环境变量覆盖）
+PROFILE_CONFIG = {
+    'enabled': os.environ.get('STOCK_PROFILE', '').lower() in ('1', 'true', 'yes'),
+    'requests': os.environ.get('STOCK_PROFILE_REQUESTS', ''),                   # Web请求：路径前缀，'1' 为全部
+    'min_seconds': float(os.environ.get('STOCK_PROFILE_MIN_SECONDS', '0')),     # 只保存耗时超过该值的请求
+    'engine': os.environ.get('STOCK_PROFILER', 'cprofile'),                     # cprofile 或 pyinstrument
+    'top_n': int(os.environ.get('STOCK_PROFILE_TOP', '25')),                    # 日志中打印的函数数量
+    'dir': os.environ.get('STOCK_PROFILE_DIR', 'logs'),
+}
+
+# 命令行开关
+PROFILE_FLAG = '--profile'
+
+# 同一时间只剖析一个请求（cProfile 只记录当前线程，并发剖析会互相干扰）
+_request_lock = threading.Lock()
+
+
+def profile_requested(argv=None):
+    """命令行带 --profile 或设置了 STOCK_PROFILE 时返回True"""
+    argv = sys.argv[1:] if argv is None else argv
+    return PROFILE_CONFIG['enabled'] or PROFILE_FLAG in argv
+
+
+def _profile_path(name, suffix):
+    safe_name = ''.join(c if c.isalnum() or c in '-_' else '_' for c in name).strip('_') or 'run'
+    stamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+    os.makedirs(PROFILE_CONFIG['dir'], exist_ok=True)
+    return os.path.join(PROFILE_CONFIG['dir'], f"profile_{safe_name}_{stamp}{suffix}")
+
+
+class Profile:
+    """
+    一次剖析：start() / stop() 之间的调用被记录，save() 写文件并返回最耗时函数的摘要
+
+    engine 为 'pyinstrument' 且已安装时使用 pyinstrument，否则使用 cProfile
+    """
+
+    def __init__(self, name, engine=None, top_n=None):
+        self.name = name
+        self.engine = engine or PROFILE_CONFIG['engine']
+        self.top_n = top_n or PROFILE_CONFIG['top_n']
+        self.elapsed = 0.0
+        self._start = None
+        self._profiler = None
+
+        if self.engine == 'pyinstrument':
+            try:
+                from pyinstrument import Profiler
+                self._profiler = Profiler()
+            except ImportError:
+                print("未安装 pyinstrument，改用 cProfile")
+                self.engine = 'cprofile'
+        if self._profiler is None:
+            self._profiler = cProfile.Profile()
+
+    def start(self):
+        self._start = time.perf_counter()
+        if self.engine == 'pyinstrument':
+            self._profiler.start()
+        else:
+            self._profiler.enable()
+
+    def stop(self):
+        if self.engine == 'pyinstrument':
+            self._profiler.stop()
+        else:
+            self._profiler.disable()
+        self.elapsed = time.perf_counter() - self._start
+
+    def save(self):
+        """
+        写出剖析文件
+
+        Returns:
+        --------
+        tuple : (文件路径, 最耗时函数的文本摘要)
+        """
+        if self.engine == 'pyinstrument':
+            path = _profile_path(self.name, '.html')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(self._profiler.output_html())
+            return path, self._profiler.output_text(unicode=True)
+
+        path = _profile_path(self.name, '.prof')
+        self._profiler.dump_stats(path)
+        stream = io.StringIO()
+        stats = pstats.Stats(self._profiler, stream=stream)
+        stats.sort_stats('cumulative').print_stats(self.top_n)
+        return path, stream.getvalue()
+
+
+def print_summary(profile, path, summary):
+    """把剖析摘要打印到运行日志"""
+    print("=" * 60)
+    print(f"性能剖析 [{profile.name}] 用时 {profile.elapsed:.3f}s，已保存到 {path}")
+    print("=" * 60)
+    print(summary.rstrip())
+
+
+def run_profiled(name, func, *args, enabled=None, **kwargs):
+    """
+    调用 func(*args, **kwargs)；需要剖析时（enabled 为None时按 profile_requested() 判断）
+    记录整个调用，结束后写文件并打印摘要（func 抛出异常时同样保存）
+
+    Returns:
+    --------
+    func 的返回值
+    """
+    if enabled is None:
+        enabled = profile_requested()
+    if not enabled:
+        return func(*args, **kwargs)
+
+    profile = Profile(name)
+    profile.start()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        profile.stop()
+        path, summary = profile.save()
+        print_summary(profile, path, summary)
+
+
+def should_profile_request(path):
+    """按 PROFILE_CONFIG['requests'] 判断是否剖析该请求路径"""
+    rule = PROFILE_CONFIG['requests']
+    if not rule or rule.lower() in ('0', 'false', 'no'):
+        return False
+    return rule.lower() in ('1', 'true', 'yes', 'all') or path.startswith(rule)
+
+
+def install_request_profiler(app):
+    """
+    为 Flask 应用注册按请求剖析的钩子（由 STOCK_PROFILE_REQUESTS 控制，未设置时不做任何事）
+
+    同一时间只剖析一个请求，其他并发请求正常处理不剖析
+    """
+    from flask import g, request
+
+    @app.before_request
+    def _start_request_profile():
+        if not should_profile_request(request.path) or not _request_lock.acquire(blocking=False):
+            return
+        profile = Profile(f"{request.method}{request.path}")
+        try:
+            profile.start()
+        except ValueError:
+            # 已有其他剖析器在运行（例如整个进程在 --profile 下启动）
+            _request_lock.release()
+            return
+        g.request_profile = profile
+
+    @app.teardown_request
+    def _stop_request_profile(exc=None):
+        profile = g.pop('request_profile', None)
+        if profile is None:
+            return
+        try:
+            profile.stop()
+            if profile.elapsed >= PROFILE_CONFIG['min_seconds']:
+                path, summary = profile.save()
+                print_summary(profile, path, summary)
+        finally:
+            _request_lock.release()
@@ -0,0 +1,75 @@
+"""
+选股结果文件的进程内缓存
+按文件的 mtime 和大小判断是否变化，未变化时直接返回已解析的字典；
+写入方通过临时文件 + os.replace 原子替换，读取方不会读到写了一半的文件。
+"""
+
+import os
+import json
+import threading
+
+
+def write_json_atomic(path, data):
+    """把数据写成JSON：先写同目录下的临时文件，再原子替换目标文件"""
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    tmp_file = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_file, path)
+
+
+class JsonFileCache:
+    """
+    JSON文件的进程内缓存
+
+    缓存项为 (文件签名, 数据) 元组，整体替换，读取时无需加锁；
+    数据被所有请求共享，调用方不应修改返回的字典。
+    """
+
+    def __init__(self, path):
+        """
+        Parameters:
+        -----------
+        path : str
+            JSON文件路径
+        """
+        self.path = path
+        self._entry = None
+        self._lock = threading.Lock()
+
+    def _signature(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def get(self):
+        """返回文件内容，文件不存在或无法解析时返回None"""
+        signature = self._signature()
+        if signature is None:
+            return None
+        entry = self._entry
+        if entry is not None and entry[0] == signature:
+            return entry[1]
+
+        with self._lock:
+            # 等锁期间可能已被其他线程加载
+            entry = self._entry
+            if entry is not None and entry[0] == signature:
+                return entry[1]
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"加载缓存数据失败: {e}")
+                return None
+            self._entry = (signature, data)
+            return data
+
+    def put(self, data):
+        """写入文件并直接更新缓存（不再重新解析）"""
+        with self._lock:
+            write_json_atomic(self.path, data)
+            self._entry = (self._signature(), data)
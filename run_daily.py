@@ -3,13 +3,19 @@
 简化版每日选股运行脚本
 """
 
-import akshare as ak
 import pandas as pd
 import datetime
 import time
 import warnings
 warnings.filterwarnings('ignore')
 
+from data_store import STOCK_STORE
+from data_provider import get_provider
+from sector_cache import SECTOR_CACHE
+from async_fetch import AsyncFetcher
+from metrics import METRICS
+from incremental_indicators import INDICATOR_STATES, screen_states
+
 # ==========================================
 # 策略参数设置
 # ==========================================
@@ -23,6 +29,32 @@ STRATEGY_PARAMS = {
     'pullback_lookback': 5,        # 回调考察窗口 (看过去几天是否跌下来过)
 }
 
+# 详情页指标快照保留的K线数量
+SNAPSHOT_BARS = 60
+
+# 各阶段耗时在运行指标中的名称
+STAGE_METRICS = {
+    '股票池': 'stage.universe',
+    '获取数据': 'stage.fetch',
+    '筛选': 'stage.screen',
+    '板块过滤': 'stage.sector_filter',
+    '指标快照': 'stage.snapshot',
+}
+
+# 数据获取参数
+FETCH_PARAMS = {
+    'max_workers': 8,              # 同时进行的请求数
+    'requests_per_second': 10,     # 每秒最多请求数（包括重试）
+    'max_retries': 2,              # 每只股票最多尝试次数
+    'backoff': 0.3,                # 重试退避基数（秒）
+}
+
+# 流式扫描参数（scan）
+SCAN_PARAMS = {
+    'batch_size': 200,             # 攒够该数量的股票就筛选一次
+    'flush_seconds': 1.0,          # 距上次筛选超过该秒数时不等攒满一批
+}
+
 
 def add_market_prefix(code):
     """为股票代码添加市场前缀"""
@@ -43,23 +75,44 @@ def add_market_prefix(code):
         return f"sz{code}"
 
 
-def get_stock_data(symbol, max_retries=2):
-    """获取单只股票的日线数据"""
+def get_stock_data(symbol, max_retries=2, use_store=True, raise_errors=False):
+    """
+    获取单只股票的日线数据（优先读取本地数据仓库，只下载增量）
+
+    raise_errors 为True时接口异常直接抛出（由调用方的重试策略判断是否重试），否则返回None
+    """
     symbol_with_prefix = add_market_prefix(symbol)
+    start_date = STRATEGY_PARAMS['start_date']
+    end_date = datetime.datetime.now().strftime('%Y%m%d')
+
+    if not use_store:
+        return download_stock_data(symbol_with_prefix, start_date, end_date, max_retries, raise_errors)
 
+    return STOCK_STORE.update(
+        symbol_with_prefix,
+        lambda start, end: download_stock_data(symbol_with_prefix, start, end, max_retries, raise_errors),
+        start_date,
+        end_date
+    )
+
+
+def download_stock_data(symbol_with_prefix, start_date, end_date, max_retries=2, raise_errors=False):
+    """从接口下载单只股票指定日期范围的日线数据，raise_errors 为True时接口异常直接抛出"""
     for attempt in range(max_retries):
         try:
             if attempt > 0:
                 time.sleep(0.3 * attempt)
 
-            df = ak.stock_zh_a_daily(
-                symbol=symbol_with_prefix,
-                start_date=STRATEGY_PARAMS['start_date'],
-                end_date=datetime.datetime.now().strftime('%Y%m%d'),
-                adjust="qfq"
-            )
+            with METRICS.timer('fetch.request'):
+                df = get_provider().stock_daily(
+                    symbol_with_prefix,
+                    start_date,
+                    end_date,
+                    adjust="qfq"
+                )
 
             if df is None or df.empty:
+                METRICS.inc('fetch.empty')
                 continue
 
             df['date'] = pd.to_datetime(df['date'])
@@ -67,7 +120,11 @@ def get_stock_data(symbol, max_retries=2):
             df = df.sort_index()
             return df
 
-        except Exception:
+        except Exception as e:
+            if raise_errors:
+                raise
+            # 按异常类型统计失败原因
+            METRICS.inc(f'fetch.errors.{type(e).__name__}')
             continue
 
     return None
@@ -83,6 +140,62 @@ def calculate_indicators(df):
     return df
 
 
+def _json_number(value, digits=None):
+    """NaN 转为 None，便于写入JSON"""
+    if value is None or pd.isna(value):
+        return None
+    value = float(value)
+    return round(value, digits) if digits is not None else value
+
+
+def _json_int(value):
+    """NaN 转为 None，其余转为整数（成交量）"""
+    if value is None or pd.isna(value):
+        return None
+    return int(value)
+
+
+def build_indicator_snapshot(df, n_bars=SNAPSHOT_BARS):
+    """
+    由 calculate_indicators 之后的数据生成详情页使用的指标快照
+
+    Returns:
+    --------
+    dict : {'kline': 最近 n_bars 根K线及均线, 'indicators': 最新一根K线的指标}
+    """
+    tail = df.tail(n_bars)
+    kline = []
+    for date, row in zip(tail.index, tail.itertuples(index=False)):
+        kline.append({
+            'date': date.strftime('%Y-%m-%d'),
+            'open': _json_number(row.open),
+            'close': _json_number(row.close),
+            'high': _json_number(row.high),
+            'low': _json_number(row.low),
+            'volume': _json_int(row.volume),
+            'ma5': _json_number(row.MA5),
+            'ma10': _json_number(row.MA10),
+            'ma20': _json_number(row.MA20),
+            'ma60': _json_number(row.MA60)
+        })
+
+    last = df.iloc[-1]
+    volumes = df['volume'].tail(5)
+    volume_today = _json_int(last['volume'])
+    volume_ma5 = _json_number(volumes.mean()) if len(volumes) >= 5 else None
+    indicators = {
+        'ma5': _json_number(last['MA5'], 2),
+        'ma10': _json_number(last['MA10'], 2),
+        'ma20': _json_number(last['MA20'], 2),
+        'ma60': _json_number(last['MA60'], 2),
+        'high_60d': _json_number(last['Rolling_Max'], 2),
+        'volume_today': volume_today,
+        'volume_ma5': round(volume_ma5, 0) if volume_ma5 else None,
+        'volume_ratio': round(volume_today / volume_ma5, 2) if volume_today and volume_ma5 else None
+    }
+    return {'kline': kline, 'indicators': indicators}
+
+
 def check_strategy(df):
     """核心选股逻辑"""
     if len(df) < STRATEGY_PARAMS['high_window'] + 5:
@@ -120,30 +233,15 @@ def check_strategy(df):
     return True, f"现价:{today['close']:.2f}, 回撤:{drawdown*100:.1f}%"
 
 
-def main(return_data=False):
-    """
-    运行选股策略
-
-    Args:
-        return_data: 如果为True，返回选股数据而不是打印
-
-    Returns:
-        如果return_data为True，返回选股结果字典
-    """
-    if not return_data:
-        print("=" * 60)
-        print("A股选股策略 - 简化版")
-        print("策略: 双均线多头 + 屡创新高 + 回调 + 站稳5日线")
-        print("建议: 买入后最高点回撤4%清仓")
-        print("=" * 60)
-
-    # 获取板块资金流
-    print("获取资金流入最多的3个板块...")
+def get_sector_stock_list(top_n=3):
+    """资金流入最多的前N个板块的成分股，获取失败时返回None"""
+    print(f"获取资金流入最多的{top_n}个板块...")
     try:
-        df_flow = ak.stock_sector_fund_flow_rank(indicator="今日", sector_type="行业资金流")
+        with METRICS.timer('sector_flow'):
+            df_flow = SECTOR_CACHE.fetch_fund_flow()
         if df_flow is None or df_flow.empty:
             print("获取板块数据失败")
-            return
+            return None
 
         target_col = '今日主力净流入-净额'
         if target_col not in df_flow.columns:
@@ -152,11 +250,20 @@ def main(return_data=False):
                 target_col = cols[0]
             else:
                 print("无法找到资金流列")
-                return
+                return None
 
         df_flow[target_col] = pd.to_numeric(df_flow[target_col], errors='coerce')
         df_flow = df_flow.sort_values(by=target_col, ascending=False)
-        top_sectors = df_flow.head(3)
+        top_sectors = df_flow.head(top_n)
+
+        def fetch_constituents(sector_name):
+            with METRICS.timer('constituents'):
+                return SECTOR_CACHE.get_constituents(sector_name)
+
+        # 各板块的成分股并发获取，按资金流排名顺序输出
+        fetcher = AsyncFetcher(fetch_constituents, concurrency=top_n)
+        with fetcher:
+            constituents = dict(fetcher.map(top_sectors['名称']))
 
         stock_list = []
         for _, row in top_sectors.iterrows():
@@ -165,55 +272,391 @@ def main(return_data=False):
             flow_str = f"{flow_amount/100000000:.2f}亿" if abs(flow_amount) > 100000000 else f"{flow_amount/10000:.2f}万"
             print(f"  【{sector_name}】 (净流入: {flow_str})")
 
-            try:
-                df_cons = ak.stock_board_industry_cons_em(symbol=sector_name)
-                for _, stock in df_cons.iterrows():
-                    stock_list.append({
-                        'code': stock['代码'],
-                        'name': stock['名称'],
-                        'sector': sector_name
-                    })
-            except Exception as e:
-                print(f"    获取成分股失败: {e}")
+            df_cons = constituents.get(sector_name)
+            if df_cons is None:
+                METRICS.inc('constituents.failures')
+                print(f"    获取成分股失败: {fetcher.errors.get(sector_name, '无数据')}")
+                continue
+            for _, stock in df_cons.iterrows():
+                stock_list.append({
+                    'code': stock['代码'],
+                    'name': stock['名称'],
+                    'sector': sector_name
+                })
 
     except Exception as e:
         print(f"获取板块数据失败: {e}")
-        return
+        return None
+
+    return stock_list
+
+
+def get_market_stock_list():
+    """全市场A股列表（按天缓存），板块统一记为"全市场"，获取失败时返回None"""
+    print("获取全市场股票列表...")
+    try:
+        with METRICS.timer('market_list'):
+            df_market = SECTOR_CACHE.get_market_list()
+    except Exception as e:
+        print(f"获取全市场股票列表失败: {e}")
+        return None
+    return [{'code': code, 'name': name, 'sector': '全市场'}
+            for code, name in zip(df_market['代码'], df_market['名称'])]
+
+
+def latest_bar_date(now=None):
+    """
+    最近一个应当已有日线的交易日（按工作日估算，收盘前取上一个工作日）
 
+    节假日会被当作交易日，只会导致多请求一次增量，不影响结果
+    """
+    now = now or datetime.datetime.now()
+    day = now.date()
+    if now.hour < 16:
+        day -= datetime.timedelta(days=1)
+    while day.weekday() >= 5:
+        day -= datetime.timedelta(days=1)
+    return pd.Timestamp(day)
+
+
+def iter_price_data(codes, progress=None, stats=None):
+    """
+    逐只产出一批股票的日线数据
+
+    本地数据仓库中已是最新的股票直接读取并最先产出，其余的通过 AsyncFetcher 限速并发增量下载，
+    按下载完成的顺序产出。接口异常由 AsyncFetcher 按 is_retryable_error 判断是否重试，
+    最终下载失败的股票使用本地已有的（未更新的）数据
+
+    Parameters:
+    -----------
+    codes : list
+        股票代码
+    progress : callable
+        可选的进度回调
+    stats : dict
+        可选，结束后写入下载统计（requests/retries/failures）
+
+    Yields:
+    -------
+    tuple : (code, DataFrame)，下载失败时为 (code, None)
+    """
+    start_date = STRATEGY_PARAMS['start_date']
+    end_date = datetime.datetime.now().strftime('%Y%m%d')
+    expected = latest_bar_date()
+
+    if progress is not None:
+        progress(stage='获取数据', done=0, total=len(codes))
+    store_hits = 0
+    to_fetch = []
+    for code in codes:
+        symbol_with_prefix = add_market_prefix(code)
+        last = STOCK_STORE.last_date(symbol_with_prefix)
+        df = STOCK_STORE.load(symbol_with_prefix, start_date, end_date) if last is not None and last >= expected else None
+        if df is None:
+            to_fetch.append(code)
+            continue
+        store_hits += 1
+        if progress is not None:
+            progress(done=store_hits)
+        yield code, df
+    print(f"本地已是最新 {store_hits} 只，需要下载 {len(to_fetch)} 只")
+    METRICS.inc('fetch.store_hits', store_hits)
+    METRICS.inc('fetch.symbols', len(to_fetch))
+
+    def fetch_one(code):
+        # 单次请求，异常交给 AsyncFetcher 判断是否重试；没有数据（如停牌、退市）不重试
+        with METRICS.timer('fetch.symbol'):
+            return get_stock_data(code, max_retries=1, raise_errors=True)
+
+    fetcher = AsyncFetcher(
+        fetch_one,
+        concurrency=FETCH_PARAMS['max_workers'],
+        requests_per_second=FETCH_PARAMS['requests_per_second'],
+        max_retries=FETCH_PARAMS['max_retries'],
+        backoff=FETCH_PARAMS['backoff'],
+        retry_on_none=False
+    )
+
+    with fetcher:
+        for done, (code, df) in enumerate(fetcher.run(to_fetch), store_hits + 1):
+            if df is None:
+                if code in fetcher.errors:
+                    # 按异常类型统计失败原因（每只失败的股票记一次）
+                    METRICS.inc(f'fetch.errors.{type(fetcher.errors[code]).__name__}')
+                df = STOCK_STORE.load(add_market_prefix(code), start_date, end_date)
+            if progress is not None:
+                progress(done=done)
+            if done % 100 == 0:
+                print(f"进度: {done}/{len(codes)}...")
+            yield code, df
+
+    METRICS.inc('fetch.attempts', fetcher.stats['requests'])
+    METRICS.inc('fetch.retries', fetcher.stats['retries'])
+    METRICS.inc('fetch.failures', fetcher.stats['failures'])
+    if stats is not None:
+        stats.update(fetcher.stats)
+
+
+def fetch_price_data(codes, progress=None):
+    """
+    获取一批股票的日线数据（iter_price_data 的结果收集成字典）
+
+    Returns:
+    --------
+    tuple : ({code: DataFrame}, 下载统计)
+    """
+    stats = {}
+    price_data = {code: df for code, df in iter_price_data(codes, progress, stats) if df is not None}
+    return price_data, stats
+
+
+def get_stock_universe(universe='sectors'):
+    """
+    股票池
+
+    Parameters:
+    -----------
+    universe : str
+        'sectors' 为资金流入前3板块的成分股，'all' 为全市场
+
+    Returns:
+    --------
+    tuple : (股票列表, 去重并剔除ST/退市股后的待扫描代码)，获取失败时股票列表为None
+    """
+    stock_list = get_market_stock_list() if universe == 'all' else get_sector_stock_list(3)
     if not stock_list:
-        print("未获取到股票列表")
-        return
+        return None, []
+    codes = list(dict.fromkeys(stock['code'] for stock in stock_list
+                               if 'ST' not in stock['name'] and '退' not in stock['name']))
+    return stock_list, codes
+
+
+def scan(codes, progress=None, batch_size=None, flush_seconds=None, timings=None, stats=None, snapshots=True):
+    """
+    边获取数据边筛选，每只股票筛选完成后立即产出，不必等全部股票扫描结束
+
+    下载完成的股票攒成一批（达到 batch_size 只，或距上次筛选超过 flush_seconds 秒），
+    对这一批筛选一次。每只股票的判断只依赖自己的K线，结果与全部股票一次筛选相同。
+    指标不对全部历史重新计算：INDICATOR_STATES 中每只股票的持久化状态只加入新K线，
+    筛选和指标快照都使用状态中的最近K线和指标。
+
+    Parameters:
+    -----------
+    codes : list
+        股票代码
+    progress : callable
+        可选的进度回调
+    batch_size : int
+        每批股票数，默认 SCAN_PARAMS['batch_size']
+    flush_seconds : float
+        默认 SCAN_PARAMS['flush_seconds']，为0时只按数量分批
+    timings : dict
+        可选，累加 '获取数据'/'筛选'/'指标快照' 各阶段耗时（秒）
+    stats : dict
+        可选，结束后写入下载统计
+    snapshots : bool
+        是否为入选股票生成指标快照（详情页使用）；命令行批量运行不需要
+
+    Yields:
+    -------
+    tuple : (symbol, selected, reason, price, indicators)，按完成顺序；price 为最新收盘价（没有数据时为None），
+            indicators 为入选股票的指标快照（build_indicator_snapshot 的结果），未入选或不生成快照时为None
+    """
+    batch_size = batch_size or SCAN_PARAMS['batch_size']
+    flush_seconds = SCAN_PARAMS['flush_seconds'] if flush_seconds is None else flush_seconds
+    spent = {'获取数据': 0.0, '筛选': 0.0, '指标快照': 0.0}
+
+    def screen(batch):
+        stage_start = time.perf_counter()
+        with METRICS.timer('screen.indicators'):
+            states = {symbol: INDICATOR_STATES.update(add_market_prefix(symbol), df, STRATEGY_PARAMS)
+                      for symbol, df in batch.items()}
+        results = screen_states(states, STRATEGY_PARAMS, style='daily')
+        spent['筛选'] += time.perf_counter() - stage_start
+
+        stage_start = time.perf_counter()
+        scanned = []
+        for symbol, df in batch.items():
+            is_selected, reason = results.get(symbol, (False, "数据不足"))
+            price = _json_number(df['close'].iloc[-1])
+            indicators = None
+            if is_selected and snapshots:
+                indicators = build_indicator_snapshot(states[symbol].frame())
+            scanned.append((symbol, is_selected, reason, price, indicators))
+        spent['指标快照'] += time.perf_counter() - stage_start
+        return scanned
+
+    scan_start = time.perf_counter()
+    batch = {}
+    batch_start = None
+    for symbol, df in iter_price_data(codes, progress, stats):
+        if df is None:
+            yield symbol, False, "数据不足", None, None
+            continue
+        batch[symbol] = df
+        batch_start = batch_start or time.perf_counter()
+        if len(batch) >= batch_size or (flush_seconds and time.perf_counter() - batch_start >= flush_seconds):
+            yield from screen(batch)
+            batch, batch_start = {}, None
+    if batch:
+        yield from screen(batch)
+
+    spent['获取数据'] = time.perf_counter() - scan_start - spent['筛选'] - spent['指标快照']
+    if timings is not None:
+        for name, seconds in spent.items():
+            timings[name] = timings.get(name, 0.0) + seconds
+
+
+def selection_row(stock, sector, reason, price):
+    """结果文件中一只入选股票的记录"""
+    return {
+        '板块': sector,
+        '代码': stock['code'],
+        '名称': stock['name'],
+        '最新价': price,
+        '理由': reason,
+        # 简单判断趋势强度：价格高于MA5为强，否则为弱
+        # 这里简化处理，实际应该计算真实趋势
+        '趋势强度': '强'  # 暂时标记为强，实际应该根据技术指标判断
+    }
+
+
+def build_selection(stock_list, scanned, sector_of=None):
+    """
+    按原股票池顺序整理入选股票
 
-    print(f"\n共获取到 {len(stock_list)} 只股票，开始扫描...")
+    Parameters:
+    -----------
+    stock_list : list
+        股票池
+    scanned : dict
+        {symbol: (selected, reason, price, indicators)}，scan 的结果
+    sector_of : dict
+        板块后置过滤 {code: 板块}，为None时不过滤
 
-    # 扫描股票
+    Returns:
+    --------
+    tuple : (入选股票记录列表, {code: 指标快照})，没有快照的股票不出现在快照字典中
+    """
     selected_stocks = []
-    for i, stock in enumerate(stock_list):
+    snapshots = {}
+    for stock in stock_list:
         symbol = stock['code']
-        name = stock['name']
-
-        if 'ST' in name or '退' in name:
+        is_selected, reason, price, indicators = scanned.get(symbol, (False, "数据不足", None, None))
+        if not is_selected:
             continue
+        sector = stock['sector']
+        if sector_of is not None:
+            if symbol not in sector_of:
+                continue
+            sector = sector_of[symbol]
+        if indicators is not None:
+            snapshots[symbol] = indicators
+        selected_stocks.append(selection_row(stock, sector, reason, price))
+    return selected_stocks, snapshots
 
-        if (i + 1) % 20 == 0:
-            print(f"进度: {i+1}/{len(stock_list)}...")
-
-        df = get_stock_data(symbol)
-        if df is not None and len(df) > STRATEGY_PARAMS['high_window']:
-            df = calculate_indicators(df)
-            is_selected, reason = check_strategy(df)
-
-            if is_selected:
-                print(f"✓ {symbol} {name}: {reason}")
-                selected_stocks.append({
-                    '板块': stock['sector'],
-                    '代码': symbol,
-                    '名称': name,
-                    '最新价': df['close'].iloc[-1],
-                    '理由': reason
-                })
 
-        time.sleep(0.1)
+def build_result(selected_stocks, snapshots):
+    """
+    生成保存到缓存文件的选股结果
+
+    Returns:
+    --------
+    dict : {'date', 'stocks', 'stats', 'strategy_params', 'indicator_snapshot'}
+    """
+    # 计算统计信息
+    by_sector = {}
+    by_trend = {'强': 0, '弱': 0}
+
+    for stock in selected_stocks:
+        sector = stock['板块']
+        by_sector[sector] = by_sector.get(sector, 0) + 1
+
+    stats = {
+        'total': len(selected_stocks),
+        'by_sector': by_sector,
+        'by_trend': by_trend
+    }
+
+    return {
+        'date': datetime.datetime.now().strftime('%Y-%m-%d'),
+        'stocks': selected_stocks,
+        'stats': stats,
+        'strategy_params': STRATEGY_PARAMS,
+        # 选中股票的指标快照，保存时单独写入 selected_stocks_indicators.json
+        'indicator_snapshot': snapshots
+    }
+
+
+def main(return_data=False, progress=None, universe='sectors', top_sectors=None):
+    """
+    运行选股策略
+
+    Args:
+        return_data: 如果为True，返回选股数据而不是打印
+        progress: 可选的进度回调 progress(stage=..., done=..., total=...)
+        universe: 股票池，'sectors' 为资金流入前3板块的成分股，'all' 为全市场
+        top_sectors: 全市场模式下可选的板块后置过滤：只保留资金流入前N板块中的入选股票
+
+    Returns:
+        如果return_data为True，返回选股结果字典
+    """
+    if not return_data:
+        print("=" * 60)
+        print("A股选股策略 - 简化版")
+        print("策略: 双均线多头 + 屡创新高 + 回调 + 站稳5日线")
+        print("建议: 买入后最高点回撤4%清仓")
+        print("=" * 60)
+
+    if progress is None:
+        progress = lambda **kwargs: None
+
+    # 各阶段耗时（秒）
+    timings = {}
+    stage_start = time.perf_counter()
+
+    # 股票池
+    progress(stage='获取股票池')
+    stock_list, codes = get_stock_universe(universe)
+    if not stock_list:
+        print("未获取到股票列表")
+        return
+    timings['股票池'] = time.perf_counter() - stage_start
+
+    # 获取日线数据并筛选：同一只股票只获取一次。这里全部获取后一次筛选（批量运行吞吐量最高），
+    # 需要尽早看到结果时（Web刷新）直接使用 scan() 按批产出
+    print(f"\n共获取到 {len(stock_list)} 只股票，开始扫描 {len(codes)} 只...")
+    fetch_stats = {}
+    scanned = {}
+    # 指标快照只在返回数据（Web刷新）时需要
+    for symbol, is_selected, reason, price, indicators in scan(codes, progress, batch_size=max(len(codes), 1),
+                                                               flush_seconds=0, timings=timings,
+                                                               stats=fetch_stats, snapshots=return_data):
+        scanned[symbol] = (is_selected, reason, price, indicators)
+    if fetch_stats['failures']:
+        print(f"获取失败 {fetch_stats['failures']} 只，重试 {fetch_stats['retries']} 次")
+
+    # 板块后置过滤
+    sector_of = None
+    if universe == 'all' and top_sectors:
+        stage_start = time.perf_counter()
+        sector_list = get_sector_stock_list(top_sectors) or []
+        sector_of = {}
+        for stock in sector_list:
+            sector_of.setdefault(stock['code'], stock['sector'])
+        timings['板块过滤'] = time.perf_counter() - stage_start
+
+    # 按原股票池顺序输出
+    selected_stocks, snapshots = build_selection(stock_list, scanned, sector_of)
+    for stock in selected_stocks:
+        print(f"✓ {stock['代码']} {stock['名称']}: {stock['理由']}")
+
+    METRICS.inc('pipeline.runs')
+    METRICS.inc('pipeline.symbols', len(codes))
+    METRICS.inc('pipeline.selected', len(selected_stocks))
+    for name, seconds in timings.items():
+        METRICS.observe(STAGE_METRICS[name], seconds)
+    print("各阶段耗时: " + ", ".join(f"{name} {seconds:.1f}s" for name, seconds in timings.items()))
 
     # 输出结果
     if not return_data:
@@ -242,33 +685,27 @@ def main(return_data=False):
 
     # 返回数据
     if return_data:
-        # 计算统计信息
-        by_sector = {}
-        by_trend = {'强': 0, '弱': 0}
-
-        for stock in selected_stocks:
-            sector = stock['板块']
-            by_sector[sector] = by_sector.get(sector, 0) + 1
-
-            # 简单判断趋势强度：价格高于MA5为强，否则为弱
-            # 这里简化处理，实际应该计算真实趋势
-            stock['趋势强度'] = '强'  # 暂时标记为强，实际应该根据技术指标判断
-
-        stats = {
-            'total': len(selected_stocks),
-            'by_sector': by_sector,
-            'by_trend': by_trend
-        }
-
-        return {
-            'date': datetime.datetime.now().strftime('%Y-%m-%d'),
-            'stocks': selected_stocks,
-            'stats': stats,
-            'strategy_params': STRATEGY_PARAMS
-        }
+        return build_result(selected_stocks, snapshots)
     else:
         return None
 
 
+def parse_args(argv=None):
+    """命令行参数"""
+    import argparse
+    parser = argparse.ArgumentParser(description='A股每日选股')
+    parser.add_argument('--universe', choices=['sectors', 'all'], default='sectors',
+                        help='股票池: sectors=资金流入前3板块成分股 (默认), all=全市场')
+    parser.add_argument('--top-sectors', type=int, default=None,
+                        help='全市场模式下只保留资金流入前N板块中的入选股票')
+    parser.add_argument('--profile', action='store_true',
+                        help='剖析本次运行，结果写到 logs/ 并打印最耗时的函数（也可设置 STOCK_PROFILE=1）')
+    return parser.parse_args(argv)
+
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    from profiling import run_profiled
+    args = parse_args()
+    run_profiled('run_daily', main, universe=args.universe, top_sectors=args.top_sectors,
+                 enabled=args.profile or None)
+    print(METRICS.summary_line())
\ No newline at end of file
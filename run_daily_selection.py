@@ -10,7 +10,9 @@ import datetime
 # 添加当前目录到Python路径
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-def main():
+from metrics import METRICS
+
+def main(universe='sectors', top_sectors=None):
     """运行每日选股并保存结果"""
     print(f"=== 开始每日选股 ({datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}) ===")
 
@@ -19,7 +21,7 @@ def main():
         from run_daily import main as run_daily_selection
 
         # 运行选股策略（返回数据模式）
-        result = run_daily_selection(return_data=True)
+        result = run_daily_selection(return_data=True, universe=universe, top_sectors=top_sectors)
 
         if result is None:
             print("选股返回空结果")
@@ -28,16 +30,17 @@ def main():
         print(f"选股完成！共选中 {len(result['stocks'])} 只股票")
         print(f"板块分布: {result['stats']['by_sector']}")
 
-        # 保存到缓存文件
-        import json
+        # 保存到缓存文件（原子替换，Web应用按文件修改时间自动重新加载）
+        # 先写指标快照，保证结果文件更新时对应的快照已经就绪
+        from result_cache import write_json_atomic
         cache_file = 'cache/selected_stocks_cache.json'
-
-        # 确保缓存目录存在
-        if not os.path.exists('cache'):
-            os.makedirs('cache')
-
-        with open(cache_file, 'w', encoding='utf-8') as f:
-            json.dump(result, f, ensure_ascii=False, indent=2)
+        indicator_file = 'cache/selected_stocks_indicators.json'
+        with METRICS.timer('write_json'):
+            write_json_atomic(indicator_file, {
+                'date': result['date'],
+                'stocks': result.pop('indicator_snapshot', {})
+            })
+            write_json_atomic(cache_file, result)
 
         print(f"结果已保存到: {cache_file}")
         print(f"=== 每日选股完成 ({datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}) ===")
@@ -49,6 +52,14 @@ def main():
         traceback.print_exc()
         return False
 
+    finally:
+        # 一行JSON汇总各阶段耗时与计数，便于从cron日志中对比
+        print(METRICS.summary_line())
+
 if __name__ == "__main__":
-    success = main()
+    from run_daily import parse_args
+    from profiling import run_profiled
+    args = parse_args()
+    success = run_profiled('run_daily_selection', main, universe=args.universe, top_sectors=args.top_sectors,
+                           enabled=args.profile or None)
     sys.exit(0 if success else 1)
\ No newline at end of file
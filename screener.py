@@ -0,0 +1,590 @@
+"""
+横截面向量化选股
+把多只股票的日线数据对齐成 (交易日序号 × 股票) 的价格矩阵，
+用NumPy布尔数组一次性计算 check_strategy 的四个条件
+"""
+
+import numpy as np
+import pandas as pd
+
+from indicator_cache import panel_fingerprint
+from metrics import METRICS
+from trading_calendar import TradingCalendar
+
+# ==========================================
+# 策略参数设置（与 run_daily.STRATEGY_PARAMS 保持一致）
+# ==========================================
+STRATEGY_PARAMS = {
+    'start_date': '20230101',      # 数据开始时间（用于计算均线）
+    'ma_short': 5,                 # 短期均线 (5日线)
+    'ma_mid': 20,                  # 中期均线
+    'ma_trend': 60,                # 趋势均线 (60日线)
+    'high_window': 60,             # 创新高的时间窗口 (60日新高)
+    'recent_days': 20,             # "屡创新高"考察的最近天数
+    'pullback_lookback': 5,        # 回调考察窗口 (看过去几天是否跌下来过)
+}
+
+# 筛选结果状态码，按 check_strategy 的判断顺序排列
+STATUS_SELECTED = 0
+STATUS_NO_DATA = 1
+STATUS_NO_TREND = 2
+STATUS_NO_NEW_HIGH = 3
+STATUS_NO_PULLBACK = 4
+STATUS_NOT_FIRM = 5
+
+# 未入选的理由，与 run_daily.check_strategy / main.check_strategy 的返回值一致
+REASONS = {
+    'daily': {
+        STATUS_NO_DATA: "数据不足",
+        STATUS_NO_TREND: "趋势未确立",
+        STATUS_NO_NEW_HIGH: "近期未创出新高",
+        STATUS_NO_PULLBACK: "近期没有明显回调",
+        STATUS_NOT_FIRM: "今日未站稳5日线或收阴",
+    },
+    'main': {
+        STATUS_NO_DATA: "数据不足",
+        STATUS_NO_TREND: "趋势未确立(MA20<MA60或股价破位)",
+        STATUS_NO_NEW_HIGH: "近期未创出新高",
+        STATUS_NO_PULLBACK: "近期没有明显回调",
+        STATUS_NOT_FIRM: "今日未站稳5日线或收阴",
+    },
+}
+
+
+class BarPanel:
+    """
+    右对齐的价格矩阵
+
+    每列是一只股票按自身交易日排列的K线，最后一行是各自的最新一根K线，
+    历史较短的股票在顶部用NaN补齐。按K线序号而不是日历日期对齐，
+    与 check_strategy 对单只股票 df.iloc 取数的语义完全一致（停牌日不占位置）。
+    """
+
+    def __init__(self, symbols, dates, fields, n_bars):
+        """
+        Parameters:
+        -----------
+        symbols : list
+            股票代码，对应矩阵的列
+        dates : np.ndarray
+            (行数 × 股票数) 的 datetime64[ns] 矩阵，补齐处为NaT
+        fields : dict
+            {'open': 矩阵, 'high': 矩阵, 'close': 矩阵, ...}
+        n_bars : np.ndarray
+            每只股票的K线数量
+        """
+        self.symbols = list(symbols)
+        self.dates = dates
+        self.fields = fields
+        self.n_bars = n_bars
+        self._version = None
+        self._calendar = None
+        self._day_index = None
+
+    def __getitem__(self, field):
+        return self.fields[field]
+
+    @property
+    def shape(self):
+        return self.dates.shape
+
+    @property
+    def version(self):
+        """矩阵内容的指纹（指标缓存键的一部分），首次访问时计算"""
+        if self._version is None:
+            self._version = panel_fingerprint(self.symbols, self.fields)
+        return self._version
+
+    @property
+    def calendar(self):
+        """矩阵中出现的全部交易日（TradingCalendar），首次访问时构建"""
+        if self._calendar is None:
+            self._build_day_index()
+        return self._calendar
+
+    @property
+    def day_index(self):
+        """与价格矩阵同形状的交易日序号（int32，补齐处为-1），首次访问时构建"""
+        if self._day_index is None:
+            self._build_day_index()
+        return self._day_index
+
+    def _build_day_index(self):
+        valid = ~np.isnat(self.dates)
+        days = self.dates[valid]
+        self._calendar = TradingCalendar.from_dates(days)
+        self._day_index = np.full(self.dates.shape, -1, dtype=np.int32)
+        self._day_index[valid] = self._calendar.ordinals(days)
+
+
+def build_bar_panel(price_data, fields=('open', 'high', 'close')):
+    """
+    把 {code: DataFrame} 转换为右对齐的价格矩阵
+
+    Parameters:
+    -----------
+    price_data : dict
+        价格数据字典，格式：{code: pd.DataFrame}，以date为索引并按日期排序
+    fields : tuple
+        需要放入矩阵的列
+
+    Returns:
+    --------
+    BarPanel : 价格矩阵，空数据的股票不会出现在矩阵中
+    """
+    frames = [(code, df) for code, df in price_data.items() if df is not None and not df.empty]
+    symbols = [code for code, _ in frames]
+    n_bars = np.array([len(df) for _, df in frames], dtype=np.int64)
+    n_rows = int(n_bars.max()) if len(n_bars) else 0
+
+    dates = np.full((n_rows, len(frames)), np.datetime64('NaT'), dtype='datetime64[ns]')
+    matrices = {field: np.full((n_rows, len(frames)), np.nan) for field in fields}
+
+    for j, (_, df) in enumerate(frames):
+        start = n_rows - len(df)
+        dates[start:, j] = df.index.values
+        for field in fields:
+            matrices[field][start:, j] = df[field].to_numpy(dtype=np.float64)
+
+    return BarPanel(symbols, dates, matrices, n_bars)
+
+
+def _rolling_extreme(matrix, window, func, min_periods=None):
+    """
+    按列计算滚动极值（倍增法，每次把覆盖长度翻倍）
+
+    func 为 np.maximum/np.minimum 时窗口内有NaN结果即为NaN，
+    与 rolling(window).max() 一致；为 np.fmax/np.fmin 时忽略NaN
+    """
+    out = np.array(matrix, dtype=np.float64)
+    span = 1
+    while span * 2 <= window:
+        out[span:] = func(out[span:], out[:-span])
+        span *= 2
+    if span < window:
+        shift = window - span
+        out[shift:] = func(out[shift:], out[:-shift])
+    if min_periods is None:
+        out[:window - 1] = np.nan
+    return out
+
+
+def rolling_max(matrix, window, min_periods=None):
+    """
+    按列计算滚动最大值，结果与 DataFrame.rolling(window, min_periods).max() 一致
+
+    min_periods 为None时要求窗口内没有NaN；不为None时忽略NaN
+    （本模块只用到 None 和 1 两种情况）
+    """
+    func = np.maximum if min_periods is None else np.fmax
+    return _rolling_extreme(matrix, window, func, min_periods)
+
+
+def _window_sum(cumsum, window):
+    """由累加和得到长度为window的窗口和"""
+    out = cumsum.copy()
+    out[window:] -= cumsum[:-window]
+    return out
+
+
+def rolling_means(matrix, windows, tail=None):
+    """
+    按列计算多个窗口的滚动均值，结果与 Series.rolling(window).mean() 逐位一致
+
+    pandas 用带 Kahan 补偿的滑动和计算均值，这里把同样的加减步骤
+    在所有列上同时执行（按行循环，每步都是整行的向量运算），
+    并复现其"窗口内数值全相同时直接取该值"的处理，
+    保证 close > MA5 这类比较在平盘时与 check_strategy 的结果相同。
+
+    Parameters:
+    -----------
+    matrix : np.ndarray
+        (行数 × 列数) 的价格矩阵
+    windows : list
+        窗口长度列表
+    tail : int
+        只返回最后tail行的结果（滑动和仍需从头累计），为None时返回全部行
+
+    Returns:
+    --------
+    list : 与windows对应的均值矩阵
+    """
+    values = np.asarray(matrix, dtype=np.float64)
+    n_rows, n_cols = values.shape
+    windows = list(windows)
+    max_w = max(windows)
+    tail = n_rows if tail is None else min(tail, n_rows)
+
+    valid = ~np.isnan(values)
+    # NaN只出现在列首（补齐部分）时，把NaN当0加减不会改变滑动和的状态
+    has_gaps = bool((np.logical_or.accumulate(valid, axis=0) & ~valid).any())
+
+    padded = np.zeros((n_rows + max_w, n_cols))
+    padded[max_w:][valid] = values[valid]
+    padded_valid = np.zeros((n_rows + max_w, n_cols), dtype=bool)
+    padded_valid[max_w:] = valid
+    remove_offsets = max_w - np.asarray(windows)
+
+    shape = (len(windows), n_cols)
+    sums = np.empty((tail, len(windows), n_cols))
+    sum_x = np.zeros(shape)
+    comp_add = np.zeros(shape)
+    comp_remove = np.zeros(shape)
+    y = np.empty(shape)
+    total = np.empty(shape)
+
+    for t in range(n_rows):
+        # 移出窗口的值
+        rows = remove_offsets + t
+        np.negative(padded[rows], out=y)
+        y -= comp_remove
+        np.add(sum_x, y, out=total)
+        if has_gaps:
+            mask = padded_valid[rows]
+            np.copyto(comp_remove, total - sum_x - y, where=mask)
+            np.copyto(sum_x, total, where=mask)
+        else:
+            np.subtract(total, sum_x, out=comp_remove)
+            comp_remove -= y
+            sum_x, total = total, sum_x
+
+        # 加入窗口的值
+        np.subtract(padded[max_w + t], comp_add, out=y)
+        np.add(sum_x, y, out=total)
+        if has_gaps:
+            mask = valid[t]
+            np.copyto(comp_add, total - sum_x - y, where=mask)
+            np.copyto(sum_x, total, where=mask)
+        else:
+            np.subtract(total, sum_x, out=comp_add)
+            comp_add -= y
+            sum_x, total = total, sum_x
+
+        if t >= n_rows - tail:
+            sums[t - (n_rows - tail)] = sum_x
+
+    # 只在需要输出的行附近计算计数类统计
+    lo = max(0, n_rows - tail - max_w)
+    seg = values[lo:]
+    seg_valid = valid[lo:]
+    valid_cs = np.cumsum(seg_valid, axis=0, dtype=np.int64)
+    neg_cs = np.cumsum(seg_valid & np.signbit(seg), axis=0, dtype=np.int64)
+    has_negative = bool(neg_cs[-1].any()) if len(seg) else False
+    changed = np.ones(seg.shape, dtype=bool)
+    changed[1:] = ~(seg[1:] == seg[:-1])
+    changed_cs = np.cumsum(changed, axis=0, dtype=np.int64)
+
+    out_rows = slice(len(seg) - tail, None)
+    results = []
+    for i, window in enumerate(windows):
+        nobs = _window_sum(valid_cs, window)[out_rows]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            result = sums[:, i] / nobs
+        if has_negative:
+            neg_ct = _window_sum(neg_cs, window)[out_rows]
+            result[(neg_ct == 0) & (result < 0)] = 0.0
+            result[(neg_ct == nobs) & (result > 0)] = 0.0
+        else:
+            result[result < 0] = 0.0
+
+        # 窗口内数值全部相同时直接取该值
+        flat = np.zeros(seg.shape, dtype=bool)
+        if window <= len(seg):
+            flat[window - 1:] = (changed_cs[window - 1:] - changed_cs[:len(seg) - window + 1]) == 0
+        flat = flat[out_rows]
+        result[flat] = seg[out_rows][flat]
+
+        result[nobs < window] = np.nan
+        results.append(result)
+    return results
+
+
+def rolling_mean(matrix, window, tail=None):
+    """按列计算滚动均值，结果与 Series.rolling(window).mean() 逐位一致"""
+    return rolling_means(matrix, [window], tail=tail)[0]
+
+
+def compute_panel_indicators(panel, params=None, tail=None):
+    """
+    对整个价格矩阵计算 calculate_indicators 中的指标
+
+    Parameters:
+    -----------
+    panel : BarPanel
+        价格矩阵
+    params : dict
+        策略参数
+    tail : int
+        只返回最后tail行的指标，为None时返回全部行
+
+    Returns:
+    --------
+    dict : {'MA5', 'MA10', 'MA20', 'MA60', 'Rolling_Max'} -> 指标矩阵
+    """
+    params = params or STRATEGY_PARAMS
+    close = panel['close']
+    high = panel['high']
+    n_rows = close.shape[0]
+
+    ma5, ma10, ma20, ma60 = rolling_means(
+        close, [params['ma_short'], 10, params['ma_mid'], params['ma_trend']], tail=tail
+    )
+
+    window = params['high_window']
+    if tail is None:
+        high_max = rolling_max(high, window)
+    else:
+        tail = min(tail, n_rows)
+        high_max = rolling_max(high[max(0, n_rows - tail - window + 1):], window)[-tail:]
+
+    return {'MA5': ma5, 'MA10': ma10, 'MA20': ma20, 'MA60': ma60, 'Rolling_Max': high_max}
+
+
+def _evaluate(close, open_, ma5, ma10, ma20, ma60, global_rolling_max,
+              recent_max, has_pullback, bars, params):
+    """
+    逐元素判断四个条件，输入均为同形状数组
+
+    Returns:
+    --------
+    tuple : (状态码数组, 回撤数组, 均线金叉数组)
+    """
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cond_trend_up = (close > ma60) & (ma20 > ma60)
+        cond_new_high = recent_max >= global_rolling_max * 0.99
+        drawdown = (recent_max - close) / recent_max
+        cond_reasonable_drop = (0.03 < drawdown) & (drawdown < 0.20)
+        cond_firm = (close > ma5) & (close > open_)
+        is_golden_cross = ma5 > ma10
+
+    status = np.full(close.shape, STATUS_SELECTED, dtype=np.int8)
+    # 倒序赋值，使最先不满足的条件覆盖后面的条件
+    status[~cond_firm] = STATUS_NOT_FIRM
+    status[~(has_pullback | cond_reasonable_drop)] = STATUS_NO_PULLBACK
+    status[~cond_new_high] = STATUS_NO_NEW_HIGH
+    status[~cond_trend_up] = STATUS_NO_TREND
+    status[bars < params['high_window'] + 5] = STATUS_NO_DATA
+
+    return status, drawdown, is_golden_cross
+
+
+def format_reason(status, close, drawdown, golden_cross, style='daily'):
+    """生成与 check_strategy 一致的理由字符串"""
+    if status != STATUS_SELECTED:
+        return REASONS[style][status]
+    if style == 'main':
+        trend_strength = "强" if golden_cross else "弱"
+        return f"入选(趋势{trend_strength})! 现价:{close:.2f}, 回撤:{drawdown*100:.1f}%, MA20>MA60"
+    return f"现价:{close:.2f}, 回撤:{drawdown*100:.1f}%"
+
+
+def screen_panel(panel, params=None, indicators=None, style='daily'):
+    """
+    对价格矩阵中每只股票的最新一根K线执行选股
+
+    Parameters:
+    -----------
+    panel : BarPanel
+        右对齐的价格矩阵，需要 open/high/close
+    params : dict
+        策略参数，默认使用 STRATEGY_PARAMS
+    indicators : dict
+        已计算好的指标矩阵（compute_panel_indicators 的返回值，行须与价格矩阵末尾对齐），
+        为None时只计算最后几行
+    style : str
+        理由字符串格式：'daily' 对应 run_daily.check_strategy，'main' 对应 main.check_strategy
+
+    Returns:
+    --------
+    dict : {code: (is_selected, reason)}，与 check_strategy 的返回值一致
+    """
+    params = params or STRATEGY_PARAMS
+    if not panel.symbols:
+        return {}
+    recent_days = params['recent_days']
+    lookback = params['pullback_lookback']
+    tail = max(lookback, 1)
+    if indicators is None:
+        with METRICS.timer('screen.indicators'):
+            indicators = compute_panel_indicators(panel, params, tail=tail)
+
+    close = panel['close']
+    high = panel['high']
+
+    # 最近N天最高价（与 Series.max 一样忽略NaN）
+    recent_max = np.fmax.reduce(high[-recent_days:], axis=0)
+
+    # 回调窗口：不包含今天的最近 lookback-1 天
+    if lookback > 1:
+        has_pullback = (close[-lookback:-1] < indicators['MA5'][-lookback:-1]).any(axis=0)
+    else:
+        has_pullback = np.zeros(close.shape[1], dtype=bool)
+
+    status, drawdown, golden_cross = _evaluate(
+        close[-1], panel['open'][-1],
+        indicators['MA5'][-1], indicators['MA10'][-1], indicators['MA20'][-1], indicators['MA60'][-1],
+        indicators['Rolling_Max'][-1], recent_max, has_pullback, panel.n_bars, params
+    )
+
+    results = {}
+    for j, code in enumerate(panel.symbols):
+        reason = format_reason(status[j], close[-1, j], drawdown[j], golden_cross[j], style)
+        results[code] = (bool(status[j] == STATUS_SELECTED), reason)
+    return results
+
+
+def _memo(cache, key, compute):
+    """cache 为None时直接计算，否则按 key 从缓存（IndicatorCache / LRUCache）中取，没有时计算并放入"""
+    if cache is None:
+        return compute()
+    value = cache.get(key)
+    if value is None:
+        value = compute()
+        cache.put(key, value)
+    return value
+
+
+def evaluate_panel_history(panel, params=None, cache=None):
+    """
+    对价格矩阵的每一行（每只股票的每一根K线）执行选股判断
+
+    第t行的结果等于把该股票截取到这根K线后调用 check_strategy 的结果：
+    所有滚动量只依赖过去的数据，整张矩阵一次计算即可。
+
+    Parameters:
+    -----------
+    panel : BarPanel
+        价格矩阵，需要 open/high/close
+    params : dict
+        策略参数，默认使用 STRATEGY_PARAMS
+    cache : IndicatorCache
+        可选的滚动指标缓存，键为 (矩阵指纹, 指标名, 窗口)；参数扫描时不同参数组合
+        共用相同窗口的均线/最高价，不再重复计算
+
+    Returns:
+    --------
+    tuple : (状态码矩阵, 回撤矩阵, 均线金叉矩阵)，形状与价格矩阵相同
+    """
+    params = params or STRATEGY_PARAMS
+    close = panel['close']
+    high = panel['high']
+    n_rows = close.shape[0]
+    version = panel.version if cache is not None else None
+    if cache is None:
+        indicators = compute_panel_indicators(panel, params)
+    else:
+        # 逐个窗口计算的结果与 rolling_means 一次计算多个窗口逐位相同
+        indicators = {
+            name: _memo(cache, (version, 'mean', window), lambda window=window: rolling_mean(close, window))
+            for name, window in (('MA5', params['ma_short']), ('MA10', 10),
+                                 ('MA20', params['ma_mid']), ('MA60', params['ma_trend']))
+        }
+        indicators['Rolling_Max'] = _memo(cache, (version, 'max', params['high_window']),
+                                          lambda: rolling_max(high, params['high_window']))
+
+    # 最近N天最高价（包含当天，忽略NaN）
+    recent_max = _memo(cache, (version, 'recent_max', params['recent_days']),
+                       lambda: rolling_max(high, params['recent_days'], min_periods=1))
+
+    # 回调窗口：当天之前的 lookback-1 天内是否出现过收盘价低于MA5
+    lookback = params['pullback_lookback']
+
+    def count_below_ma5():
+        counts = np.zeros((n_rows + 1, close.shape[1]), dtype=np.int64)
+        with np.errstate(invalid='ignore'):
+            np.cumsum(close < indicators['MA5'], axis=0, out=counts[1:])
+        return counts
+
+    below_ma5 = _memo(cache, (version, 'below_ma5', params['ma_short']), count_below_ma5)
+    window_start = np.maximum(np.arange(n_rows) - lookback + 1, 0)
+    has_pullback = (below_ma5[:-1] - below_ma5[window_start]) > 0
+
+    # 截至第t行每只股票已有的K线数量
+    first_row = n_rows - panel.n_bars
+    bars = np.arange(n_rows)[:, None] - first_row[None, :] + 1
+
+    return _evaluate(
+        close, panel['open'],
+        indicators['MA5'], indicators['MA10'], indicators['MA20'], indicators['MA60'],
+        indicators['Rolling_Max'], recent_max, has_pullback, bars, params
+    )
+
+
+def generate_signal_history(price_data, names=None, start_date=None, end_date=None, params=None):
+    """
+    生成历史每个交易日的选股信号
+
+    Parameters:
+    -----------
+    price_data : dict
+        价格数据字典，格式：{code: pd.DataFrame}，需包含 open/high/close
+    names : dict
+        股票名称 {code: name}
+    start_date, end_date : str
+        信号日期范围，格式：'YYYY-MM-DD'
+    params : dict
+        策略参数，默认使用 STRATEGY_PARAMS
+
+    Returns:
+    --------
+    dict : {date: [{'code': '000001', 'name': '股票名'}, ...]}，可直接传给 BacktestEngine.run_backtest
+    """
+    panel = build_bar_panel(price_data)
+    if not panel.symbols:
+        return {}
+
+    status, _, _ = evaluate_panel_history(panel, params)
+    return signals_from_status(panel, status, names, start_date, end_date)
+
+
+def signals_from_status(panel, status, names=None, start_date=None, end_date=None):
+    """
+    把状态码矩阵中入选的K线整理成按日期的信号字典
+
+    Parameters:
+    -----------
+    panel : BarPanel
+        价格矩阵
+    status : np.ndarray
+        evaluate_panel_history 返回的状态码矩阵
+    names : dict
+        股票名称 {code: name}
+    start_date, end_date : str
+        信号日期范围，格式：'YYYY-MM-DD'
+
+    Returns:
+    --------
+    dict : {date: [{'code': '000001', 'name': '股票名'}, ...]}
+    """
+    names = names or {}
+    calendar = panel.calendar
+    day_index = panel.day_index
+    lo, hi = calendar.bounds(start_date, end_date)
+    hit = (status == STATUS_SELECTED) & (day_index >= lo) & (day_index < hi)
+
+    rows, cols = np.nonzero(hit)
+    days = day_index[rows, cols]
+    # 同一天内按股票池顺序排列
+    order = np.lexsort((cols, days))
+
+    signals = {}
+    date_strs = calendar.date_strs
+    for i, j in zip(days[order].tolist(), cols[order].tolist()):
+        code = panel.symbols[j]
+        signals.setdefault(date_strs[i], []).append({'code': code, 'name': names.get(code, '未知')})
+    return signals
+
+
+def screen_price_data(price_data, params=None, style='daily'):
+    """
+    对 {code: DataFrame} 一次性执行选股
+
+    Returns:
+    --------
+    tuple : (入选代码列表, {code: (is_selected, reason)})
+    """
+    with METRICS.timer('screen.build_panel'):
+        panel = build_bar_panel(price_data)
+    results = screen_panel(panel, params=params, style=style)
+    selected = [code for code, (is_selected, _) in results.items() if is_selected]
+    return selected, results
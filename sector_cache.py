@@ -0,0 +1,180 @@
+"""
+板块成分股缓存与资金流快照归档
+板块成分股和全市场股票列表几乎不随日变化，按 TTL 缓存到本地，重复运行时不再逐个请求；
+每次获取的行业资金流排名按日期归档，用于事后还原历史上的选股池（回测）。
+"""
+
+import os
+import json
+import time
+import threading
+import datetime
+import pandas as pd
+
+from data_provider import get_provider
+
+# 默认缓存目录
+SECTOR_CACHE_DIR = 'cache/sectors'
+
+# 成分股缓存有效期（小时）
+CONSTITUENTS_TTL_HOURS = 24
+
+
+def _atomic_write_text(path, text):
+    """先写临时文件再替换，避免读到写了一半的文件"""
+    tmp_file = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_file, path)
+
+
+class SectorCache:
+    """板块成分股 TTL 缓存 + 按日期归档的资金流排名快照"""
+
+    def __init__(self, root=SECTOR_CACHE_DIR, ttl_hours=CONSTITUENTS_TTL_HOURS):
+        """
+        Parameters:
+        -----------
+        root : str
+            缓存根目录，成分股存于 constituents/，全市场列表存于 market_list.json，资金流快照存于 fund_flow/
+        ttl_hours : float
+            成分股和全市场列表的缓存有效期（小时）
+        """
+        self.root = root
+        self.ttl_seconds = ttl_hours * 3600
+        self._lock = threading.Lock()
+
+    def _constituents_file(self, sector_name):
+        return os.path.join(self.root, 'constituents', f"{sector_name}.json")
+
+    def _fund_flow_file(self, date_str):
+        return os.path.join(self.root, 'fund_flow', f"{date_str}.csv")
+
+    def _read_json(self, path):
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _cached_stocks(self, path, label, fetch, code_col, name_col, force_refresh=False):
+        """
+        带 TTL 的股票列表缓存：未过期时直接返回，过期时重新请求，
+        请求失败时退回到过期的缓存
+
+        Returns:
+        --------
+        pd.DataFrame : 包含 '代码'、'名称' 列
+        """
+        cached = self._read_json(path)
+        if cached and not force_refresh and time.time() - cached['fetched_at'] < self.ttl_seconds:
+            return pd.DataFrame(cached['stocks'], columns=['代码', '名称'])
+
+        try:
+            df = fetch()
+        except Exception as e:
+            if cached:
+                print(f"    获取{label}失败，使用 {cached['fetched_date']} 的缓存: {e}")
+                return pd.DataFrame(cached['stocks'], columns=['代码', '名称'])
+            raise
+
+        stocks = [[str(code), str(name)] for code, name in zip(df[code_col], df[name_col])]
+        payload = {
+            'name': label,
+            'fetched_at': time.time(),
+            'fetched_date': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'stocks': stocks
+        }
+        with self._lock:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            _atomic_write_text(path, json.dumps(payload, ensure_ascii=False))
+        return pd.DataFrame(stocks, columns=['代码', '名称'])
+
+    def get_constituents(self, sector_name, fetch_func=None, force_refresh=False):
+        """
+        获取板块成分股，缓存未过期时不请求接口
+
+        Parameters:
+        -----------
+        sector_name : str
+            行业板块名称
+        fetch_func : callable
+            fetch_func(sector_name) -> DataFrame，默认为当前数据源的 board_constituents
+        force_refresh : bool
+            忽略缓存，重新请求
+
+        Returns:
+        --------
+        pd.DataFrame : 包含 '代码'、'名称' 列的成分股
+        """
+        fetch_func = fetch_func or (lambda name: get_provider().board_constituents(name))
+        return self._cached_stocks(self._constituents_file(sector_name), f"板块 {sector_name} 成分股",
+                                   lambda: fetch_func(sector_name), '代码', '名称', force_refresh)
+
+    def get_market_list(self, fetch_func=None, force_refresh=False):
+        """
+        获取全市场A股列表，缓存未过期时不请求接口
+
+        Parameters:
+        -----------
+        fetch_func : callable
+            fetch_func() -> DataFrame（code/name 列），默认为当前数据源的 market_list
+        force_refresh : bool
+            忽略缓存，重新请求
+
+        Returns:
+        --------
+        pd.DataFrame : 包含 '代码'、'名称' 列的股票列表
+        """
+        fetch_func = fetch_func or (lambda: get_provider().market_list())
+        return self._cached_stocks(os.path.join(self.root, 'market_list.json'), "全市场股票列表",
+                                   fetch_func, 'code', 'name', force_refresh)
+
+    def fetch_fund_flow(self, fetch_func=None, date_str=None):
+        """
+        获取当日行业资金流排名，并归档为当天的快照（同一天多次获取时保留最新的一次）
+
+        Parameters:
+        -----------
+        fetch_func : callable
+            fetch_func() -> DataFrame，默认为当前数据源的 sector_fund_flow（今日行业资金流）
+        date_str : str
+            快照日期，格式：'YYYY-MM-DD'，默认今天
+
+        Returns:
+        --------
+        pd.DataFrame : 接口返回的资金流排名
+        """
+        fetch_func = fetch_func or (lambda: get_provider().sector_fund_flow())
+        df_flow = fetch_func()
+        if df_flow is None or df_flow.empty:
+            return df_flow
+
+        date_str = date_str or datetime.date.today().strftime('%Y-%m-%d')
+        try:
+            with self._lock:
+                os.makedirs(os.path.dirname(self._fund_flow_file(date_str)), exist_ok=True)
+                _atomic_write_text(self._fund_flow_file(date_str), df_flow.to_csv(index=False))
+        except OSError as e:
+            print(f"资金流快照保存失败: {e}")
+        return df_flow
+
+    def load_fund_flow(self, date_str):
+        """读取某一天归档的资金流排名，没有快照时返回None"""
+        path = self._fund_flow_file(date_str)
+        if not os.path.exists(path):
+            return None
+        return pd.read_csv(path, encoding='utf-8', float_precision='round_trip')
+
+    def fund_flow_dates(self):
+        """返回已归档快照的日期列表（升序）"""
+        flow_dir = os.path.join(self.root, 'fund_flow')
+        if not os.path.isdir(flow_dir):
+            return []
+        return sorted(name[:-4] for name in os.listdir(flow_dir) if name.endswith('.csv'))
+
+
+# 全局缓存实例
+SECTOR_CACHE = SectorCache()
@@ -0,0 +1,207 @@
+"""
+共享内存价格面板
+把 {code: DataFrame} 一次性写入 multiprocessing.shared_memory 中的
+(字段 × 交易日 × 股票) 数组，子进程通过一个很小的句柄零拷贝地挂载，
+N个进程合计只占用约1份数据的内存
+"""
+
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from backtest import PriceMatrix
+from screener import BarPanel
+
+# 默认放入面板的字段
+PANEL_FIELDS = ('open', 'high', 'low', 'close', 'volume')
+
+
+class PanelHandle:
+    """
+    共享面板的句柄，只包含共享内存名称和索引，可以廉价地传给子进程
+    """
+
+    def __init__(self, shm_name, fields, codes, dates):
+        self.shm_name = shm_name
+        self.fields = tuple(fields)
+        self.codes = list(codes)
+        self.dates = np.asarray(dates, dtype='datetime64[ns]')
+
+    @property
+    def shape(self):
+        return (len(self.fields), len(self.dates), len(self.codes))
+
+
+def _attach_shared_memory(name):
+    """挂载已有的共享内存，挂载方不负责释放"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python 3.13 以前没有 track 参数；multiprocessing 子进程与创建方共用同一个
+        # 资源跟踪进程，重复登记不会提前删除共享内存（不能在子进程中 unregister，
+        # 否则创建方 unlink 时跟踪进程找不到登记记录）
+        return shared_memory.SharedMemory(name=name)
+
+
+class SharedPricePanel:
+    """
+    共享内存中的OHLCV价格面板
+
+    内存布局：一块连续的 float64 数组 (字段 × 交易日 × 股票)，后接一块
+    (交易日 × 股票) 的可用标志；同一交易日的所有股票相邻，
+    回测引擎的价格矩阵可以直接使用其中的视图。
+    """
+
+    def __init__(self, shm, handle, owner):
+        self.shm = shm
+        self.handle = handle
+        self.owner = owner
+
+        n_fields, n_dates, n_codes = handle.shape
+        n_values = n_fields * n_dates * n_codes
+        self.values = np.ndarray((n_fields, n_dates, n_codes), dtype=np.float64, buffer=shm.buf)
+        self.available = np.ndarray((n_dates, n_codes), dtype=np.bool_, buffer=shm.buf,
+                                    offset=n_values * 8)
+        if not owner:
+            self.values.flags.writeable = False
+            self.available.flags.writeable = False
+
+        self.dates = pd.DatetimeIndex(handle.dates)
+        self.codes = handle.codes
+        self.code_index = {code: j for j, code in enumerate(self.codes)}
+        self.field_index = {field: k for k, field in enumerate(handle.fields)}
+
+    @classmethod
+    def create(cls, price_data, fields=PANEL_FIELDS):
+        """
+        由价格数据字典创建共享面板（创建方负责最终 unlink）
+
+        Parameters:
+        -----------
+        price_data : dict
+            价格数据字典，格式：{code: pd.DataFrame}
+        fields : tuple
+            放入面板的列，DataFrame中缺少的列填NaN
+
+        Returns:
+        --------
+        SharedPricePanel : 创建方持有的面板
+        """
+        frames = [(code, df) for code, df in price_data.items() if df is not None and not df.empty]
+        if frames:
+            dates = np.unique(np.concatenate([df.index.values for _, df in frames])).astype('datetime64[ns]')
+        else:
+            dates = np.array([], dtype='datetime64[ns]')
+        codes = [code for code, _ in frames]
+
+        n_values = len(fields) * len(dates) * len(codes)
+        size = max(1, n_values * 8 + len(dates) * len(codes))
+        shm = shared_memory.SharedMemory(create=True, size=size)
+        handle = PanelHandle(shm.name, fields, codes, dates)
+        panel = cls(shm, handle, owner=True)
+
+        panel.values[:] = np.nan
+        panel.available[:] = False
+        date_index = pd.DatetimeIndex(dates)
+        for j, (_, df) in enumerate(frames):
+            rows = date_index.get_indexer(df.index)
+            panel.available[rows, j] = True
+            for k, field in enumerate(fields):
+                if field in df.columns:
+                    panel.values[k, rows, j] = df[field].to_numpy(dtype=np.float64)
+        return panel
+
+    @classmethod
+    def from_price_matrix(cls, matrix):
+        """由回测价格矩阵创建只含收盘价的共享面板"""
+        n_dates, n_codes = matrix.close.shape
+        shm = shared_memory.SharedMemory(create=True, size=max(1, n_dates * n_codes * 9))
+        handle = PanelHandle(shm.name, ('close',), matrix.codes, matrix.dates)
+        panel = cls(shm, handle, owner=True)
+        panel.values[0] = matrix.close
+        panel.available[:] = matrix.available
+        return panel
+
+    @classmethod
+    def from_compact(cls, universe, fields=PANEL_FIELDS):
+        """
+        由紧凑日线数据（CompactUniverse）创建共享面板，不需要先还原成 {code: DataFrame}
+        """
+        n_values = len(fields) * len(universe.calendar) * len(universe.codes)
+        size = max(1, n_values * 8 + len(universe.calendar) * len(universe.codes))
+        shm = shared_memory.SharedMemory(create=True, size=size)
+        handle = PanelHandle(shm.name, fields, universe.codes, universe.calendar)
+        panel = cls(shm, handle, owner=True)
+
+        panel.values[:] = np.nan
+        panel.available[:] = False
+        cols = np.repeat(np.arange(len(universe.codes)), universe.n_bars)
+        panel.available[universe.day, cols] = True
+        for k, field in enumerate(fields):
+            if field in universe.fields:
+                panel.values[k, universe.day, cols] = universe.values(field)
+        return panel
+
+    @classmethod
+    def attach(cls, handle):
+        """在任意进程中通过句柄零拷贝地挂载面板（只读）"""
+        return cls(_attach_shared_memory(handle.shm_name), handle, owner=False)
+
+    def field(self, name):
+        """返回某个字段的 (交易日 × 股票) 视图"""
+        return self.values[self.field_index[name]]
+
+    def price_matrix(self):
+        """返回回测引擎使用的价格矩阵（收盘价与可用标志均为共享内存视图）"""
+        return PriceMatrix(self.dates, self.codes, self.field('close'), self.available)
+
+    def frame(self, code):
+        """
+        返回单只股票的日线 DataFrame（只复制该股票有数据的行），
+        可直接传给 calculate_indicators
+        """
+        j = self.code_index[code]
+        rows = np.flatnonzero(self.available[:, j])
+        data = {field: self.values[k, rows, j] for field, k in self.field_index.items()}
+        return pd.DataFrame(data, index=pd.DatetimeIndex(self.dates[rows], name='date'))
+
+    def bar_panel(self, fields=('open', 'high', 'close')):
+        """
+        返回选股用的右对齐价格矩阵：每只股票的有效K线移到列尾，停牌日不占位置
+        """
+        # 稳定排序把不可用的行排到前面，可用行保持原有顺序；只保留最长股票所需的行数
+        n_bars = self.available.sum(axis=0).astype(np.int64)
+        n_rows = int(n_bars.max()) if len(n_bars) else 0
+        order = np.argsort(self.available, axis=0, kind='stable')[len(self.dates) - n_rows:]
+        dates = np.take_along_axis(
+            np.broadcast_to(self.dates.values[:, None], self.available.shape), order, axis=0
+        ).copy()
+        valid = np.take_along_axis(self.available, order, axis=0)
+        dates[~valid] = np.datetime64('NaT')
+
+        matrices = {}
+        for field in fields:
+            matrix = np.take_along_axis(self.field(field), order, axis=0)
+            matrix[~valid] = np.nan
+            matrices[field] = matrix
+
+        return BarPanel(self.codes, dates, matrices, n_bars)
+
+    def close(self):
+        """断开与共享内存的连接（不删除数据）"""
+        self.values = None
+        self.available = None
+        self.shm.close()
+
+    def unlink(self):
+        """删除共享内存，只应由创建方调用"""
+        if self.owner:
+            self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        self.unlink()
@@ -249,7 +249,7 @@ document.addEventListener('DOMContentLoaded', function() {
         applyFilters();
     }
 
-    // 刷新数据
+    // 刷新数据：启动后台选股任务，轮询进度直到完成
     async function refreshData() {
         // 显示加载状态
         const originalText = elements.refreshBtn.innerHTML;
@@ -269,21 +269,25 @@ document.addEventListener('DOMContentLoaded', function() {
             }
 
             const result = await response.json();
+            if (!result.success) {
+                throw new Error(result.message || '刷新失败');
+            }
 
-            if (result.success) {
-                // 更新数据
-                processData(result.data);
+            // 支持服务器推送时边扫描边显示入选股票，否则轮询进度
+            const jobId = result.job.job_id;
+            const job = window.EventSource ? await streamJob(jobId) : await waitForJob(jobId);
+            if (job.status !== 'done') {
+                throw new Error(job.error || '刷新失败');
+            }
 
-                // 显示成功消息
-                showMessage('数据刷新成功！', 'success');
+            // 任务完成后重新加载数据
+            await loadData();
 
-                // 更新更新时间
-                const now = new Date();
-                elements.updateTime.textContent = formatTime(now);
-                elements.lastUpdate.textContent = result.data.date || formatDate(now);
-            } else {
-                throw new Error(result.message || '刷新失败');
-            }
+            // 显示成功消息
+            showMessage('数据刷新成功！', 'success');
+
+            // 更新更新时间
+            elements.updateTime.textContent = formatTime(new Date());
         } catch (error) {
             console.error('刷新数据失败:', error);
             showMessage(`刷新失败: ${error.message}`, 'error');
@@ -294,6 +298,69 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
 
+    // 轮询后台任务进度，返回结束时的任务状态
+    async function waitForJob(jobId) {
+        while (true) {
+            await new Promise(resolve => setTimeout(resolve, 1000));
+
+            const response = await fetch(`/api/refresh/status/${jobId}`);
+            if (!response.ok) {
+                throw new Error(`查询刷新进度失败: ${response.status}`);
+            }
+
+            const job = (await response.json()).job;
+            if (job.status === 'done' || job.status === 'failed') {
+                return job;
+            }
+            elements.refreshBtn.innerHTML = `<span class="loading-spinner"></span> ${formatJobProgress(job)}`;
+        }
+    }
+
+    // 通过服务器推送事件（SSE）接收扫描进度和入选股票，返回结束时的任务状态
+    function streamJob(jobId) {
+        return new Promise((resolve, reject) => {
+            const source = new EventSource(`/api/refresh/stream/${jobId}`);
+            const streamed = [];
+
+            source.addEventListener('stock', function(event) {
+                streamed.push(JSON.parse(event.data));
+                const bySector = {};
+                streamed.forEach(stock => {
+                    bySector[stock['板块']] = (bySector[stock['板块']] || 0) + 1;
+                });
+                processData({stocks: streamed, stats: {total: streamed.length, by_sector: bySector}});
+            });
+
+            source.addEventListener('progress', function(event) {
+                const job = JSON.parse(event.data);
+                elements.refreshBtn.innerHTML = `<span class="loading-spinner"></span> ${formatJobProgress(job)}`;
+            });
+
+            source.addEventListener('done', function(event) {
+                source.close();
+                resolve(JSON.parse(event.data));
+            });
+
+            // 连接中断时改为轮询
+            source.onerror = function() {
+                source.close();
+                waitForJob(jobId).then(resolve, reject);
+            };
+        });
+    }
+
+    // 格式化任务进度，如 "扫描股票 35/120 (约20秒)"
+    function formatJobProgress(job) {
+        let text = job.stage || '刷新中';
+        if (job.total) {
+            text += ` ${job.done}/${job.total}`;
+        }
+        if (job.eta_seconds !== null && job.eta_seconds !== undefined) {
+            text += ` (约${Math.ceil(job.eta_seconds)}秒)`;
+        }
+        return text;
+    }
+
     // 重置筛选
     function resetFilters() {
         elements.sectorFilter.value = '';
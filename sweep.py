@@ -0,0 +1,133 @@
+"""
+回测参数扫描
+在进程池中对参数网格（止损比例 × 调仓日 × 单只仓位上限 ...）逐点运行回测，
+价格矩阵放在共享内存面板中供各进程零拷贝只读挂载，不随任务序列化
+"""
+
+import io
+import os
+import itertools
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from backtest import ArrayBacktestEngine, PriceMatrix
+from shared_panel import SharedPricePanel
+
+# 汇总表中保留的回测指标（_calculate_results 中的标量结果）
+RESULT_METRICS = [
+    'final_value', 'total_return_pct', 'annual_return_pct', 'max_drawdown_pct', 'sharpe_ratio',
+    'total_trades', 'win_rate_pct', 'avg_win_pct', 'avg_loss_pct', 'avg_holding_days',
+]
+
+# 子进程中的共享数据（由 _init_worker 设置）
+_worker_state = {}
+
+
+def expand_grid(param_grid, base_params=None):
+    """
+    展开参数网格
+
+    每个组合先并入 base_params，再判断是否启用每周调仓：
+    未启用时 rebalance_day 不起作用，相同的组合只保留一个
+
+    Parameters:
+    -----------
+    param_grid : dict
+        {参数名: 取值列表}，参数名为 BacktestEngine 的构造参数
+    base_params : dict
+        所有组合共用的参数，网格中的同名参数优先
+
+    Returns:
+    --------
+    list : 参数字典列表（已包含 base_params）
+    """
+    keys = list(param_grid.keys())
+    points = []
+    seen = set()
+    for values in itertools.product(*(param_grid[k] for k in keys)):
+        point = dict(base_params or {}, **dict(zip(keys, values)))
+        if not point.get('rebalance_weekly', False) and 'rebalance_day' in point:
+            point['rebalance_day'] = 0
+        key = tuple(sorted(point.items()))
+        if key not in seen:
+            seen.add(key)
+            points.append(point)
+    return points
+
+
+def _init_worker(handle, signals, start_date, end_date):
+    """子进程初始化：通过句柄挂载共享内存中的价格面板"""
+    panel = SharedPricePanel.attach(handle)
+    _worker_state['panel'] = panel
+    _worker_state['matrix'] = panel.price_matrix()
+    _worker_state['signals'] = signals
+    _worker_state['start_date'] = start_date
+    _worker_state['end_date'] = end_date
+
+
+def _run_point(params):
+    """在子进程中运行一个参数组合，只返回标量指标"""
+    engine = ArrayBacktestEngine(**params)
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = engine.run_backtest(
+            _worker_state['signals'],
+            _worker_state['matrix'],
+            start_date=_worker_state['start_date'],
+            end_date=_worker_state['end_date']
+        )
+    row = dict(params)
+    row.update({key: results.get(key) for key in RESULT_METRICS})
+    return row
+
+
+def run_parameter_sweep(signals, price_data, param_grid, start_date=None, end_date=None,
+                        base_params=None, processes=None):
+    """
+    并行运行参数扫描
+
+    Parameters:
+    -----------
+    signals : dict
+        信号字典，格式：{date: [{'code': '000001', 'name': '股票名'}, ...]}
+    price_data : dict 或 PriceMatrix
+        价格数据字典 {code: pd.DataFrame}，或预先构建好的价格矩阵
+    param_grid : dict
+        参数网格，如 {'stop_loss_pct': [0.03, 0.04], 'rebalance_day': [0, 4], 'max_position_pct': [0.1, 0.2]}
+    start_date, end_date : str
+        回测日期范围，格式：'YYYY-MM-DD'
+    base_params : dict
+        所有组合共用的引擎参数（如 initial_capital、commission_rate）
+    processes : int
+        进程数，默认为CPU核数
+
+    Returns:
+    --------
+    pd.DataFrame : 每个参数组合一行，包含参数列和回测指标列
+    """
+    points = expand_grid(param_grid, base_params)
+    if isinstance(price_data, PriceMatrix):
+        panel = SharedPricePanel.from_price_matrix(price_data)
+    else:
+        panel = SharedPricePanel.create(price_data, fields=('close',))
+    print(f"参数扫描: 共{len(points)}个参数组合, {len(panel.codes)}只股票, {len(panel.dates)}个交易日")
+
+    try:
+        processes = processes or os.cpu_count() or 1
+        chunksize = max(1, len(points) // (processes * 4))
+        with ProcessPoolExecutor(
+            max_workers=processes,
+            initializer=_init_worker,
+            initargs=(panel.handle, signals, start_date, end_date)
+        ) as executor:
+            rows = []
+            for i, row in enumerate(executor.map(_run_point, points, chunksize=chunksize), 1):
+                rows.append(row)
+                if i % 50 == 0 or i == len(points):
+                    print(f"进度: {i}/{len(points)}")
+    finally:
+        panel.close()
+        panel.unlink()
+
+    return pd.DataFrame(rows)
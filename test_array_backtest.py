@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+测试数组版回测引擎与原回测引擎结果逐位一致
+"""
+
+import pandas as pd
+
+from backtest import BacktestEngine, ArrayBacktestEngine, PriceMatrix
+from test_weekly_rebalance import create_test_data
+
+
+def assert_same_results(results1, results2):
+    """逐项比较两次回测结果（数值和明细表都要求完全相同）"""
+    assert results1.keys() == results2.keys()
+    for key, val1 in results1.items():
+        val2 = results2[key]
+        if isinstance(val1, pd.DataFrame):
+            pd.testing.assert_frame_equal(val1, val2, check_exact=True)
+        else:
+            assert val1 == val2, f"{key}: {val1} != {val2}"
+
+
+def run_both(**engine_params):
+    """用两种引擎在同一份测试数据上回测"""
+    signals, price_data, dates = create_test_data()
+    results = []
+    for engine_cls, data in ((BacktestEngine, price_data),
+                             (ArrayBacktestEngine, PriceMatrix.from_price_data(price_data))):
+        backtest = engine_cls(initial_capital=1000000, stop_loss_pct=0.04, commission_rate=0.0003,
+                              **engine_params)
+        results.append(backtest.run_backtest(signals, data, start_date='2023-01-01', end_date='2023-03-31'))
+    return results
+
+
+def test_array_engine_without_rebalance():
+    """不带每周调仓"""
+    assert_same_results(*run_both(rebalance_weekly=False))
+
+
+def test_array_engine_with_rebalance():
+    """每周一调仓，以及信号日之外的调仓日"""
+    assert_same_results(*run_both(rebalance_weekly=True, rebalance_day=0))
+    assert_same_results(*run_both(rebalance_weekly=True, rebalance_day=3))
+
+
+if __name__ == "__main__":
+    test_array_engine_without_rebalance()
+    test_array_engine_with_rebalance()
+    print("\n测试完成!")
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+测试 asyncio 并发获取：用本地桩HTTP服务验证并发上限、连接复用与重试策略
+"""
+
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from async_fetch import AsyncFetcher, shared_session, create_session
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """返回请求路径的长连接服务；/flaky 第一次直接断开连接，/missing 返回404"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.ports.add(self.client_address[1])
+            server.hits[self.path] = server.hits.get(self.path, 0) + 1
+            server.active += 1
+            server.peak = max(server.peak, server.active)
+            first = server.hits[self.path] == 1
+        try:
+            time.sleep(0.02)
+            if self.path == '/flaky' and first:
+                self.close_connection = True
+                return
+            status = 404 if self.path == '/missing' else 200
+            body = self.path.encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.ports = set()
+    server.hits = {}
+    server.active = 0
+    server.peak = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+
+def test_concurrency_and_connection_reuse():
+    """并发不超过信号量上限，所有请求复用连接池中的长连接"""
+    server, base = start_server()
+    try:
+        urls = [f'{base}/item/{i}' for i in range(24)]
+        with AsyncFetcher(concurrency=4) as fetcher:
+            results = fetcher.map(urls)
+        assert [text for _, text in results] == [f'/item/{i}' for i in range(24)]
+        assert fetcher.stats == {'requests': 24, 'retries': 0, 'failures': 0}
+        assert 1 < server.peak <= 4
+        assert len(server.ports) <= 4
+    finally:
+        server.shutdown()
+
+
+def test_retry_policy():
+    """连接被断开（网络类错误）时重试，HTTP 404 不重试，失败的异常可查询"""
+    server, base = start_server()
+    try:
+        fetcher = AsyncFetcher(concurrency=2, max_retries=2, backoff=0.01)
+        done = dict(fetcher.run([f'{base}/flaky', f'{base}/missing', f'{base}/ok']))
+        fetcher.close()
+        assert done[f'{base}/flaky'] == '/flaky'
+        assert done[f'{base}/ok'] == '/ok'
+        assert done[f'{base}/missing'] is None
+        assert isinstance(fetcher.errors[f'{base}/missing'], requests.HTTPError)
+        assert server.hits['/missing'] == 1
+        assert fetcher.stats == {'requests': 4, 'retries': 1, 'failures': 1}
+    finally:
+        server.shutdown()
+
+
+def test_rate_limit_and_retry_classification():
+    """令牌桶限制每秒请求数（初始可突发 rate 个）；只重试网络类错误"""
+    rate = 40
+    start = time.monotonic()
+    with AsyncFetcher(lambda x: x, concurrency=8, requests_per_second=rate) as fetcher:
+        assert len(fetcher.map(range(2 * rate))) == 2 * rate
+    elapsed = time.monotonic() - start
+    assert 0.9 <= elapsed < 3
+
+    attempts = {}
+
+    def fetch(item):
+        attempts[item] = attempts.get(item, 0) + 1
+        raise item
+
+    errors = [ConnectionError('Connection aborted'), ConnectionError('Remote end closed'), ValueError('bad symbol')]
+    with AsyncFetcher(fetch, concurrency=2, max_retries=3, backoff=0.001) as fetcher:
+        fetcher.map(errors)
+    assert [attempts[e] for e in errors] == [3, 3, 1]
+    assert fetcher.stats == {'requests': 7, 'retries': 4, 'failures': 3}
+
+
+def test_shared_session_for_module_requests():
+    """期间模块级 requests.get（akshare 的调用方式）复用同一个连接，退出后恢复"""
+    server, base = start_server()
+    original = requests.api.request
+    try:
+        session = create_session(2)
+        with shared_session(session):
+            with shared_session(create_session(2)):
+                texts = [requests.get(f'{base}/seq/{i}').text for i in range(5)]
+            assert requests.api.request != original
+        assert requests.api.request == original
+        assert texts == [f'/seq/{i}' for i in range(5)]
+        assert len(server.ports) == 1
+        session.close()
+    finally:
+        server.shutdown()
+
+
+class CountingSession(requests.Session):
+    """记录发出的请求数"""
+
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+
+    def request(self, *args, **kwargs):
+        self.calls += 1
+        return super().request(*args, **kwargs)
+
+
+def test_shared_session_only_in_worker_threads():
+    """会话只在执行获取任务的线程中生效，其他线程的 requests.get 不经过它；并行的获取器各用各的会话"""
+    server, base = start_server()
+    original = requests.api.request
+    try:
+        started = threading.Event()
+        outside = []
+
+        def other_thread():
+            started.wait(5)
+            outside.append(requests.get(f'{base}/outside').text)
+
+        thread = threading.Thread(target=other_thread)
+        thread.start()
+
+        def slow_fetch(path):
+            # 获取器运行期间让其他线程发出请求
+            started.set()
+            thread.join(5)
+            return requests.get(f'{base}{path}').text
+
+        first = AsyncFetcher(slow_fetch, concurrency=2)
+        second = AsyncFetcher(lambda path: requests.get(f'{base}{path}').text, concurrency=2)
+        first.session, second.session = CountingSession(), CountingSession()
+
+        background = threading.Thread(target=lambda: second.map([f'/b/{i}' for i in range(3)]))
+        background.start()
+        assert first.map(['/a/0', '/a/1']) == [('/a/0', '/a/0'), ('/a/1', '/a/1')]
+        background.join(5)
+
+        assert outside == ['/outside']
+        assert first.session.calls == 2 and second.session.calls == 3
+        assert requests.api.request == original
+        first.close()
+        second.close()
+    finally:
+        server.shutdown()
+
+
+def test_sync_facade_inside_event_loop():
+    """已有事件循环的线程中同样可以使用同步接口"""
+    import asyncio
+
+    async def main():
+        with AsyncFetcher(lambda x: x * 2, concurrency=3) as fetcher:
+            return fetcher.map(range(10))
+
+    assert asyncio.run(main()) == [(i, i * 2) for i in range(10)]
+
+
+if __name__ == "__main__":
+    test_concurrency_and_connection_reuse()
+    test_retry_policy()
+    test_rate_limit_and_retry_classification()
+    test_shared_session_for_module_requests()
+    test_shared_session_only_in_worker_threads()
+    test_sync_facade_inside_event_loop()
+    print("测试完成!")
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+测试后台单飞任务与非阻塞的刷新接口
+"""
+
+import re
+import time
+import json
+import threading
+
+import app as web_app
+from background_jobs import SingleFlightRunner
+
+
+def wait_until_finished(runner, job_id, timeout=5):
+    """等待任务结束"""
+    deadline = time.time() + timeout
+    while runner.get(job_id).status in ('pending', 'running'):
+        assert time.time() < deadline, "任务超时"
+        time.sleep(0.01)
+    return runner.get(job_id)
+
+
+def test_single_flight_and_progress():
+    """运行期间重复提交返回同一个任务，进度可查询，结束后可以启动新任务"""
+    release = threading.Event()
+
+    def task(progress):
+        progress(stage='扫描股票', done=0, total=10)
+        progress(done=4)
+        release.wait(5)
+        return 'ok'
+
+    runner = SingleFlightRunner('测试')
+    job1, created1 = runner.submit(task)
+    job2, created2 = runner.submit(task)
+    assert created1 and not created2
+    assert job1.id == job2.id
+
+    deadline = time.time() + 5
+    while job1.done != 4:
+        assert time.time() < deadline
+        time.sleep(0.01)
+    status = job1.to_dict()
+    assert status['status'] == 'running'
+    assert (status['stage'], status['done'], status['total']) == ('扫描股票', 4, 10)
+    assert status['eta_seconds'] is not None
+
+    release.set()
+    assert wait_until_finished(runner, job1.id).status == 'done'
+    assert job1.result == 'ok'
+
+    job3, created3 = runner.submit(lambda progress: 1 / 0)
+    assert created3 and job3.id != job1.id
+    job3 = wait_until_finished(runner, job3.id)
+    assert job3.status == 'failed' and 'division' in job3.error
+
+
+def test_refresh_endpoint_returns_immediately(monkeypatch):
+    """刷新接口立即返回任务ID，重复点击不会启动第二次扫描"""
+    release = threading.Event()
+    calls = []
+
+    def fake_selection(progress=None):
+        calls.append(1)
+        progress(stage='扫描股票', done=1, total=2)
+        release.wait(5)
+        return {'date': web_app.get_today_date(), 'stocks': [], 'stats': {}}
+
+    monkeypatch.setattr(web_app, 'run_selection_and_save', fake_selection)
+    monkeypatch.setattr(web_app, 'SELECTION_JOBS', SingleFlightRunner('测试'))
+    client = web_app.app.test_client()
+
+    resp1 = client.post('/api/refresh')
+    resp2 = client.post('/api/refresh')
+    assert resp1.status_code == resp2.status_code == 202
+    job_id = resp1.get_json()['job']['job_id']
+    assert resp2.get_json()['job']['job_id'] == job_id
+
+    release.set()
+    wait_until_finished(web_app.SELECTION_JOBS, job_id)
+    status = client.get(f'/api/refresh/status/{job_id}').get_json()
+    assert status['job']['status'] == 'done'
+    assert len(calls) == 1
+    assert client.get('/api/refresh/status/unknown').status_code == 404
+
+
+def page_script(client):
+    """首页实际加载的脚本（templates/index.html 中的 <script src>）"""
+    page = client.get('/').get_data(as_text=True)
+    assert 'id="refresh-btn"' in page
+    src = re.search(r'<script src="([^"]+\.js)"', page).group(1)
+    resp = client.get(src)
+    assert resp.status_code == 200
+    script = resp.get_data(as_text=True)
+    resp.close()
+    return script
+
+
+def test_page_script_polls_refresh_job():
+    """首页脚本的刷新按钮按任务ID查询进度，不再读取刷新接口中已不存在的 data"""
+    script = page_script(web_app.app.test_client())
+    assert "getElementById('refresh-btn')" in script
+    assert '/api/refresh/status/' in script
+    assert 'result.data' not in script
+
+def test_refresh_stream_pushes_events(monkeypatch):
+    """SSE 事件流逐只推送入选股票，任务结束时发送 done 并关闭"""
+    release = threading.Event()
+
+    def fake_selection(progress=None):
+        progress(stage='获取数据', done=0, total=2)
+        progress(event=('stock', {'代码': '600001', '名称': '测试一'}))
+        release.wait(5)
+        progress(done=2, event=('stock', {'代码': '600002', '名称': '测试二'}))
+        return {'date': web_app.get_today_date(), 'stocks': [], 'stats': {}}
+
+    monkeypatch.setattr(web_app, 'run_selection_and_save', fake_selection)
+    monkeypatch.setattr(web_app, 'SELECTION_JOBS', SingleFlightRunner('测试'))
+    monkeypatch.setattr(web_app, 'SSE_POLL_SECONDS', 0.05)
+    client = web_app.app.test_client()
+
+    job_id = client.post('/api/refresh').get_json()['job']['job_id']
+    threading.Timer(0.2, release.set).start()
+    resp = client.get(f'/api/refresh/stream/{job_id}')
+    assert resp.mimetype == 'text/event-stream'
+
+    events = []
+    for block in resp.get_data(as_text=True).strip().split('\n\n'):
+        kind, data = block.split('\n')
+        events.append((kind[len('event: '):], json.loads(data[len('data: '):])))
+    stocks = [data['代码'] for kind, data in events if kind == 'stock']
+    assert stocks == ['600001', '600002']
+    assert any(kind == 'progress' for kind, _ in events)
+    assert events[-1][0] == 'done' and events[-1][1]['status'] == 'done'
+    assert client.get('/api/refresh/stream/unknown').status_code == 404
+
+
+def test_page_script_streams_refresh_job():
+    """首页脚本通过 SSE 接收扫描中的入选股票"""
+    script = page_script(web_app.app.test_client())
+    assert '/api/refresh/stream/' in script
+    assert "addEventListener('stock'" in script and "addEventListener('done'" in script
+
+
+if __name__ == "__main__":
+    test_single_flight_and_progress()
+    print("测试完成!")
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+测试回测明细的列式缓冲区与 Parquet 写出
+"""
+
+import io
+import os
+import tempfile
+import contextlib
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import backtest_history
+from backtest import BacktestEngine, ArrayBacktestEngine
+from backtest_history import PortfolioHistory, TradeLog
+from test_weekly_rebalance import create_test_data
+
+
+def make_trades(n):
+    trades = []
+    for i in range(n):
+        if i % 2 == 0:
+            trades.append({'date': f'2023-01-{i % 28 + 1:02d}', 'code': f'{600000 + i}', 'name': f'股票{i}',
+                           'action': 'BUY', 'reason': '选股信号', 'price': 10.0 + i, 'shares': 100,
+                           'amount': (10.0 + i) * 100, 'commission': 0.3, 'pnl': 0, 'pnl_pct': 0,
+                           'holding_days': 0})
+        else:
+            trades.append({'date': f'2023-01-{i % 28 + 1:02d}', 'code': f'{600000 + i - 1}', 'action': 'SELL',
+                           'reason': '止损', 'price': 9.5 + i, 'shares': 100, 'amount': (9.5 + i) * 100,
+                           'commission': 0.3, 'pnl': i - 50.5, 'pnl_pct': (i - 50.5) / 1000,
+                           'holding_days': i % 7})
+    return trades
+
+
+def test_trade_log_matches_dict_frame():
+    """扩容多次后得到的表与由字典列表构建的表相同（卖出记录没有 name，为 NaN）"""
+    trades = make_trades(1000)
+    log = TradeLog(capacity=4)
+    log.extend(trades)
+    assert len(log) == 1000
+    pd.testing.assert_frame_equal(log.to_frame(), pd.DataFrame(trades), check_exact=True)
+    pd.testing.assert_frame_equal(log.stats_frame(), pd.DataFrame(trades)[backtest_history.TRADE_STAT_COLUMNS],
+                                  check_exact=True)
+    assert TradeLog().to_frame().empty
+
+
+def test_portfolio_history_frame():
+    """按日期索引，超出预分配容量时自动扩容"""
+    history = PortfolioHistory(2)
+    for i in range(5):
+        history.append(f'2023-01-0{i + 2}', 1000.0 - i, i, 1000.0 + i, i / 10)
+    df = history.to_frame()
+    assert df.index.name == 'date' and df.index[0] == pd.Timestamp('2023-01-02')
+    assert df['positions_count'].tolist() == [0, 1, 2, 3, 4]
+    assert df['return'].iloc[-1] == 0.4
+
+
+def test_parquet_history_round_trip(monkeypatch):
+    """写出到 Parquet 的明细与内存中的结果相同，分批写出不影响统计"""
+    pytest.importorskip('pyarrow')
+    monkeypatch.setattr(backtest_history, 'TRADE_CHUNK_ROWS', 7)
+    signals, price_data, _ = create_test_data()
+    in_memory = BacktestEngine(rebalance_weekly=True).run_backtest(signals, price_data)
+
+    with tempfile.TemporaryDirectory() as root:
+        streamed = ArrayBacktestEngine(rebalance_weekly=True, history_dir=root).run_backtest(signals, price_data)
+
+        for key in ('final_value', 'total_trades', 'win_rate_pct', 'avg_win_pct', 'avg_holding_days'):
+            assert streamed[key] == in_memory[key], key
+
+        portfolio_df, trades_df = backtest_history.load_history(root)
+        pd.testing.assert_frame_equal(portfolio_df, in_memory['portfolio_history'], check_freq=False)
+        expected = in_memory['trade_history']
+        assert len(trades_df) == len(expected)
+        assert trades_df['code'].tolist() == expected['code'].tolist()
+        assert np.array_equal(trades_df['pnl'].to_numpy(), expected['pnl'].to_numpy())
+
+
+def test_streamed_run_keeps_no_trade_frame():
+    """写出到 Parquet 的回测结果中只有文件路径，交易记录不读回内存；打印时只读取文件末尾"""
+    pytest.importorskip('pyarrow')
+    signals, price_data, _ = create_test_data()
+    in_memory = BacktestEngine(rebalance_weekly=True).run_backtest(signals, price_data)
+
+    with tempfile.TemporaryDirectory() as root:
+        engine = ArrayBacktestEngine(rebalance_weekly=True, history_dir=root)
+        with contextlib.redirect_stdout(io.StringIO()):
+            streamed = engine.run_backtest(signals, price_data)
+        assert streamed['trade_history'] is None
+        assert streamed['trades_path'] == os.path.join(root, backtest_history.TRADES_FILE)
+        assert engine.trade_history.n == 0 and len(engine.trade_history) == len(in_memory['trade_history'])
+
+        recent = backtest_history.read_recent_trades(streamed['trades_path'], 10)
+        expected = in_memory['trade_history'].tail(10).reset_index(drop=True)
+        assert recent['code'].tolist() == expected['code'].tolist()
+        assert np.array_equal(recent['pnl'].to_numpy(), expected['pnl'].to_numpy())
+
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            engine.print_results()
+        assert '最近10笔交易' in output.getvalue()
+
+
+if __name__ == "__main__":
+    test_trade_log_matches_dict_frame()
+    test_portfolio_history_frame()
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        print("未安装 pyarrow，跳过 Parquet 写出测试")
+    else:
+        with pytest.MonkeyPatch.context() as monkeypatch:
+            test_parquet_history_round_trip(monkeypatch)
+        test_streamed_run_keeps_no_trade_frame()
+    print("测试完成!")
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+测试性能基准：合成数据可复现，小规模运行产生完整结果，对比能识别回退
+"""
+
+import json
+import os
+import tempfile
+
+import app as web_app
+import benchmark
+import run_daily
+
+
+def test_generate_price_data_is_deterministic():
+    """相同参数生成完全相同的数据，长度不超过指定年数"""
+    a = benchmark.generate_price_data(20, 1, seed=3)
+    b = benchmark.generate_price_data(20, 1, seed=3)
+    assert list(a) == list(b)
+    for code in a:
+        assert a[code].equals(b[code])
+        assert len(a[code]) <= benchmark.TRADING_DAYS_PER_YEAR
+        assert (a[code]['high'] >= a[code][['open', 'close']].max(axis=1)).all()
+
+
+def test_small_run_and_compare():
+    """小规模运行全部环节，结果可写成JSON；耗时超过阈值的环节判定为回退"""
+    old_cache = web_app.RESULT_CACHE
+    old_store = run_daily.STOCK_STORE
+    result = benchmark.run_benchmarks(symbols=30, years=1, repeat=1, api_requests=3)
+
+    # 运行后恢复被替换的全局对象
+    assert web_app.RESULT_CACHE is old_cache
+    assert run_daily.STOCK_STORE is old_store
+
+    expected = {'fetch_cold', 'fetch_warm', 'calculate_indicators', 'check_strategy', 'screen_price_data',
+                'signal_history', 'backtest', 'backtest_array',
+                'api_stocks', 'api_stats', 'api_filter', 'api_stock_detail'}
+    assert set(result['results']) == expected
+    assert result['config']['symbols'] == 30
+    assert all(stats['median'] > 0 for stats in result['results'].values())
+
+    with tempfile.TemporaryDirectory() as root:
+        path = os.path.join(root, 'result.json')
+        assert benchmark.main(['--symbols', '10', '--years', '1', '--repeat', '1',
+                               '--only', 'indicators,screen', '--output', path]) == 0
+        with open(path, 'r', encoding='utf-8') as f:
+            saved = json.load(f)
+        assert set(saved['results']) == {'calculate_indicators', 'check_strategy', 'screen_price_data'}
+
+    baseline = json.loads(json.dumps(result))
+    baseline['results']['backtest']['median'] = result['results']['backtest']['median'] / 2
+    rows = {row['name']: row for row in benchmark.compare_results(result, baseline, threshold=0.2)}
+    assert rows['backtest']['regression']
+    assert not rows['screen_price_data']['regression']
+
+
+if __name__ == "__main__":
+    test_generate_price_data_is_deterministic()
+    test_small_run_and_compare()
+    print("测试完成!")
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+测试紧凑日线数据与 float64 路径的一致性
+
+容差约定：
+- 价格在0.01元网格上（不复权数据）：还原后的价格、选股状态、回测结果与 float64 路径逐位相同
+- 价格不在网格上（复权数据）：价格相对误差 <= 2**-24，指标相对误差 <= PRICE_RTOL；
+  选股结论只允许在 float64 路径本身就处于平局附近（某个条件两边的相对差距 < PRICE_RTOL）的K线上不同
+"""
+
+import tempfile
+
+import numpy as np
+
+from backtest import ArrayBacktestEngine, PriceMatrix
+from compact_universe import CompactUniverse
+from data_store import OHLCVStore
+from screener import (build_bar_panel, compute_panel_indicators, evaluate_panel_history,
+                      rolling_max, screen_panel, signals_from_status, STRATEGY_PARAMS)
+from shared_panel import SharedPricePanel
+from test_screener import create_test_data
+
+# 复权价格路径的容差
+PRICE_RTOL = 1e-6
+
+
+def adjusted(price_data, factor=0.8731):
+    """模拟前复权：价格乘以复权因子后不再是0.01元的整数倍"""
+    return {code: df.assign(**{field: df[field] * factor for field in ('open', 'high', 'low', 'close')})
+            for code, df in price_data.items()}
+
+
+def near_ties(panel, params=STRATEGY_PARAMS):
+    """float64 路径中任一选股条件两边相对差距小于 PRICE_RTOL 的K线（含回调窗口内的平局）"""
+    close, high, open_ = panel['close'], panel['high'], panel['open']
+    indicators = compute_panel_indicators(panel, params)
+    recent_max = rolling_max(high, params['recent_days'], min_periods=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        drawdown = (recent_max - close) / recent_max
+        below_ma5 = np.abs(close - indicators['MA5']) / close < PRICE_RTOL
+        margins = [
+            (close - indicators['MA60']) / close,
+            (indicators['MA20'] - indicators['MA60']) / close,
+            (recent_max - indicators['Rolling_Max'] * 0.99) / close,
+            drawdown - 0.03,
+            0.20 - drawdown,
+            (close - open_) / close,
+        ]
+        near = below_ma5.copy()
+        for margin in margins:
+            near |= np.abs(margin) < PRICE_RTOL
+    for k in range(1, params['pullback_lookback']):
+        near[k:] |= below_ma5[:-k]
+    return near
+
+
+def test_layout_and_memory():
+    """只保留需要的列，内存约为原始 DataFrame 的一半；单只股票数据、价格矩阵与原数据相同"""
+    price_data = create_test_data(100)
+    for df in price_data.values():
+        df['amount'] = df['close'] * df['volume']
+        df['turnover'] = 0.01
+    universe = CompactUniverse.from_price_data(price_data)
+    original = sum(df.memory_usage(index=True).sum() for df in price_data.values())
+    assert universe.day.dtype == np.int32
+    assert all(values.dtype == np.float32 for values in universe.fields.values())
+    assert set(universe.fields) == {'open', 'high', 'low', 'close', 'volume'}
+    assert universe.nbytes < original * 0.4
+
+    assert universe.decimals == {'open': 2, 'high': 2, 'close': 2, 'volume': 2}
+    for code, df in price_data.items():
+        frame = universe.frame(code)
+        assert frame.index.equals(df.index)
+        for field in ('open', 'high', 'close', 'volume'):
+            assert np.array_equal(frame[field].to_numpy(), df[field].to_numpy())
+        # low 不在网格上，只保证 float32 精度
+        assert np.allclose(frame['low'], df['low'], rtol=2 ** -24, atol=0)
+
+    matrix = universe.price_matrix()
+    expected = PriceMatrix.from_price_data(price_data)
+    assert matrix.codes == expected.codes and matrix.dates.equals(expected.dates)
+    assert np.array_equal(matrix.close, expected.close, equal_nan=True)
+    assert np.array_equal(matrix.available, expected.available)
+
+    with SharedPricePanel.from_compact(universe) as shared, SharedPricePanel.create(price_data) as dense:
+        assert np.array_equal(shared.field('close'), dense.field('close'), equal_nan=True)
+        assert np.array_equal(shared.available, dense.available)
+
+
+def test_grid_prices_match_exactly():
+    """0.01元网格上的价格：选股结果、历史信号与回测结果与 float64 路径逐位相同"""
+    price_data = create_test_data(300)
+    universe = CompactUniverse.from_price_data(price_data)
+    expected_panel = build_bar_panel(price_data)
+    panel = universe.bar_panel()
+    assert np.array_equal(panel.dates.view('i8'), expected_panel.dates.view('i8'))
+    assert panel.version == expected_panel.version
+
+    assert screen_panel(panel) == screen_panel(expected_panel)
+    status, _, _ = evaluate_panel_history(panel)
+    expected_status, _, _ = evaluate_panel_history(expected_panel)
+    assert np.array_equal(status, expected_status)
+
+    signals = signals_from_status(panel, status)
+    result = ArrayBacktestEngine().run_backtest(signals, universe.price_matrix())
+    expected = ArrayBacktestEngine().run_backtest(signals, PriceMatrix.from_price_data(price_data))
+    assert result['final_value'] == expected['final_value']
+
+
+def test_adjusted_prices_within_tolerance():
+    """复权价格：指标在容差内，选股结论只在平局附近不同"""
+    price_data = adjusted(create_test_data(300))
+    universe = CompactUniverse.from_price_data(price_data)
+    assert universe.decimals == {'volume': 2}
+    expected_panel = build_bar_panel(price_data)
+    panel = universe.bar_panel()
+
+    valid = ~np.isnan(expected_panel['close'])
+    assert np.allclose(panel['close'][valid], expected_panel['close'][valid], rtol=2 ** -24, atol=0)
+    indicators = compute_panel_indicators(panel)
+    for name, expected in compute_panel_indicators(expected_panel).items():
+        assert np.allclose(indicators[name], expected, rtol=PRICE_RTOL, atol=0, equal_nan=True)
+
+    status, _, _ = evaluate_panel_history(panel)
+    expected_status, _, _ = evaluate_panel_history(expected_panel)
+    flipped = status != expected_status
+    assert not (flipped & ~near_ties(expected_panel)).any()
+    assert flipped.sum() <= (expected_status == 0).sum() * 0.01
+
+    # 相同信号下回测结果只差 float32 的舍入
+    signals = signals_from_status(expected_panel, expected_status)
+    result = ArrayBacktestEngine().run_backtest(signals, universe.price_matrix())
+    expected = ArrayBacktestEngine().run_backtest(signals, PriceMatrix.from_price_data(price_data))
+    assert np.isclose(result['final_value'], expected['final_value'], rtol=PRICE_RTOL, atol=0)
+
+
+def test_from_store_reads_needed_columns():
+    """从数据仓库只读取需要的列，代码去掉市场前缀"""
+    price_data = create_test_data(5)
+    with tempfile.TemporaryDirectory() as root:
+        store = OHLCVStore(root)
+        for code, df in price_data.items():
+            store.save(f'sh{code}', df.assign(amount=1.0, outstanding_share=2.0))
+        universe = CompactUniverse.from_store(store, fields=('open', 'high', 'close'))
+        empty = CompactUniverse.from_store(OHLCVStore(f'{root}/missing'))
+    assert universe.codes == list(price_data)
+    assert set(universe.fields) == {'open', 'high', 'close'}
+    for code, df in price_data.items():
+        assert np.array_equal(universe.frame(code)['close'].to_numpy(), df['close'].to_numpy())
+    assert len(empty) == 0 and empty.bar_panel().symbols == []
+
+
+if __name__ == "__main__":
+    test_layout_and_memory()
+    test_grid_prices_match_exactly()
+    test_adjusted_prices_within_tolerance()
+    test_from_store_reads_needed_columns()
+    print("测试完成!")
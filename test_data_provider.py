@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+测试回放数据源：录制后回放得到相同数据，整个选股流程可以离线运行
+"""
+
+import os
+import tempfile
+
+import pandas as pd
+
+import run_daily
+from data_provider import RecordingProvider, ReplayProvider, ReplayDataMissing, set_provider
+from data_store import OHLCVStore
+from incremental_indicators import IndicatorStateStore
+from sector_cache import SectorCache
+from test_screener import create_test_data
+
+
+class FakeProvider:
+    """用测试数据模拟在线接口"""
+
+    name = 'fake'
+
+    def __init__(self, price_data):
+        self.price_data = price_data
+
+    def stock_daily(self, symbol, start_date, end_date, adjust='qfq'):
+        df = self.price_data[symbol[2:]].loc[pd.Timestamp(start_date):pd.Timestamp(end_date)]
+        return df.reset_index()
+
+    def sector_fund_flow(self):
+        return pd.DataFrame({'名称': ['银行', '半导体', '煤炭', '白酒'],
+                             '今日主力净流入-净额': [3e8, 2e8, 1e8, -1e8]})
+
+    def board_constituents(self, sector_name):
+        codes = {'银行': list(self.price_data)[:20], '半导体': list(self.price_data)[20:40],
+                 '煤炭': list(self.price_data)[40:50], '白酒': []}[sector_name]
+        return pd.DataFrame({'代码': codes, '名称': [f"股票{code}" for code in codes]})
+
+    def market_list(self):
+        return pd.DataFrame({'code': list(self.price_data), 'name': list(self.price_data)})
+
+
+def run_pipeline(root, provider, monkeypatch):
+    """用指定数据源和独立的缓存目录运行一次完整选股"""
+    monkeypatch.setattr(run_daily, 'STOCK_STORE', OHLCVStore(os.path.join(root, 'ohlcv')))
+    monkeypatch.setattr(run_daily, 'SECTOR_CACHE', SectorCache(os.path.join(root, 'sectors')))
+    monkeypatch.setattr(run_daily, 'INDICATOR_STATES', IndicatorStateStore(os.path.join(root, 'indicator_state')))
+    monkeypatch.setitem(run_daily.FETCH_PARAMS, 'requests_per_second', 10000)
+    old = set_provider(provider)
+    try:
+        return run_daily.main(return_data=True)
+    finally:
+        set_provider(old)
+
+
+def test_record_then_replay(monkeypatch):
+    """录制一次在线运行，回放运行的选股结果完全相同且不需要在线接口"""
+    price_data = create_test_data(60)
+    with tempfile.TemporaryDirectory() as root:
+        replay_dir = os.path.join(root, 'replay')
+        recorded = run_pipeline(os.path.join(root, 'run1'),
+                                RecordingProvider(FakeProvider(price_data), replay_dir), monkeypatch)
+        replayed = run_pipeline(os.path.join(root, 'run2'), ReplayProvider(replay_dir), monkeypatch)
+
+        assert recorded['stocks'] == replayed['stocks']
+        assert recorded['indicator_snapshot'] == replayed['indicator_snapshot']
+        assert len(os.listdir(os.path.join(replay_dir, 'daily'))) == 50
+
+
+def test_replay_range_and_missing():
+    """回放按日期范围截取，缺少的数据抛出 ReplayDataMissing"""
+    price_data = create_test_data(3)
+    with tempfile.TemporaryDirectory() as root:
+        recorder = RecordingProvider(FakeProvider(price_data), root)
+        code = list(price_data)[0]
+        recorder.stock_daily(f"sh{code}", '20230101', '20230301')
+        recorder.stock_daily(f"sh{code}", '20230201', '20230601')
+
+        replay = ReplayProvider(root)
+        df = replay.stock_daily(f"sh{code}", '20230101', '20230601')
+        expected = price_data[code].loc['2023-01-01':'2023-06-01']
+        assert df['close'].tolist() == expected['close'].tolist()
+        assert len(replay.stock_daily(f"sh{code}", '20230301', '20230310')) == 8
+
+        try:
+            replay.stock_daily('sh999999', '20230101', '20230601')
+            assert False
+        except ReplayDataMissing:
+            pass
+
+
+if __name__ == "__main__":
+    test_replay_range_and_missing()
+    print("测试完成!")
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+测试本地日线数据仓库：增量合并、复权变化后的全量刷新、网络失败时使用本地数据、历史不足时全量下载
+"""
+
+import tempfile
+
+import pandas as pd
+
+from data_store import OHLCVStore
+from test_screener import create_test_data
+
+SYMBOL = 'sh600000'
+
+
+class FakeRemote:
+    """模拟接口：按请求的日期范围截取数据，并记录每次请求的范围"""
+
+    def __init__(self, df):
+        self.df = df
+        self.calls = []
+        self.fail = False
+
+    def __call__(self, start_date, end_date):
+        self.calls.append((start_date, end_date))
+        if self.fail:
+            return None
+        return self.df.loc[pd.Timestamp(start_date):pd.Timestamp(end_date)].copy()
+
+
+def remote_data():
+    return create_test_data(1)['600000'].iloc[:200]
+
+
+def day(df, i):
+    return df.index[i].strftime('%Y%m%d')
+
+
+def assert_bars_equal(result, expected):
+    """逐位相同（仓库读出的日期为 datetime64[ns]）"""
+    expected = expected.set_axis(expected.index.astype('datetime64[ns]'))
+    pd.testing.assert_frame_equal(result, expected, check_freq=False, check_exact=True)
+
+
+def test_full_download_then_incremental_merge():
+    """首次全量下载；之后只请求最后一个已存交易日之后的增量，合并结果与全量数据相同"""
+    df = remote_data()
+    start = day(df, 0)
+    with tempfile.TemporaryDirectory() as root:
+        store = OHLCVStore(root)
+        remote = FakeRemote(df.iloc[:150])
+        first = store.update(SYMBOL, remote, start, day(df, 149))
+        assert remote.calls == [(start, day(df, 149))]
+        assert_bars_equal(first, df.iloc[:150])
+
+        remote = FakeRemote(df)
+        merged = store.update(SYMBOL, remote, start, day(df, -1))
+        assert remote.calls == [(day(df, 149), day(df, -1))]
+        assert_bars_equal(merged, df)
+        assert_bars_equal(store.load(SYMBOL), df)
+        assert store.last_date(SYMBOL) == df.index[-1]
+
+        # 已经是最新的不再请求
+        remote = FakeRemote(df)
+        assert len(store.update(SYMBOL, remote, start, day(df, -1))) == len(df)
+        assert remote.calls == []
+
+
+def test_adjustment_change_triggers_full_refresh():
+    """增量中最后一个已存交易日的收盘价与本地不同（复权因子变化），改为全量重新下载"""
+    df = remote_data()
+    start = day(df, 0)
+    with tempfile.TemporaryDirectory() as root:
+        store = OHLCVStore(root)
+        store.update(SYMBOL, FakeRemote(df.iloc[:150]), start, day(df, 149))
+
+        adjusted = df.copy()
+        for field in ('open', 'high', 'low', 'close'):
+            adjusted[field] = adjusted[field] * 0.9
+        remote = FakeRemote(adjusted)
+        result = store.update(SYMBOL, remote, start, day(df, -1))
+        assert remote.calls == [(day(df, 149), day(df, -1)), (start, day(df, -1))]
+        assert_bars_equal(result, adjusted)
+
+
+def test_network_failure_uses_stored_data():
+    """增量请求失败时返回本地已有数据，不改写仓库"""
+    df = remote_data()
+    start = day(df, 0)
+    with tempfile.TemporaryDirectory() as root:
+        store = OHLCVStore(root)
+        store.update(SYMBOL, FakeRemote(df.iloc[:150]), start, day(df, 149))
+
+        remote = FakeRemote(df)
+        remote.fail = True
+        result = store.update(SYMBOL, remote, start, day(df, -1))
+        assert remote.calls == [(day(df, 149), day(df, -1))]
+        assert_bars_equal(result, df.iloc[:150])
+        assert store.last_date(SYMBOL) == df.index[149]
+
+        # 本地没有数据时全量下载失败返回None
+        assert store.update('sh600001', remote, start, day(df, -1)) is None
+
+
+def test_earlier_start_date_downloads_full_history():
+    """需要的开始日期早于已存历史时全量下载，之后按新的开始日期判断"""
+    df = remote_data()
+    with tempfile.TemporaryDirectory() as root:
+        store = OHLCVStore(root)
+        store.update(SYMBOL, FakeRemote(df.iloc[50:150]), day(df, 50), day(df, 149))
+
+        remote = FakeRemote(df.iloc[:150])
+        result = store.update(SYMBOL, remote, day(df, 0), day(df, 149))
+        assert remote.calls == [(day(df, 0), day(df, 149))]
+        assert_bars_equal(result, df.iloc[:150])
+
+        # 按日期范围读取
+        remote = FakeRemote(df.iloc[:150])
+        window = store.update(SYMBOL, remote, day(df, 100), day(df, 120))
+        assert remote.calls == []
+        assert_bars_equal(window, df.iloc[100:121])
+
+
+if __name__ == "__main__":
+    test_full_download_then_incremental_merge()
+    test_adjustment_change_triggers_full_refresh()
+    test_network_failure_uses_stored_data()
+    test_earlier_start_date_downloads_full_history()
+    print("测试完成!")
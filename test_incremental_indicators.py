@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+测试增量指标状态与 calculate_indicators 逐位一致
+"""
+
+import tempfile
+
+import numpy as np
+
+import run_daily
+from incremental_indicators import IndicatorState, IndicatorStateStore, screen_states
+from screener import screen_price_data
+from test_screener import create_test_data
+
+INDICATOR_COLUMNS = ['MA5', 'MA10', 'MA20', 'MA60', 'Rolling_Max']
+
+
+def test_append_matches_pandas():
+    """逐根加入K线（中途序列化再恢复），每根K线的指标与pandas结果完全相同"""
+    for code, df in list(create_test_data(60).items()):
+        expected = run_daily.calculate_indicators(df.copy())[INDICATOR_COLUMNS].to_numpy()
+
+        state = IndicatorState()
+        got = []
+        for k, (date, row) in enumerate(zip(df.index, df.to_dict('records'))):
+            if k % 37 == 36:
+                state = IndicatorState.from_dict(state.to_dict())
+            indicators = state.append(date, row)
+            got.append([indicators[name] for name in INDICATOR_COLUMNS])
+
+        assert np.array_equal(np.array(got), expected, equal_nan=True), code
+
+
+def test_frame_gives_same_selection():
+    """状态保留的最近K线足以让 check_strategy 得到与全量数据相同的结果"""
+    for code, df in create_test_data(100).items():
+        full = run_daily.calculate_indicators(df.copy())
+        state = IndicatorState.from_frame(df)
+        assert run_daily.check_strategy(state.frame()) == run_daily.check_strategy(full), code
+
+
+def test_store_updates_incrementally():
+    """存储只加入新K线；历史数据被调整时重建"""
+    df = list(create_test_data(3).values())[1]
+    with tempfile.TemporaryDirectory() as root:
+        store = IndicatorStateStore(root)
+        state = store.update('sh600001', df.iloc[:-5])
+        assert state.last_date == df.index[-6]
+
+        state = store.update('sh600001', df)
+        assert state.n_bars == len(df)
+        expected = run_daily.calculate_indicators(df.copy()).iloc[-1]
+        assert state.frame().iloc[-1]['MA60'] == expected['MA60']
+
+        adjusted = df.copy()
+        adjusted['close'] = adjusted['close'] * 0.9
+        state = store.update('sh600001', adjusted)
+        expected = run_daily.calculate_indicators(adjusted.copy()).iloc[-1]
+        assert state.frame().iloc[-1]['MA20'] == expected['MA20']
+
+
+def test_store_skips_unchanged_and_rebuilds_on_new_start():
+    """没有新K线时不改写状态文件；数据起点变化时重建"""
+    df = list(create_test_data(3).values())[2]
+    with tempfile.TemporaryDirectory() as root:
+        store = IndicatorStateStore(root)
+        saved = []
+        save = store.save
+        store.save = lambda symbol, state: (saved.append(state.n_bars), save(symbol, state))
+
+        store.update('sh600002', df.iloc[:-1])
+        store.update('sh600002', df.iloc[:-1])
+        state = store.update('sh600002', df)
+        assert saved == [len(df) - 1, len(df)]
+        assert state.first_date == df.index[0]
+
+        state = store.update('sh600002', df.iloc[3:])
+        assert state.first_date == df.index[3] and state.n_bars == len(df) - 3
+        expected = run_daily.calculate_indicators(df.iloc[3:].copy()).iloc[-1]
+        assert state.frame().iloc[-1]['MA60'] == expected['MA60']
+
+
+def test_screen_states_matches_full_screen():
+    """用状态中的最近K线和指标选股，与对全部历史的向量化选股结果相同（含数据不足的股票）"""
+    price_data = create_test_data(300)
+    states = {code: IndicatorState.from_frame(df) for code, df in price_data.items()}
+    _, expected = screen_price_data(price_data, style='daily')
+    assert screen_states(states) == expected
+    assert any(selected for selected, _ in expected.values())
+    assert any(reason == "数据不足" for _, reason in expected.values())
+
+
+if __name__ == "__main__":
+    test_append_matches_pandas()
+    test_frame_gives_same_selection()
+    test_store_updates_incrementally()
+    test_store_skips_unchanged_and_rebuilds_on_new_start()
+    test_screen_states_matches_full_screen()
+    print("测试完成!")
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+测试滚动指标缓存：每个不同窗口只计算一次，按字节数淘汰，溢出到磁盘后读回
+"""
+
+import os
+import itertools
+import tempfile
+
+import numpy as np
+
+from indicator_cache import IndicatorCache
+from screener import STRATEGY_PARAMS, build_bar_panel, evaluate_panel_history
+from test_screener import create_test_data
+
+
+def param_variants():
+    """50组策略参数"""
+    grid = itertools.product([40, 60], [10, 20], [3, 5], [5, 10], [20, 30])
+    variants = []
+    for high_window, recent_days, lookback, ma_short, ma_mid in itertools.islice(grid, 50):
+        variants.append(dict(STRATEGY_PARAMS, high_window=high_window, recent_days=recent_days,
+                             pullback_lookback=lookback, ma_short=ma_short, ma_mid=ma_mid))
+    return variants
+
+
+def distinct_indicators(variants):
+    keys = set()
+    for params in variants:
+        keys.update({('mean', params['ma_short']), ('mean', 10), ('mean', params['ma_mid']),
+                     ('mean', params['ma_trend']), ('max', params['high_window']),
+                     ('recent_max', params['recent_days']), ('below_ma5', params['ma_short'])})
+    return keys
+
+
+def test_sweep_computes_each_window_once():
+    """多组参数共用缓存：计算次数等于不同指标的个数，结果与不使用缓存逐位一致"""
+    panel = build_bar_panel(create_test_data(60))
+    variants = param_variants()
+    cache = IndicatorCache()
+    for params in variants:
+        expected = evaluate_panel_history(panel, params)
+        cached = evaluate_panel_history(panel, params, cache=cache)
+        for a, b in zip(expected, cached):
+            assert np.array_equal(a, b, equal_nan=True)
+    assert cache.misses == len(distinct_indicators(variants))
+    assert cache.hits > cache.misses
+
+    # 内容不同的矩阵指纹不同，不会取到其他矩阵的指标
+    other = build_bar_panel(dict(list(create_test_data(60).items())[1:]))
+    assert other.version != panel.version
+    misses = cache.misses
+    evaluate_panel_history(other, variants[0], cache=cache)
+    assert cache.misses == misses + 7
+
+
+def test_eviction_and_spill():
+    """超出大小上限时淘汰最久未使用的矩阵；有溢出目录时从磁盘读回而不是重新计算"""
+    a, b, c = (np.full((100, 100), float(i)) for i in range(3))   # 每个约0.08MB
+    cache = IndicatorCache(max_mb=0.2)
+    cache.put('a', a)
+    cache.put('b', b)
+    cache.get('a')
+    cache.put('c', c)
+    assert 'b' not in cache and 'a' in cache and 'c' in cache
+    assert cache.nbytes == a.nbytes + c.nbytes
+
+    with tempfile.TemporaryDirectory() as root:
+        cache = IndicatorCache(max_mb=0.2, spill_dir=root)
+        panel = build_bar_panel(create_test_data(60))
+        for params in param_variants()[:8]:
+            expected = evaluate_panel_history(panel, params)
+            cached = evaluate_panel_history(panel, params, cache=cache)
+            for x, y in zip(expected, cached):
+                assert np.array_equal(x, y, equal_nan=True)
+        assert cache.disk_hits > 0
+        assert cache.stats()['spilled'] == len(os.listdir(root)) > 0
+        assert cache.nbytes <= cache.max_bytes or len(cache) == 1
+        cache.clear()
+        assert os.listdir(root) == []
+
+
+if __name__ == "__main__":
+    test_sweep_computes_each_window_once()
+    test_eviction_and_spill()
+    print("测试完成!")
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+测试扫描时的指标快照，以及详情接口直接使用快照
+"""
+
+import os
+import tempfile
+
+import app as web_app
+import run_daily
+from result_cache import JsonFileCache
+from test_screener import create_test_data
+
+
+def test_snapshot_matches_scan_indicators():
+    """快照中的指标就是 calculate_indicators 的最新值"""
+    df = run_daily.calculate_indicators(list(create_test_data(5).values())[1].copy())
+    snapshot = run_daily.build_indicator_snapshot(df)
+
+    assert len(snapshot['kline']) == min(len(df), run_daily.SNAPSHOT_BARS)
+    assert snapshot['kline'][-1]['date'] == df.index[-1].strftime('%Y-%m-%d')
+    assert snapshot['kline'][-1]['ma60'] == df['MA60'].iloc[-1]
+
+    indicators = snapshot['indicators']
+    assert indicators['ma20'] == round(df['MA20'].iloc[-1], 2)
+    assert indicators['ma60'] == round(df['MA60'].iloc[-1], 2)
+    assert indicators['high_60d'] == round(df['Rolling_Max'].iloc[-1], 2)
+
+
+def test_snapshot_with_missing_volume():
+    """成交量缺失（NaN）时对应字段为None，不影响其他指标"""
+    df = list(create_test_data(5).values())[1].copy()
+    df.iloc[-1, df.columns.get_loc('volume')] = float('nan')
+    df.iloc[-3, df.columns.get_loc('volume')] = float('nan')
+    snapshot = run_daily.build_indicator_snapshot(run_daily.calculate_indicators(df))
+
+    assert snapshot['kline'][-1]['volume'] is None
+    assert snapshot['kline'][-3]['volume'] is None
+    assert snapshot['kline'][-2]['volume'] == 1000000
+    indicators = snapshot['indicators']
+    assert indicators['volume_today'] is None
+    assert indicators['volume_ratio'] is None
+    assert indicators['volume_ma5'] == 1000000
+    assert indicators['ma5'] is not None
+
+
+def test_detail_served_from_snapshot(monkeypatch):
+    """有当天快照时详情接口不下载K线"""
+    df = run_daily.calculate_indicators(list(create_test_data(5).values())[1].copy())
+    snapshot = run_daily.build_indicator_snapshot(df)
+    today = web_app.get_today_date()
+
+    def no_network(stock_code):
+        raise AssertionError("不应访问网络")
+
+    with tempfile.TemporaryDirectory() as root:
+        result_cache = JsonFileCache(os.path.join(root, 'result.json'))
+        indicator_cache = JsonFileCache(os.path.join(root, 'indicators.json'))
+        result_cache.put({'date': today, 'stocks': [
+            {'代码': '600001', '名称': '测试', '板块': '银行', '最新价': 1.0, '理由': '现价:1.00, 回撤:3.0%'}
+        ], 'stats': {}})
+        indicator_cache.put({'date': today, 'stocks': {'600001': snapshot}})
+
+        monkeypatch.setattr(web_app, 'RESULT_CACHE', result_cache)
+        monkeypatch.setattr(web_app, 'INDICATOR_CACHE', indicator_cache)
+        monkeypatch.setattr(web_app, 'fetch_stock_kline_data', no_network)
+
+        data = web_app.app.test_client().get('/api/stock/600001').get_json()
+        assert data['success']
+        assert data['indicators'] == snapshot['indicators']
+        assert data['kline_data'] == snapshot['kline']
+        assert data['stock']['最新价'] == snapshot['kline'][-1]['close']
+        # 共享的缓存数据没有被修改
+        assert result_cache.get()['stocks'][0]['最新价'] == 1.0
+
+
+if __name__ == "__main__":
+    test_snapshot_matches_scan_indicators()
+    test_snapshot_with_missing_volume()
+    print("测试完成!")
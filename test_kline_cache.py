@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+测试LRU缓存、单飞加载与详情页K线缓存
+"""
+
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import app as web_app
+from cache_utils import LRUCache, SingleFlight
+
+
+def test_lru_eviction():
+    """超出容量时淘汰最久未使用的条目"""
+    cache = LRUCache(maxsize=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1      # a 变为最近使用
+    cache.put('c', 3)
+    assert 'b' not in cache
+    assert cache.get('a') == 1 and cache.get('c') == 3
+    assert len(cache) == 2
+
+
+def test_single_flight_shares_result_and_error():
+    """并发调用只执行一次，结果和异常都传给所有调用方"""
+    flight = SingleFlight()
+    calls = []
+    started = threading.Event()
+
+    def slow():
+        calls.append(1)
+        started.set()
+        time.sleep(0.2)
+        return 42
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda _: flight.do('k', slow), range(8)))
+    assert results == [42] * 8
+    assert len(calls) == 1
+
+    def fail():
+        raise ValueError("下载失败")
+    for _ in range(2):
+        try:
+            flight.do('k', fail)
+            assert False
+        except ValueError:
+            pass
+
+
+def test_kline_cache_collapses_concurrent_misses(monkeypatch):
+    """同一只股票的并发请求只下载一次，之后命中缓存；下载失败不缓存"""
+    calls = []
+
+    def fake_fetch(stock_code):
+        calls.append(stock_code)
+        time.sleep(0.2)
+        return [{'date': '2024-01-02', 'close': 10.0}] if stock_code != '000000' else []
+
+    monkeypatch.setattr(web_app, 'fetch_stock_kline_data', fake_fetch)
+    monkeypatch.setattr(web_app, 'KLINE_CACHE', LRUCache(maxsize=8))
+
+    with ThreadPoolExecutor(max_workers=10) as executor:
+        results = list(executor.map(web_app.get_stock_kline_data, ['600519'] * 10))
+    assert all(r is results[0] for r in results)
+    assert web_app.get_stock_kline_data('600519') is results[0]
+    assert calls == ['600519']
+
+    assert web_app.get_stock_kline_data('000000') == []
+    assert web_app.get_stock_kline_data('000000') == []
+    assert calls.count('000000') == 2
+
+    web_app.prewarm_kline_cache(['000001', '000002'])
+    assert ('000001', web_app.get_today_date()) in web_app.KLINE_CACHE
+
+
+if __name__ == "__main__":
+    test_lru_eviction()
+    test_single_flight_shares_result_and_error()
+    print("测试完成!")
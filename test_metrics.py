@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+测试运行指标：直方图统计、选股流程各阶段的计数与耗时、/api/metrics 接口
+"""
+
+import json
+import tempfile
+
+import app as web_app
+from metrics import METRICS, MetricsRegistry, SUMMARY_PREFIX
+from test_data_provider import FakeProvider, run_pipeline
+from test_screener import create_test_data
+
+
+class FlakyProvider(FakeProvider):
+    """部分股票连接失败、部分股票代码无效的数据源"""
+
+    def __init__(self, price_data, broken, invalid=()):
+        super().__init__(price_data)
+        self.broken = broken
+        self.invalid = set(invalid)
+
+    def stock_daily(self, symbol, start_date, end_date, adjust='qfq'):
+        if symbol[2:] in self.broken:
+            raise ConnectionError('Connection reset')
+        if symbol[2:] in self.invalid:
+            raise ValueError('invalid symbol')
+        return super().stock_daily(symbol, start_date, end_date, adjust)
+
+
+def test_histogram_and_timer():
+    """直方图统计次数/分位数，计时上下文在抛出异常时也记录"""
+    metrics = MetricsRegistry()
+    for seconds in (0.002, 0.004, 0.02, 0.3):
+        metrics.observe('fetch.request', seconds)
+    metrics.inc('fetch.retries', 2)
+    try:
+        with metrics.timer('stage.fetch') as t:
+            raise ValueError
+    except ValueError:
+        pass
+
+    snapshot = metrics.snapshot()
+    request = snapshot['timers']['fetch.request']
+    assert request['count'] == 4
+    assert request['max'] == 0.3
+    assert request['p50'] == 0.005
+    assert request['p95'] == 0.3
+    assert sum(request['buckets'].values()) == 4
+    assert snapshot['timers']['stage.fetch']['count'] == 1
+    assert t.seconds >= 0
+    assert snapshot['counters'] == {'fetch.retries': 2}
+
+    line = metrics.summary_line()
+    assert line.startswith(SUMMARY_PREFIX + ' ')
+    assert json.loads(line[len(SUMMARY_PREFIX) + 1:])['counters'] == {'fetch.retries': 2}
+
+
+def test_pipeline_metrics(monkeypatch):
+    """一次选股运行记录资金流、成分股、逐只下载（失败按类型，只重试网络类错误）和筛选各阶段"""
+    price_data = create_test_data(60)
+    broken = set(list(price_data)[:3])
+    invalid = set(list(price_data)[3:5])
+    METRICS.reset()
+    with tempfile.TemporaryDirectory() as root:
+        run_pipeline(root, FlakyProvider(price_data, broken, invalid), monkeypatch)
+
+    snapshot = METRICS.snapshot()
+    counters, timers = snapshot['counters'], snapshot['timers']
+    assert counters['pipeline.runs'] == 1
+    assert counters['fetch.symbols'] == 50
+    assert counters['fetch.failures'] == 5
+    assert counters['fetch.retries'] == 3
+    assert counters['fetch.attempts'] == 50 + 3
+    assert counters['fetch.errors.ConnectionError'] == 3
+    assert counters['fetch.errors.ValueError'] == 2
+    assert timers['fetch.request']['count'] == counters['fetch.attempts']
+    assert timers['fetch.symbol']['count'] == counters['fetch.attempts']
+    assert timers['sector_flow']['count'] == 1
+    assert timers['constituents']['count'] == 3
+    for name in ('stage.universe', 'stage.fetch', 'stage.screen', 'stage.snapshot',
+                 'screen.build_panel', 'screen.indicators'):
+        assert timers[name]['count'] == 1, name
+
+    # Web接口返回同样的指标，并记录接口本身的耗时
+    client = web_app.app.test_client()
+    client.get('/api/strategy')
+    data = client.get('/api/metrics').get_json()
+    assert data['counters']['pipeline.runs'] == 1
+    assert data['timers']['http.get_strategy']['count'] == 1
+    METRICS.reset()
+
+
+if __name__ == "__main__":
+    test_histogram_and_timer()
+    print("测试完成!")
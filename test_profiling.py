@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+测试可选的性能剖析：整个运行和单个Web请求
+"""
+
+import os
+import pstats
+import tempfile
+
+import app as web_app
+import profiling
+
+
+def slow_sum(n):
+    return sum(i * i for i in range(n))
+
+
+def test_run_profiled(monkeypatch, capsys):
+    """开启时写出 .prof 文件并打印最耗时函数，返回值不变；未开启时不写文件"""
+    with tempfile.TemporaryDirectory() as root:
+        monkeypatch.setitem(profiling.PROFILE_CONFIG, 'dir', root)
+        assert profiling.run_profiled('unit', slow_sum, 1000, enabled=False) == slow_sum(1000)
+        assert os.listdir(root) == []
+
+        assert profiling.run_profiled('unit', slow_sum, 1000, enabled=True) == slow_sum(1000)
+        files = os.listdir(root)
+        assert len(files) == 1 and files[0].startswith('profile_unit_') and files[0].endswith('.prof')
+        stats = pstats.Stats(os.path.join(root, files[0]))
+        assert any(func[2] == 'slow_sum' for func in stats.stats)
+        assert 'slow_sum' in capsys.readouterr().out
+
+        # 抛出异常时同样保存
+        try:
+            profiling.run_profiled('failing', lambda: 1 / 0, enabled=True)
+            assert False
+        except ZeroDivisionError:
+            pass
+        assert len(os.listdir(root)) == 2
+
+    assert profiling.profile_requested(['--universe', 'all', '--profile'])
+
+
+def test_request_profiler(monkeypatch):
+    """只剖析匹配路径前缀的请求"""
+    with tempfile.TemporaryDirectory() as root:
+        monkeypatch.setitem(profiling.PROFILE_CONFIG, 'dir', root)
+        monkeypatch.setitem(profiling.PROFILE_CONFIG, 'requests', '/api/strategy')
+        client = web_app.app.test_client()
+
+        assert client.get('/api/strategy').status_code == 200
+        files = os.listdir(root)
+        assert len(files) == 1 and files[0].startswith('profile_GET_api_strategy_')
+
+        client.get('/api/metrics')
+        assert len(os.listdir(root)) == 1
+
+        monkeypatch.setitem(profiling.PROFILE_CONFIG, 'requests', '')
+        client.get('/api/strategy')
+        assert len(os.listdir(root)) == 1
+
+
+if __name__ == "__main__":
+    print(profiling.run_profiled('test', slow_sum, 100000, enabled=True))
+    print("测试完成!")
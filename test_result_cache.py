@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+测试选股结果的进程内缓存，以及读取接口不阻塞选股
+"""
+
+import os
+import time
+import tempfile
+import threading
+
+import app as web_app
+from background_jobs import SingleFlightRunner
+from result_cache import JsonFileCache, write_json_atomic
+
+
+def test_cache_reloads_only_when_file_changes():
+    """文件未变化时返回同一个对象，文件被替换后重新加载"""
+    with tempfile.TemporaryDirectory() as root:
+        path = os.path.join(root, 'cache', 'result.json')
+        cache = JsonFileCache(path)
+        assert cache.get() is None
+
+        write_json_atomic(path, {'date': '2024-01-02', 'stocks': []})
+        data1 = cache.get()
+        assert data1['date'] == '2024-01-02'
+        assert cache.get() is data1
+
+        # 其他进程（如 cron 脚本）写入新文件
+        write_json_atomic(path, {'date': '2024-01-03', 'stocks': [{'代码': '600519'}]})
+        os.utime(path, ns=(time.time_ns(), time.time_ns() + 10**9))
+        data2 = cache.get()
+        assert data2['date'] == '2024-01-03'
+
+        cache.put({'date': '2024-01-04', 'stocks': []})
+        assert cache.get()['date'] == '2024-01-04'
+        assert JsonFileCache(path).get()['date'] == '2024-01-04'
+
+
+def test_stale_cache_never_blocks_read(monkeypatch):
+    """缓存不是今天的数据时，读取接口立即返回旧数据，选股在后台只启动一次"""
+    release = threading.Event()
+    calls = []
+
+    def slow_selection(progress=None):
+        calls.append(1)
+        release.wait(5)
+        return None
+
+    with tempfile.TemporaryDirectory() as root:
+        path = os.path.join(root, 'result.json')
+        write_json_atomic(path, {'date': '2000-01-01', 'stocks': [], 'stats': {'total': 0}})
+        monkeypatch.setattr(web_app, 'RESULT_CACHE', JsonFileCache(path))
+        monkeypatch.setattr(web_app, 'SELECTION_JOBS', SingleFlightRunner('测试'))
+        monkeypatch.setattr(web_app, 'run_selection_and_save', slow_selection)
+        client = web_app.app.test_client()
+
+        start = time.time()
+        data = client.get('/api/stocks').get_json()
+        assert client.get('/api/stats').get_json() == {'total': 0}
+        assert time.time() - start < 2
+        assert data['date'] == '2000-01-01' and data['stale']
+
+        release.set()
+        deadline = time.time() + 5
+        while web_app.SELECTION_JOBS.is_running():
+            assert time.time() < deadline
+            time.sleep(0.01)
+        assert len(calls) == 1
+
+
+
+def test_partial_results_written_while_scanning(monkeypatch):
+    """扫描过程中入选股票增量写入结果文件（partial），结束后按股票池顺序写入完整结果"""
+    stock_list = [{'code': '600002', 'name': '乙', 'sector': '银行'},
+                  {'code': '600001', 'name': '甲', 'sector': '银行'},
+                  {'code': '600003', 'name': '丙', 'sector': '煤炭'}]
+    snapshot = {'kline': [{'date': '2024-01-02', 'close': 10.5}], 'indicators': {}}
+    observed = []
+    refreshes = []
+
+    def fake_scan(codes, progress=None):
+        yield '600001', True, '理由一', 10.5, snapshot
+        observed.append(web_app.RESULT_CACHE.get())
+        observed.append(web_app.load_cached_data())
+        yield '600003', False, '趋势未确立', 9.0, None
+        yield '600002', True, '理由二', 10.5, snapshot
+
+    with tempfile.TemporaryDirectory() as root:
+        monkeypatch.setattr(web_app, 'RESULT_CACHE', JsonFileCache(os.path.join(root, 'result.json')))
+        monkeypatch.setattr(web_app, 'INDICATOR_CACHE', JsonFileCache(os.path.join(root, 'indicators.json')))
+        monkeypatch.setattr(web_app, 'STREAM_WRITE_INTERVAL', 0)
+        monkeypatch.setattr(web_app, 'get_stock_universe', lambda: (stock_list, ['600002', '600001', '600003']))
+        monkeypatch.setattr(web_app, 'scan', fake_scan)
+        monkeypatch.setattr(web_app, 'prewarm_kline_cache', lambda codes, progress=None: None)
+        monkeypatch.setattr(web_app, 'start_background_refresh', lambda: refreshes.append(1))
+
+        result = web_app.run_selection_and_save()
+
+        partial, loaded = observed
+        assert partial['partial'] and [s['代码'] for s in partial['stocks']] == ['600001']
+        assert loaded['stale'] and refreshes == [1]
+
+        saved = web_app.RESULT_CACHE.get()
+        assert 'partial' not in saved and saved == result
+        assert [s['代码'] for s in saved['stocks']] == ['600002', '600001']
+        assert saved['stocks'][0]['最新价'] == 10.5
+        assert set(web_app.INDICATOR_CACHE.get()['stocks']) == {'600001', '600002'}
+
+
+if __name__ == "__main__":
+    test_cache_reloads_only_when_file_changes()
+    print("测试完成!")
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+测试 run_daily 的全市场扫描流程（不访问网络）
+"""
+
+import datetime
+import tempfile
+
+import run_daily
+from data_provider import set_provider
+from data_store import OHLCVStore
+from incremental_indicators import IndicatorStateStore
+from test_metrics import FlakyProvider
+from test_screener import create_test_data
+
+
+def test_full_market_scan_matches_check_strategy(monkeypatch):
+    """全市场模式的入选结果与逐只调用 check_strategy 相同，并支持板块后置过滤"""
+    with tempfile.TemporaryDirectory() as root:
+        monkeypatch.setattr(run_daily, 'INDICATOR_STATES', IndicatorStateStore(root))
+        price_data = create_test_data(120)
+        names = {code: f"股票{code}" for code in price_data}
+        names['600003'] = '*ST测试'
+
+        monkeypatch.setattr(run_daily, 'get_market_stock_list', lambda: [
+            {'code': code, 'name': name, 'sector': '全市场'} for code, name in names.items()
+        ])
+        monkeypatch.setattr(run_daily, 'get_stock_data', lambda code, **kwargs: price_data[code].copy())
+        monkeypatch.setitem(run_daily.FETCH_PARAMS, 'requests_per_second', 10000)
+        # 本地数据仓库视为空，全部走下载
+        monkeypatch.setattr(run_daily, 'latest_bar_date', lambda now=None: run_daily.pd.Timestamp('2100-01-01'))
+
+        result = run_daily.main(return_data=True, universe='all')
+
+        expected = []
+        for code, df in price_data.items():
+            if 'ST' in names[code]:
+                continue
+            is_selected, reason = run_daily.check_strategy(run_daily.calculate_indicators(df.copy()))
+            if is_selected:
+                expected.append((code, reason))
+        assert [(s['代码'], s['理由']) for s in result['stocks']] == expected
+        assert set(result['indicator_snapshot']) == {code for code, _ in expected}
+        assert expected
+        # 指标快照由增量状态生成，与对全部历史计算指标的结果相同
+        for code, _ in expected:
+            full = run_daily.build_indicator_snapshot(run_daily.calculate_indicators(price_data[code].copy()))
+            assert result['indicator_snapshot'][code] == full, code
+
+        # 板块后置过滤：只保留前N板块中的股票，并记录所属板块
+        keep = expected[0][0]
+        monkeypatch.setattr(run_daily, 'get_sector_stock_list', lambda top_n=3: [
+            {'code': keep, 'name': names[keep], 'sector': '银行'}
+        ])
+        result = run_daily.main(return_data=True, universe='all', top_sectors=3)
+        assert [(s['代码'], s['板块']) for s in result['stocks']] == [(keep, '银行')]
+
+
+def test_scan_streams_batches(monkeypatch):
+    """流式扫描按批产出，扫描结束前就有结果，入选结果与一次筛选相同"""
+    with tempfile.TemporaryDirectory() as root:
+        monkeypatch.setattr(run_daily, 'INDICATOR_STATES', IndicatorStateStore(root))
+        price_data = create_test_data(120)
+        monkeypatch.setattr(run_daily, 'get_stock_data', lambda code, **kwargs: price_data[code].copy())
+        monkeypatch.setitem(run_daily.FETCH_PARAMS, 'requests_per_second', 10000)
+        monkeypatch.setattr(run_daily, 'latest_bar_date', lambda now=None: run_daily.pd.Timestamp('2100-01-01'))
+
+        fetched = []
+        progress = lambda stage=None, done=None, total=None: done is not None and fetched.append(done)
+        first_yield_at = None
+        timings = {}
+        streamed = {}
+        for symbol, is_selected, reason, price, indicators in run_daily.scan(list(price_data), progress, batch_size=16,
+                                                                             flush_seconds=0, timings=timings):
+            if first_yield_at is None:
+                first_yield_at = fetched[-1]
+            streamed[symbol] = (is_selected, reason)
+            assert (indicators is not None) == is_selected
+            assert price == price_data[symbol]['close'].iloc[-1]
+
+        assert first_yield_at < len(price_data)
+        assert set(timings) == {'获取数据', '筛选', '指标快照'}
+        for code, df in price_data.items():
+            expected = run_daily.check_strategy(run_daily.calculate_indicators(df.copy()))
+            assert streamed[code] == expected, code
+
+
+def test_cli_scan_skips_snapshots(monkeypatch):
+    """命令行运行不生成指标快照，成交量缺失也不影响入选结果与最新价"""
+    with tempfile.TemporaryDirectory() as root:
+        monkeypatch.setattr(run_daily, 'INDICATOR_STATES', IndicatorStateStore(root))
+        price_data = create_test_data(60)
+        for df in price_data.values():
+            df.loc[df.index[-1], 'volume'] = float('nan')
+        monkeypatch.setattr(run_daily, 'get_stock_data', lambda code, **kwargs: price_data[code].copy())
+        monkeypatch.setitem(run_daily.FETCH_PARAMS, 'requests_per_second', 10000)
+        monkeypatch.setattr(run_daily, 'latest_bar_date', lambda now=None: run_daily.pd.Timestamp('2100-01-01'))
+        snapshots = []
+        monkeypatch.setattr(run_daily, 'build_indicator_snapshot', lambda df: snapshots.append(df))
+
+        scanned = list(run_daily.scan(list(price_data), batch_size=16, flush_seconds=0, snapshots=False))
+        assert not snapshots
+        assert any(is_selected for _, is_selected, _, _, _ in scanned)
+        for symbol, is_selected, reason, price, indicators in scanned:
+            assert indicators is None
+            assert price == price_data[symbol]['close'].iloc[-1]
+
+
+def test_failed_download_falls_back_to_store(monkeypatch):
+    """增量下载最终失败时使用本地已有数据；无效代码只请求一次"""
+    price_data = create_test_data(3)
+    stale, broken, invalid = list(price_data)
+    monkeypatch.setitem(run_daily.FETCH_PARAMS, 'requests_per_second', 10000)
+    monkeypatch.setitem(run_daily.FETCH_PARAMS, 'backoff', 0.01)
+    with tempfile.TemporaryDirectory() as root:
+        store = OHLCVStore(root)
+        monkeypatch.setattr(run_daily, 'STOCK_STORE', store)
+        monkeypatch.setattr(run_daily, 'INDICATOR_STATES', IndicatorStateStore(f'{root}/indicator_state'))
+        for code in (stale, broken):
+            store.save(run_daily.add_market_prefix(code), price_data[code].iloc[:-5],
+                       start_date=run_daily.STRATEGY_PARAMS['start_date'])
+        old = set_provider(FlakyProvider(price_data, {broken}, {invalid}))
+        try:
+            stats = {}
+            fetched = dict(run_daily.iter_price_data(list(price_data), stats=stats))
+        finally:
+            set_provider(old)
+
+    assert fetched[stale].index.equals(price_data[stale].index)
+    assert fetched[broken].index.equals(price_data[broken].index[:-5])
+    assert fetched[invalid] is None
+    assert stats == {'requests': 4, 'retries': 1, 'failures': 2}
+
+
+def test_latest_bar_date():
+    """收盘前取上一个工作日，周末取周五"""
+    assert run_daily.latest_bar_date(datetime.datetime(2024, 1, 10, 17)).day == 10
+    assert run_daily.latest_bar_date(datetime.datetime(2024, 1, 10, 10)).day == 9
+    assert run_daily.latest_bar_date(datetime.datetime(2024, 1, 14, 12)).day == 12
+    assert run_daily.latest_bar_date(datetime.datetime(2024, 1, 15, 9)).day == 12
+
+
+if __name__ == "__main__":
+    test_latest_bar_date()
+    print("测试完成!")
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+测试向量化选股与 check_strategy 的一致性
+"""
+
+import numpy as np
+import pandas as pd
+
+import main
+import run_daily
+from screener import (build_bar_panel, screen_panel, rolling_means, rolling_max,
+                      generate_signal_history)
+
+
+def create_test_data(n_stocks=300):
+    """创建长度不一的随机走势数据，部分股票带有平盘区间"""
+    rng = np.random.default_rng(0)
+    price_data = {}
+
+    for i in range(n_stocks):
+        n = int(rng.integers(40, 400))
+        dates = pd.bdate_range('2023-01-02', periods=n)
+        close = np.round(10 * np.exp(np.cumsum(rng.normal(0.002, 0.02, n))), 2)
+        if i % 10 == 0:
+            close[-8:-3] = close[-8]  # 平盘：收盘价恰好等于MA5
+        open_ = np.round(close * (1 + rng.normal(0, 0.01, n)), 2)
+        high = np.round(np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.01, n))), 2)
+
+        price_data[f'{600000 + i}'] = pd.DataFrame({
+            'open': open_,
+            'high': high,
+            'low': np.minimum(open_, close) * 0.99,
+            'close': close,
+            'volume': 1000000.0
+        }, index=pd.DatetimeIndex(dates, name='date'))
+
+    return price_data
+
+
+def test_rolling_matches_pandas():
+    """滚动均值/最大值与pandas逐位一致"""
+    panel = build_bar_panel(create_test_data())
+    close = panel['close']
+
+    for window, result in zip((5, 10, 20, 60), rolling_means(close, (5, 10, 20, 60))):
+        expected = pd.DataFrame(close).rolling(window).mean().to_numpy()
+        assert np.array_equal(result, expected, equal_nan=True), f"MA{window} 不一致"
+
+    expected = pd.DataFrame(panel['high']).rolling(60).max().to_numpy()
+    assert np.array_equal(rolling_max(panel['high'], 60), expected, equal_nan=True)
+
+
+def test_screen_matches_check_strategy():
+    """最新一根K线的选股结果和理由与 check_strategy 完全相同"""
+    price_data = create_test_data()
+    panel = build_bar_panel(price_data)
+
+    daily_results = screen_panel(panel, style='daily')
+    main_results = screen_panel(panel, style='main')
+
+    n_selected = 0
+    for code, df in price_data.items():
+        df = run_daily.calculate_indicators(df.copy())
+        assert daily_results[code] == run_daily.check_strategy(df), code
+        assert main_results[code] == main.check_strategy(df, code), code
+        n_selected += daily_results[code][0]
+
+    print(f"共 {len(price_data)} 只股票，入选 {n_selected} 只，结果一致")
+    assert n_selected > 0
+
+
+def test_signal_history_matches_check_strategy():
+    """历史信号等于逐日截取数据后调用 check_strategy 的结果"""
+    price_data = dict(list(create_test_data().items())[:40])
+    signals = generate_signal_history(price_data, start_date='2023-06-01')
+
+    expected = {}
+    for code, df in price_data.items():
+        df = run_daily.calculate_indicators(df.copy())
+        for k in range(len(df)):
+            date_str = df.index[k].strftime('%Y-%m-%d')
+            if date_str < '2023-06-01':
+                continue
+            is_selected, _ = run_daily.check_strategy(df.iloc[:k + 1])
+            if is_selected:
+                expected.setdefault(date_str, []).append(code)
+
+    got = {date_str: [s['code'] for s in stocks] for date_str, stocks in signals.items()}
+    print(f"共 {len(got)} 个信号日，{sum(len(v) for v in got.values())} 个信号")
+    assert got == expected
+
+
+if __name__ == "__main__":
+    test_rolling_matches_pandas()
+    test_screen_matches_check_strategy()
+    test_signal_history_matches_check_strategy()
+    print("测试完成!")
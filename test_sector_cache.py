@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+测试板块成分股缓存与资金流快照归档
+"""
+
+import tempfile
+
+import pandas as pd
+
+from sector_cache import SectorCache
+
+
+def make_fetcher(calls, fail=False):
+    """返回记录调用次数的假成分股接口"""
+    def fetch(sector_name):
+        calls.append(sector_name)
+        if fail:
+            raise ConnectionError("接口超时")
+        return pd.DataFrame({'代码': ['000001', '600519'], '名称': ['平安银行', '贵州茅台']})
+    return fetch
+
+
+def test_constituents_ttl():
+    """有效期内不重复请求，过期后重新请求，接口失败时退回过期缓存"""
+    calls = []
+    with tempfile.TemporaryDirectory() as root:
+        cache = SectorCache(root=root, ttl_hours=1)
+        df1 = cache.get_constituents('银行', fetch_func=make_fetcher(calls))
+        df2 = cache.get_constituents('银行', fetch_func=make_fetcher(calls))
+        assert len(calls) == 1
+        pd.testing.assert_frame_equal(df1, df2)
+        assert df2['代码'].tolist() == ['000001', '600519']
+
+        expired = SectorCache(root=root, ttl_hours=0)
+        expired.get_constituents('银行', fetch_func=make_fetcher(calls))
+        assert len(calls) == 2
+
+        df3 = expired.get_constituents('银行', fetch_func=make_fetcher(calls, fail=True))
+        assert len(calls) == 3
+        pd.testing.assert_frame_equal(df1, df3)
+
+
+def test_fund_flow_snapshots():
+    """资金流排名按日期归档，可按日期读回"""
+    flow = pd.DataFrame({'名称': ['银行', '半导体'], '今日主力净流入-净额': [1.5e8, -2.0e7]})
+    with tempfile.TemporaryDirectory() as root:
+        cache = SectorCache(root=root)
+        cache.fetch_fund_flow(fetch_func=lambda: flow, date_str='2024-01-02')
+        cache.fetch_fund_flow(fetch_func=lambda: flow.iloc[::-1], date_str='2024-01-03')
+
+        assert cache.fund_flow_dates() == ['2024-01-02', '2024-01-03']
+        pd.testing.assert_frame_equal(cache.load_fund_flow('2024-01-02'), flow)
+        assert cache.load_fund_flow('2024-01-04') is None
+
+
+if __name__ == "__main__":
+    test_constituents_ttl()
+    test_fund_flow_snapshots()
+    print("测试完成!")
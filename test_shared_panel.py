@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+测试共享内存价格面板：各种视图与原有数据结构一致，子进程可以挂载
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from backtest import PriceMatrix
+from screener import build_bar_panel
+from shared_panel import SharedPricePanel
+from test_screener import create_test_data
+
+
+def _child_close_sum(handle):
+    """在子进程中挂载面板并计算收盘价之和"""
+    panel = SharedPricePanel.attach(handle)
+    total = float(np.nansum(panel.field('close')))
+    panel.close()
+    return total
+
+
+def test_views_match_price_data():
+    """价格矩阵、单只股票数据、右对齐矩阵与直接由 price_data 构建的结果相同"""
+    price_data = create_test_data(50)
+    with SharedPricePanel.create(price_data) as panel:
+        matrix = panel.price_matrix()
+        expected = PriceMatrix.from_price_data(price_data)
+        assert matrix.codes == expected.codes
+        assert matrix.dates.equals(expected.dates)
+        assert np.array_equal(matrix.close, expected.close, equal_nan=True)
+        assert np.array_equal(matrix.available, expected.available)
+
+        for code, df in price_data.items():
+            df = df.set_axis(df.index.astype('datetime64[ns]'))
+            pd.testing.assert_frame_equal(panel.frame(code), df, check_exact=True, check_freq=False)
+
+        bars = panel.bar_panel()
+        expected = build_bar_panel(price_data)
+        assert np.array_equal(bars.n_bars, expected.n_bars)
+        assert np.array_equal(bars.dates.view('i8'), expected.dates.view('i8'))
+        for field in ('open', 'high', 'close'):
+            assert np.array_equal(bars[field], expected[field], equal_nan=True)
+        del matrix, bars
+
+
+def test_attach_in_child_process():
+    """子进程通过句柄挂载同一块共享内存"""
+    price_data = create_test_data(20)
+    with SharedPricePanel.create(price_data, fields=('close',)) as panel:
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            totals = list(executor.map(_child_close_sum, [panel.handle] * 2))
+        expected = float(np.nansum(panel.field('close')))
+    assert totals == [expected, expected]
+
+
+if __name__ == "__main__":
+    test_views_match_price_data()
+    test_attach_in_child_process()
+    print("测试完成!")
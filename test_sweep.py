@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+测试回测参数扫描：网格展开（并入共用参数后去重）与多进程结果
+"""
+
+import io
+import contextlib
+
+from backtest import ArrayBacktestEngine, PriceMatrix
+from sweep import RESULT_METRICS, expand_grid, run_parameter_sweep
+from test_weekly_rebalance import create_test_data
+
+
+def test_expand_grid():
+    """未启用每周调仓时不同调仓日合并为一个组合；共用参数中启用时保留全部调仓日"""
+    grid = {'stop_loss_pct': [0.03, 0.04], 'rebalance_day': [0, 2, 4]}
+    assert expand_grid(grid) == [{'stop_loss_pct': 0.03, 'rebalance_day': 0},
+                                 {'stop_loss_pct': 0.04, 'rebalance_day': 0}]
+
+    points = expand_grid(grid, base_params={'rebalance_weekly': True, 'initial_capital': 500000})
+    assert len(points) == 6
+    assert {p['rebalance_day'] for p in points} == {0, 2, 4}
+    assert all(p['rebalance_weekly'] and p['initial_capital'] == 500000 for p in points)
+
+    # 网格中的参数优先于共用参数
+    points = expand_grid({'rebalance_weekly': [False, True], 'rebalance_day': [0, 4]},
+                         base_params={'rebalance_weekly': True})
+    assert len(points) == 3
+
+
+def test_run_parameter_sweep():
+    """每个组合的结果与直接运行数组版回测引擎相同"""
+    signals, price_data, _ = create_test_data()
+    matrix = PriceMatrix.from_price_data(price_data)
+    with contextlib.redirect_stdout(io.StringIO()):
+        df = run_parameter_sweep(signals, matrix, {'rebalance_day': [0, 2, 4]},
+                                 base_params={'rebalance_weekly': True}, processes=2)
+    assert sorted(df['rebalance_day']) == [0, 2, 4]
+    for row in df.to_dict('records'):
+        engine = ArrayBacktestEngine(rebalance_weekly=True, rebalance_day=row['rebalance_day'])
+        with contextlib.redirect_stdout(io.StringIO()):
+            expected = engine.run_backtest(signals, matrix)
+        assert all(row[key] == expected[key] for key in RESULT_METRICS)
+
+
+if __name__ == "__main__":
+    test_expand_grid()
+    test_run_parameter_sweep()
+    print("测试完成!")
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+测试交易日历：日期与序号互查、星期、按日期截取，以及回测引擎/信号生成使用日历后的结果
+"""
+
+import numpy as np
+import pandas as pd
+
+from backtest import ArrayBacktestEngine, PriceMatrix
+from screener import build_bar_panel, evaluate_panel_history, signals_from_status
+from test_screener import create_test_data
+from trading_calendar import TradingCalendar, parse_date_keys
+
+
+def test_mapping_and_weekday():
+    """乱序、重复的日期合并为有序日历，字符串与序号互查，星期与 pandas 一致"""
+    dates = pd.bdate_range('2023-12-25', periods=20)
+    calendar = TradingCalendar.from_dates(dates[10:], dates[:12])
+    assert len(calendar) == 20
+    assert calendar.dates.equals(dates)
+    assert calendar.date_strs == [d.strftime('%Y-%m-%d') for d in dates]
+    assert all(calendar.ordinal[s] == i for i, s in enumerate(calendar.date_strs))
+    assert calendar.weekday.tolist() == dates.weekday.tolist()
+
+    assert calendar.ordinals(np.array(['2024-01-02', '2024-01-06', '2030-01-01'], dtype='datetime64[D]')).tolist() == [6, -1, -1]
+    assert calendar.bounds('2024-01-06', '2024-01-09') == (10, 12)
+    window = calendar.between('2024-01-06', '2024-01-09')
+    assert window.date_strs == ['2024-01-08', '2024-01-09']
+    assert window.ordinal == {'2024-01-08': 0, '2024-01-09': 1}
+    assert calendar.between() is calendar
+    assert len(calendar.between('2030-01-01')) == 0
+
+
+def test_union_with_signal_dates():
+    """信号日期都在日历中时不重新构建；非交易日的信号日期加入日历，无法解析的（含 NaT）忽略"""
+    calendar = TradingCalendar.from_dates(pd.bdate_range('2024-01-01', periods=5))
+    assert calendar.union({'2024-01-02': [], '2024-01-05': []}) is calendar
+    merged = calendar.union({'2024-01-06': [], 'bad': [], '2024-1-7': []})
+    assert merged.date_strs[-2:] == ['2024-01-06', '2024-01-07']
+    assert merged.weekday[-2:].tolist() == [5, 6]
+    assert parse_date_keys(['x']).size == 0
+
+    # 只接受完整的 'YYYY-MM-DD'，'NaT'、只有年月的键不进入日历
+    assert parse_date_keys(['2023-01', 'NaT', '2023-01-05']).astype(str).tolist() == ['2023-01-05']
+    assert parse_date_keys(['NaT']).size == 0
+    assert parse_date_keys(['2023-02-30', '2023-03-01']).astype(str).tolist() == ['2023-03-01']
+    assert calendar.union({'NaT': [], '2024-01': []}) is calendar
+
+
+def test_panel_day_index_and_signals():
+    """右对齐矩阵的交易日序号与日期一致，按日期范围截取的信号与直接比较日期相同"""
+    panel = build_bar_panel(create_test_data(60))
+    valid = ~np.isnat(panel.dates)
+    assert (panel.day_index[~valid] == -1).all()
+    assert np.array_equal(panel.calendar.days[panel.day_index[valid]],
+                          panel.dates[valid].astype('datetime64[D]').view(np.int64))
+
+    status, _, _ = evaluate_panel_history(panel)
+    signals = signals_from_status(panel, status, start_date='2023-03-04', end_date='2023-09-30')
+    hit = (status == 0) & (panel.dates >= np.datetime64('2023-03-04')) & (panel.dates <= np.datetime64('2023-09-30'))
+    assert sum(len(v) for v in signals.values()) == hit.sum()
+    assert list(signals) == sorted(signals)
+    assert min(signals) >= '2023-03-06' and max(signals) <= '2023-09-29'
+
+
+def test_engine_shares_matrix_calendar():
+    """同一价格矩阵上的多次回测共用矩阵的日历；持仓天数按日历计算"""
+    price_data = create_test_data(60)
+    panel = build_bar_panel(price_data)
+    status, _, _ = evaluate_panel_history(panel)
+    signals = signals_from_status(panel, status)
+    matrix = PriceMatrix.from_price_data(price_data)
+    calendar = matrix.calendar
+    for start_date, end_date in (('2023-03-01', '2023-06-30'), ('2023-07-01', '2023-12-31')):
+        results = ArrayBacktestEngine(rebalance_weekly=True).run_backtest(signals, matrix, start_date, end_date)
+        history = results['portfolio_history']
+        assert history.index.equals(calendar.between(start_date, end_date).dates.rename('date'))
+    assert matrix.calendar is calendar
+    trades = results['trade_history']
+    sells = trades[trades['action'] == 'SELL']
+    assert (sells['holding_days'] >= 0).all() and len(sells) > 0
+
+
+if __name__ == "__main__":
+    test_mapping_and_weekday()
+    test_union_with_signal_dates()
+    test_panel_day_index_and_signals()
+    test_engine_shares_matrix_calendar()
+    print("测试完成!")
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+测试滚动窗口回测：窗口划分、带缓存的历史信号、样本外净值拼接
+"""
+
+import numpy as np
+import pandas as pd
+
+import walk_forward
+from cache_utils import LRUCache
+from screener import STRATEGY_PARAMS, build_bar_panel, evaluate_panel_history
+from test_screener import create_test_data
+
+
+def test_make_windows():
+    """测试窗口首尾相接、不与训练窗口重叠；训练窗口都在测试窗口之前"""
+    dates = pd.bdate_range('2023-01-02', periods=100)
+    windows = walk_forward.make_windows(dates, train_days=40, test_days=15)
+    assert len(windows) == 4
+    assert windows[-1]['test_end'] == dates[-1].strftime('%Y-%m-%d')
+    for prev, window in zip(windows, windows[1:]):
+        assert pd.Timestamp(window['test_start']) > pd.Timestamp(prev['test_end'])
+    for window in windows:
+        assert window['train_end'] < window['test_start']
+        n_train = ((dates >= window['train_start']) & (dates <= window['train_end'])).sum()
+        assert n_train == 40
+
+    anchored = walk_forward.make_windows(dates, train_days=40, test_days=15, anchored=True)
+    assert {w['train_start'] for w in anchored} == {'2023-01-02'}
+    assert [w['test_start'] for w in anchored] == [w['test_start'] for w in windows]
+    assert walk_forward.make_windows(dates, train_days=100, test_days=15) == []
+
+
+def test_cached_history_matches_uncached():
+    """共用指标缓存计算多组参数，结果与不使用缓存逐位一致"""
+    panel = build_bar_panel(create_test_data(80))
+    cache = LRUCache(maxsize=32)
+    for high_window, recent_days in ((60, 20), (60, 10), (40, 20)):
+        params = dict(STRATEGY_PARAMS, high_window=high_window, recent_days=recent_days)
+        expected = evaluate_panel_history(panel, params)
+        cached = evaluate_panel_history(panel, params, cache=cache)
+        for a, b in zip(expected, cached):
+            assert np.array_equal(a, b, equal_nan=True)
+    assert cache.hits > 0
+
+
+def test_run_walk_forward():
+    """多进程滚动回测：每个窗口选出一组参数，样本外净值覆盖全部测试窗口"""
+    price_data = create_test_data(40)
+    result = walk_forward.run_walk_forward(
+        price_data,
+        strategy_grid={'recent_days': [10, 20]},
+        engine_grid={'stop_loss_pct': [0.03, 0.06]},
+        train_days=120, test_days=40, processes=2
+    )
+    windows = result['windows']
+    assert len(windows) == result['summary']['windows'] > 1
+    assert len(result['train_results']) == len(windows) * 4
+    assert set(windows['recent_days']) <= {10, 20}
+
+    equity = result['equity']
+    assert equity.index.is_monotonic_increasing
+    assert equity.index[0] == pd.Timestamp(windows['test_start'].iloc[0])
+    assert equity.index[-1] == pd.Timestamp(windows['test_end'].iloc[-1])
+    expected = np.prod(windows['test_final_value'] / 1000000) * 1000000
+    assert np.isclose(equity.iloc[-1], expected)
+
+
+def test_base_engine_merged_before_dedup():
+    """共用参数中启用每周调仓时，网格中的各个调仓日都是候选组合"""
+    result = walk_forward.run_walk_forward(
+        create_test_data(20),
+        strategy_grid={},
+        engine_grid={'rebalance_day': [0, 2, 4]},
+        base_engine={'rebalance_weekly': True},
+        train_days=120, test_days=60, processes=2
+    )
+    train = result['train_results']
+    assert len(train) == len(result['windows']) * 3
+    assert sorted(set(train['rebalance_day'])) == [0, 2, 4]
+    assert train['rebalance_weekly'].all()
+
+
+def test_stitch_equity():
+    """各段按收益率首尾相接"""
+    first = pd.Series([100.0, 110.0], index=pd.to_datetime(['2023-01-02', '2023-01-03']))
+    second = pd.Series([100.0, 90.0], index=pd.to_datetime(['2023-01-04', '2023-01-05']))
+    equity = walk_forward.stitch_equity([first, second], 100.0)
+    assert np.allclose(equity.to_numpy(), [100.0, 110.0, 110.0, 99.0])
+    assert np.isclose(walk_forward.equity_stats(equity, 100.0)['total_return_pct'], -1.0)
+
+
+if __name__ == "__main__":
+    test_make_windows()
+    test_cached_history_matches_uncached()
+    test_stitch_equity()
+    test_run_walk_forward()
+    test_base_engine_merged_before_dedup()
+    print("测试完成!")
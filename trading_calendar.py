@@ -0,0 +1,154 @@
+"""
+交易日历
+把一组交易日整理成排好序的整数数组（1970-01-01 起的天数），并预先计算：
+- 每个交易日的星期（0=周一，...，6=周日）
+- 'YYYY-MM-DD' 字符串，以及字符串 -> 交易日序号的字典
+
+回测引擎和信号生成都按交易日序号（整数）取数，不再在逐日循环中
+用 set 收集日期、strftime 格式化日期或 strptime 解析信号日期。
+价格矩阵的日历只构建一次（PriceMatrix.calendar），同一份价格矩阵上的多次回测共用。
+
+用法：
+    calendar = TradingCalendar.from_dates(df.index)
+    i = calendar.ordinal['2024-01-05']
+    calendar.date_strs[i], calendar.weekday[i]
+    window = calendar.between('2024-01-01', '2024-06-30')
+"""
+
+import re
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# numpy 批量转换只用于严格的 'YYYY-MM-DD'：它也接受 '2023-01'、'NaT' 这类字符串
+DATE_KEY = re.compile(r'\d{4}-\d{2}-\d{2}')
+
+
+def parse_date_keys(keys):
+    """
+    把 'YYYY-MM-DD' 字符串批量转换为 datetime64[D]，无法解析的跳过
+
+    Returns:
+    --------
+    np.ndarray : datetime64[D] 数组，不含 NaT
+    """
+    keys = list(keys)
+    if all(isinstance(key, str) and DATE_KEY.fullmatch(key) for key in keys):
+        try:
+            days = np.array(keys, dtype='datetime64[D]')
+            return days[~np.isnat(days)]
+        except ValueError:
+            pass
+    days = []
+    for key in keys:
+        try:
+            days.append(np.datetime64(datetime.strptime(key, '%Y-%m-%d').date(), 'D'))
+        except (TypeError, ValueError):
+            pass
+    return np.array(days, dtype='datetime64[D]')
+
+
+class TradingCalendar:
+    """排好序的交易日，支持日期与交易日序号的 O(1) 互查"""
+
+    def __init__(self, days, date_strs=None):
+        """
+        Parameters:
+        -----------
+        days : np.ndarray
+            严格递增的交易日，datetime64[D] 或 1970-01-01 起的天数（int64）
+        date_strs : list
+            与 days 对应的 'YYYY-MM-DD' 字符串，为None时由 days 生成
+        """
+        self.days = np.asarray(days).astype('datetime64[D]').view(np.int64)
+        # 1970-01-01 是周四
+        self.weekday = ((self.days + 3) % 7).astype(np.int8)
+        if date_strs is None:
+            date_strs = np.datetime_as_string(self.days.view('datetime64[D]'), unit='D').tolist()
+        self.date_strs = date_strs
+        self._ordinal = None
+        self._dates = None
+
+    @classmethod
+    def from_dates(cls, *date_arrays):
+        """由若干组日期（DatetimeIndex / datetime64 数组，可重复、可无序）的并集创建"""
+        arrays = [np.asarray(dates).astype('datetime64[D]') for dates in date_arrays if len(dates)]
+        if not arrays:
+            return cls(np.array([], dtype='datetime64[D]'))
+        return cls(np.unique(np.concatenate(arrays)))
+
+    @classmethod
+    def from_price_data(cls, price_data, signals=None):
+        """价格数据 {code: DataFrame} 中所有交易日与信号日期的并集"""
+        arrays = [df.index.values for df in price_data.values() if df is not None and not df.empty]
+        if signals:
+            arrays.append(parse_date_keys(signals.keys()))
+        return cls.from_dates(*arrays)
+
+    def __len__(self):
+        return len(self.days)
+
+    @property
+    def ordinal(self):
+        """{'YYYY-MM-DD': 交易日序号}，首次访问时构建"""
+        if self._ordinal is None:
+            self._ordinal = {date_str: i for i, date_str in enumerate(self.date_strs)}
+        return self._ordinal
+
+    @property
+    def dates(self):
+        """交易日（pd.DatetimeIndex），首次访问时构建"""
+        if self._dates is None:
+            self._dates = pd.DatetimeIndex(self.days.view('datetime64[D]').astype('datetime64[ns]'))
+        return self._dates
+
+    def union(self, signals):
+        """
+        加入信号中不在日历里的日期；信号日期都已在日历中时直接返回自身（不重新构建）
+
+        Parameters:
+        -----------
+        signals : dict
+            {'YYYY-MM-DD': ...}
+        """
+        extra = [key for key in signals if key not in self.ordinal]
+        if not extra:
+            return self
+        days = parse_date_keys(extra)
+        if not len(days):
+            return self
+        return TradingCalendar.from_dates(self.days.view('datetime64[D]'), days)
+
+    def bounds(self, start_date=None, end_date=None):
+        """[start_date, end_date] 范围内交易日的序号区间 (lo, hi)，日期格式 'YYYY-MM-DD'"""
+        lo, hi = 0, len(self.days)
+        if start_date:
+            lo = int(np.searchsorted(self.days, np.datetime64(start_date, 'D').astype(np.int64), side='left'))
+        if end_date:
+            hi = int(np.searchsorted(self.days, np.datetime64(end_date, 'D').astype(np.int64), side='right'))
+        return lo, max(lo, hi)
+
+    def between(self, start_date=None, end_date=None):
+        """[start_date, end_date] 范围内的交易日历"""
+        lo, hi = self.bounds(start_date, end_date)
+        if (lo, hi) == (0, len(self.days)):
+            return self
+        return TradingCalendar(self.days[lo:hi], self.date_strs[lo:hi])
+
+    def ordinals(self, days):
+        """
+        每个日期在日历中的序号，不在日历中的为-1
+
+        Parameters:
+        -----------
+        days : np.ndarray
+            datetime64 数组或 1970-01-01 起的天数
+        """
+        days = np.asarray(days)
+        if days.dtype.kind == 'M':
+            days = days.astype('datetime64[D]').view(np.int64)
+        idx = np.searchsorted(self.days, days)
+        found = idx < len(self.days)
+        found[found] = self.days[idx[found]] == days[found]
+        return np.where(found, idx, -1)
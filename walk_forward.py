@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+"""
+滚动窗口（walk-forward）回测
+把历史切成依次向后滚动的 训练窗口 + 测试窗口：在每个训练窗口上对策略参数和回测参数做网格寻优，
+用选出的参数在紧随其后的测试窗口上回测，最后把各测试窗口的净值拼接成样本外净值曲线。
+
+- 每组策略参数的历史信号只在整段历史上计算一次，所有窗口共用（信号只依赖过去的数据，不会引入未来信息）；
+  不同参数组合共用相同窗口的滚动均线/最高价（LRU缓存）
+- 训练窗口上的回测在进程池中并行执行，价格矩阵放在共享内存中
+
+用法：
+    python walk_forward.py --train-days 250 --test-days 60 --output-dir logs/walk_forward
+"""
+
+import io
+import os
+import sys
+import datetime
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from backtest import ArrayBacktestEngine
+from compact_universe import CompactUniverse
+from indicator_cache import IndicatorCache
+from screener import STRATEGY_PARAMS, evaluate_panel_history, signals_from_status
+from shared_panel import SharedPricePanel
+from sweep import RESULT_METRICS, expand_grid
+
+# 滚动窗口参数
+WALK_FORWARD_PARAMS = {
+    'train_days': 250,           # 训练窗口长度（交易日）
+    'test_days': 60,             # 测试窗口长度（交易日）
+    'step_days': None,           # 窗口每次向后移动的交易日数，默认等于测试窗口长度
+    'anchored': False,           # True 时训练窗口起点固定在最早的交易日（扩展窗口）
+    'objective': 'sharpe_ratio', # 训练窗口上选择参数的指标（越大越好）
+}
+
+# 默认参数网格：策略参数（影响信号）× 回测参数（影响交易）
+WALK_FORWARD_GRID = {
+    'strategy': {
+        'high_window': [40, 60],
+        'recent_days': [10, 20],
+        'pullback_lookback': [3, 5],
+    },
+    'engine': {
+        'stop_loss_pct': [0.03, 0.04, 0.06],
+    },
+}
+
+# 子进程中的共享数据（由 _init_worker 设置）
+_worker_state = {}
+
+
+def make_windows(dates, train_days, test_days, step_days=None, anchored=False):
+    """
+    生成滚动的训练/测试窗口
+
+    Parameters:
+    -----------
+    dates : sequence
+        排好序的交易日
+    train_days, test_days : int
+        训练/测试窗口长度（交易日）
+    step_days : int
+        窗口每次移动的交易日数，默认等于 test_days（测试窗口首尾相接、不重叠）
+    anchored : bool
+        训练窗口起点是否固定在第一个交易日
+
+    Returns:
+    --------
+    list : [{'train_start', 'train_end', 'test_start', 'test_end'}]，日期格式 'YYYY-MM-DD'
+    """
+    dates = pd.DatetimeIndex(dates)
+    step_days = step_days or test_days
+    fmt = lambda i: dates[i].strftime('%Y-%m-%d')
+
+    windows = []
+    test_start = train_days
+    while test_start < len(dates):
+        train_start = 0 if anchored else test_start - train_days
+        test_end = min(test_start + test_days, len(dates)) - 1
+        windows.append({
+            'train_start': fmt(train_start),
+            'train_end': fmt(test_start - 1),
+            'test_start': fmt(test_start),
+            'test_end': fmt(test_end),
+        })
+        if test_end == len(dates) - 1:
+            break
+        test_start += step_days
+    return windows
+
+
+def build_signal_sets(panel, strategy_points, names=None, start_date=None, end_date=None, cache=None):
+    """
+    为每组策略参数在整段历史上计算一次信号
+
+    Parameters:
+    -----------
+    panel : BarPanel
+        右对齐的价格矩阵（open/high/close）
+    strategy_points : list
+        完整的策略参数字典列表
+    names : dict
+        股票名称
+    start_date, end_date : str
+        只保留该范围内的信号
+    cache : IndicatorCache
+        滚动指标缓存，默认新建一个（按 INDICATOR_CACHE_CONFIG 限制大小）
+
+    Returns:
+    --------
+    list : 与 strategy_points 对应的信号字典
+    """
+    cache = cache if cache is not None else IndicatorCache()
+    signal_sets = []
+    for params in strategy_points:
+        status, _, _ = evaluate_panel_history(panel, params, cache=cache)
+        signal_sets.append(signals_from_status(panel, status, names, start_date, end_date))
+    print(f"信号计算完成: {len(strategy_points)}组策略参数, 指标缓存命中 {cache.hits + cache.disk_hits} 次, 计算 {cache.misses} 次")
+    return signal_sets
+
+
+def _init_worker(handle, signal_sets, windows):
+    """子进程初始化：挂载共享价格面板，保存各组信号和窗口"""
+    panel = SharedPricePanel.attach(handle)
+    _worker_state['panel'] = panel
+    _worker_state['matrix'] = panel.price_matrix()
+    _worker_state['signal_sets'] = signal_sets
+    _worker_state['windows'] = windows
+
+
+def _backtest(strategy_idx, engine_params, start_date, end_date):
+    engine = ArrayBacktestEngine(**engine_params)
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = engine.run_backtest(_worker_state['signal_sets'][strategy_idx], _worker_state['matrix'],
+                                      start_date=start_date, end_date=end_date)
+    return results
+
+
+def _run_train(task):
+    """一个参数组合在所有训练窗口上的回测指标"""
+    strategy_idx, engine_params = task
+    rows = []
+    for k, window in enumerate(_worker_state['windows']):
+        results = _backtest(strategy_idx, engine_params, window['train_start'], window['train_end'])
+        row = {'window': k, 'strategy_idx': strategy_idx}
+        row.update(engine_params)
+        row.update({key: results.get(key) for key in RESULT_METRICS})
+        rows.append(row)
+    return rows
+
+
+def _run_test(task):
+    """用选出的参数在测试窗口上回测，返回指标和每日组合价值"""
+    k, strategy_idx, engine_params = task
+    window = _worker_state['windows'][k]
+    results = _backtest(strategy_idx, engine_params, window['test_start'], window['test_end'])
+    metrics = {key: results.get(key) for key in RESULT_METRICS}
+    history = results.get('portfolio_history')
+    equity = history['portfolio_value'] if history is not None else pd.Series(dtype=float)
+    return k, metrics, equity
+
+
+def stitch_equity(segments, initial_capital):
+    """
+    按收益率把各测试窗口的组合价值首尾拼接：每段都从 initial_capital 开始回测，
+    拼接时乘以前面各段的累计净值
+
+    Parameters:
+    -----------
+    segments : list
+        各测试窗口的组合价值序列（日期索引），按时间顺序
+    initial_capital : float
+        每段回测的初始资金
+
+    Returns:
+    --------
+    pd.Series : 拼接后的样本外组合价值
+    """
+    pieces = []
+    scale = 1.0
+    for equity in segments:
+        if equity.empty:
+            continue
+        pieces.append(equity * scale)
+        scale *= equity.iloc[-1] / initial_capital
+    if not pieces:
+        return pd.Series(dtype=float, name='portfolio_value')
+    return pd.concat(pieces).rename('portfolio_value')
+
+
+def equity_stats(equity, initial_capital):
+    """样本外净值的总收益率、年化收益率、最大回撤和夏普比率（口径与 BacktestEngine 相同）"""
+    if equity.empty:
+        return {}
+    total_return = (equity.iloc[-1] / initial_capital - 1) * 100
+    years = (equity.index[-1] - equity.index[0]).days / 365.25
+    annual_return = ((equity.iloc[-1] / initial_capital) ** (1 / years) - 1) * 100 if years > 0 else 0
+    cummax = equity.cummax()
+    max_drawdown = ((equity - cummax) / cummax * 100).min()
+    daily_return = equity.pct_change()
+    avg_daily_return = daily_return.mean() * 100
+    std_daily_return = daily_return.std() * 100
+    sharpe_ratio = (avg_daily_return - 3/252) / std_daily_return * np.sqrt(252) if std_daily_return > 0 else 0
+    return {
+        'total_return_pct': total_return,
+        'annual_return_pct': annual_return,
+        'max_drawdown_pct': max_drawdown,
+        'sharpe_ratio': sharpe_ratio,
+    }
+
+
+def run_walk_forward(price_data, strategy_grid=None, engine_grid=None, names=None,
+                     base_strategy=None, base_engine=None, train_days=None, test_days=None,
+                     step_days=None, anchored=None, objective=None, processes=None):
+    """
+    运行滚动窗口回测
+
+    Parameters:
+    -----------
+    price_data : dict 或 CompactUniverse
+        价格数据字典，格式：{code: pd.DataFrame}，需包含 open/high/close；
+        全市场数据可以用 CompactUniverse 传入，减少常驻内存
+    strategy_grid : dict
+        策略参数网格（STRATEGY_PARAMS 中的键），默认 WALK_FORWARD_GRID['strategy']
+    engine_grid : dict
+        回测参数网格（ArrayBacktestEngine 的构造参数），默认 WALK_FORWARD_GRID['engine']
+    names : dict
+        股票名称
+    base_strategy : dict
+        策略参数的基准值，默认 STRATEGY_PARAMS
+    base_engine : dict
+        所有组合共用的回测参数（如 initial_capital、rebalance_weekly）
+    train_days, test_days, step_days, anchored, objective :
+        覆盖 WALK_FORWARD_PARAMS 中的同名参数
+    processes : int
+        进程数，默认为CPU核数
+
+    Returns:
+    --------
+    dict : {
+        'windows': 每个窗口一行（窗口日期、选出的参数、训练指标、测试指标）,
+        'train_results': 所有窗口 × 参数组合的训练指标,
+        'equity': 拼接后的样本外组合价值,
+        'summary': 样本外净值统计
+    }
+    """
+    config = dict(WALK_FORWARD_PARAMS)
+    for key, value in (('train_days', train_days), ('test_days', test_days), ('step_days', step_days),
+                       ('anchored', anchored), ('objective', objective)):
+        if value is not None:
+            config[key] = value
+    strategy_grid = WALK_FORWARD_GRID['strategy'] if strategy_grid is None else strategy_grid
+    engine_grid = WALK_FORWARD_GRID['engine'] if engine_grid is None else engine_grid
+    base_engine = dict(base_engine or {})
+    initial_capital = base_engine.get('initial_capital', ArrayBacktestEngine().initial_capital)
+
+    unknown = set(strategy_grid) - set(STRATEGY_PARAMS)
+    if unknown:
+        raise ValueError(f"未知的策略参数: {sorted(unknown)}")
+    if config['objective'] not in RESULT_METRICS:
+        raise ValueError(f"未知的优化指标: {config['objective']}")
+
+    strategy_points = expand_grid(strategy_grid, base_strategy or STRATEGY_PARAMS)
+    engine_points = expand_grid(engine_grid, base_engine)
+
+    if isinstance(price_data, CompactUniverse):
+        panel = SharedPricePanel.from_compact(price_data, fields=('open', 'high', 'close'))
+    else:
+        panel = SharedPricePanel.create(price_data, fields=('open', 'high', 'close'))
+    try:
+        windows = make_windows(panel.dates, config['train_days'], config['test_days'],
+                               config['step_days'], config['anchored'])
+        if not windows:
+            raise ValueError(f"交易日不足: 共{len(panel.dates)}天，训练窗口需要{config['train_days']}天")
+        print(f"滚动窗口回测: {len(windows)}个窗口, {len(strategy_points)}组策略参数 × "
+              f"{len(engine_points)}组回测参数, {len(panel.codes)}只股票")
+
+        signal_sets = build_signal_sets(panel.bar_panel(), strategy_points, names,
+                                        windows[0]['train_start'], windows[-1]['test_end'])
+
+        # 同一组策略参数的任务相邻，便于按块分给同一进程
+        tasks = [(i, engine_params) for i in range(len(strategy_points)) for engine_params in engine_points]
+        processes = processes or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker,
+                                 initargs=(panel.handle, signal_sets, windows)) as executor:
+            train_rows = []
+            chunksize = max(1, len(tasks) // (processes * 4))
+            for i, rows in enumerate(executor.map(_run_train, tasks, chunksize=chunksize), 1):
+                train_rows.extend(rows)
+                if i % 20 == 0 or i == len(tasks):
+                    print(f"训练进度: {i}/{len(tasks)}")
+            train_df = pd.DataFrame(train_rows)
+
+            # 每个训练窗口上目标指标最大的组合（相同时取先出现的）
+            best = {}
+            for row in train_rows:
+                value = row[config['objective']]
+                value = -np.inf if value is None or pd.isna(value) else value
+                if row['window'] not in best or value > best[row['window']][0]:
+                    best[row['window']] = (value, row)
+
+            test_tasks = []
+            for k in range(len(windows)):
+                row = best[k][1]
+                engine_params = {key: row[key] for key in engine_points[0]}
+                test_tasks.append((k, row['strategy_idx'], engine_params))
+            test_results = sorted(executor.map(_run_test, test_tasks), key=lambda item: item[0])
+    finally:
+        panel.close()
+        panel.unlink()
+
+    window_rows = []
+    for (k, metrics, _), (_, strategy_idx, engine_params) in zip(test_results, test_tasks):
+        row = dict(windows[k], window=k)
+        row.update({key: strategy_points[strategy_idx][key] for key in strategy_grid})
+        row.update(engine_params)
+        row[f"train_{config['objective']}"] = best[k][1][config['objective']]
+        row.update({f"test_{key}": value for key, value in metrics.items()})
+        window_rows.append(row)
+
+    equity = stitch_equity([equity for _, _, equity in test_results], initial_capital)
+    summary = equity_stats(equity, initial_capital)
+    summary.update({'windows': len(windows), 'objective': config['objective']})
+
+    return {
+        'windows': pd.DataFrame(window_rows),
+        'train_results': train_df,
+        'equity': equity,
+        'summary': summary,
+    }
+
+
+def load_store_price_data(store=None, start_date=None):
+    """读取本地数据仓库中的全部股票（代码去掉市场前缀）"""
+    from data_store import STOCK_STORE
+    store = store or STOCK_STORE
+    price_data = {}
+    if not os.path.isdir(store.root):
+        return price_data
+    for symbol in sorted(os.listdir(store.root)):
+        if symbol.startswith('.'):
+            continue
+        df = store.load(symbol, start_date)
+        if df is not None and {'open', 'high', 'close'} <= set(df.columns):
+            price_data[symbol[2:]] = df
+    return price_data
+
+
+def parse_args(argv=None):
+    """命令行参数"""
+    import argparse
+    parser = argparse.ArgumentParser(description='滚动窗口（walk-forward）回测，数据取自本地数据仓库')
+    parser.add_argument('--train-days', type=int, default=WALK_FORWARD_PARAMS['train_days'], help='训练窗口交易日数')
+    parser.add_argument('--test-days', type=int, default=WALK_FORWARD_PARAMS['test_days'], help='测试窗口交易日数')
+    parser.add_argument('--step-days', type=int, default=None, help='窗口移动的交易日数，默认等于测试窗口')
+    parser.add_argument('--anchored', action='store_true', help='训练窗口起点固定（扩展窗口）')
+    parser.add_argument('--objective', default=WALK_FORWARD_PARAMS['objective'], choices=RESULT_METRICS,
+                        help='训练窗口上选择参数的指标')
+    parser.add_argument('--start-date', default=None, help='数据开始日期，格式 YYYYMMDD')
+    parser.add_argument('--compact', action='store_true',
+                        help='以紧凑格式（float32价格、int32交易日序号、只保留OHLCV）读取数据，减少内存占用')
+    parser.add_argument('--processes', type=int, default=None, help='进程数，默认为CPU核数')
+    parser.add_argument('--output-dir', default='logs/walk_forward', help='结果输出目录')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """对本地数据仓库中的全部股票运行滚动窗口回测，结果写到输出目录"""
+    args = parse_args(argv)
+    if args.compact:
+        price_data = CompactUniverse.from_store(start_date=args.start_date, fields=('open', 'high', 'close'))
+        print(f"紧凑数据: {len(price_data)}只股票, {price_data.nbytes / 1024 / 1024:.1f}MB")
+    else:
+        price_data = load_store_price_data(start_date=args.start_date)
+    if not price_data:
+        print("本地数据仓库为空，请先运行 run_daily.py --universe all 下载数据")
+        return 1
+
+    result = run_walk_forward(price_data, train_days=args.train_days, test_days=args.test_days,
+                              step_days=args.step_days, anchored=args.anchored,
+                              objective=args.objective, processes=args.processes)
+
+    stamp = datetime.datetime.now().strftime('%Y%m%d')
+    os.makedirs(args.output_dir, exist_ok=True)
+    result['windows'].to_csv(os.path.join(args.output_dir, f'windows_{stamp}.csv'), index=False)
+    result['train_results'].to_csv(os.path.join(args.output_dir, f'train_{stamp}.csv'), index=False)
+    result['equity'].to_csv(os.path.join(args.output_dir, f'equity_{stamp}.csv'))
+
+    print("\n" + "=" * 60)
+    print("样本外结果（各测试窗口拼接）")
+    print("=" * 60)
+    print(result['windows'].to_string(index=False))
+    for key, value in result['summary'].items():
+        print(f"{key}: {value:.2f}" if isinstance(value, float) else f"{key}: {value}")
+    print(f"结果已保存到 {args.output_dir}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())